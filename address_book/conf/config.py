@@ -9,15 +9,90 @@ load_dotenv()
 
 class Settings(BaseSettings):
     SQLALCHEMY_DATABASE_URL: str
+    # Use AsyncSession with asyncpg/aiosqlite instead of the blocking Session
+    DB_ASYNC: bool = False
+    # Optional explicit async url, derived from SQLALCHEMY_DATABASE_URL when empty
+    SQLALCHEMY_ASYNC_DATABASE_URL: str | None = None
+    # Connection pool of the sync and the async engine
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: float = 30
+    DB_POOL_PRE_PING: bool = True
+    DB_POOL_RECYCLE: int = 1800
+    # Slow query log: seconds from which a statement is logged (disabled when empty), entries kept for
+    # /api/internal/slow_queries, and whether the plan of slow statements is captured with EXPLAIN
+    SLOW_QUERY_THRESHOLD: float | None = 0.2
+    SLOW_QUERY_LOG_SIZE: int = 100
+    SLOW_QUERY_EXPLAIN: bool = True
     SECRET_KEY: str
     ALGORITHM: str
+    # JWT implementation ("jose" or "pyjwt") and the number of verified tokens kept until they expire
+    JWT_BACKEND: str = "jose"
+    JWT_CACHE_SIZE: int = 4096
+    # Lifetime of a refresh token and of its login session in seconds
+    REFRESH_TOKEN_TTL: int = 604800
+    # bcrypt runs on a bounded pool: "thread" or "process" workers, extra waiting jobs before answering 503
+    PASSWORD_HASH_EXECUTOR: str = "thread"
+    PASSWORD_HASH_WORKERS: int = 4
+    PASSWORD_HASH_QUEUE: int = 64
     MAIL_USERNAME: str
     MAIL_PASSWORD: str
     MAIL_FROM: str
     MAIL_PORT: int
     MAIL_SERVER: str
+    MAIL_SSL_TLS: bool = True
+    MAIL_STARTTLS: bool = False
+    # Email dispatcher: SMTP connections, messages per batch, queued messages, retries of transient failures with
+    # exponential backoff in seconds, seconds before an idle connection is closed, seconds shutdown waits for the
+    # queue to drain
+    MAIL_POOL_SIZE: int = 2
+    MAIL_BATCH_SIZE: int = 20
+    MAIL_QUEUE_SIZE: int = 1000
+    MAIL_MAX_RETRIES: int = 3
+    MAIL_RETRY_BACKOFF: float = 1.0
+    MAIL_IDLE_TIMEOUT: float = 30.0
+    MAIL_DRAIN_TIMEOUT: float = 10.0
     REDIS_HOST: str
     REDIS_PORT: int
+    # Authenticated user cache (in-process LRU + redis)
+    USER_CACHE_TTL: int = 60
+    USER_CACHE_SIZE: int = 1024
+    # Contact read cache in redis: time to live and the longest wait for another worker's load, in seconds
+    CONTACTS_CACHE_TTL: int = 300
+    CONTACTS_CACHE_LOCK_TTL: float = 5.0
+    # Bulk contact import: rows per INSERT statement, number of row errors listed in the report, longest line in
+    # characters and most lines of a CSV record (a quoted field spanning lines)
+    IMPORT_BATCH_SIZE: int = 1000
+    IMPORT_MAX_ERRORS: int = 1000
+    IMPORT_MAX_LINE_LENGTH: int = 64 * 1024
+    IMPORT_MAX_RECORD_LINES: int = 100
+    # Contact export: rows fetched from the server-side cursor per chunk
+    EXPORT_BATCH_SIZE: int = 1000
+    # Rate limits as "<times>/<seconds>" token buckets: per authenticated user, per IP address of anonymous clients,
+    # and per client on routes keyed by "<METHOD> <path>"; exempt path prefixes; rejecting clients over the limit
+    # of the worker's own buckets without asking redis; client IP from X-Forwarded-For (behind a trusted proxy only)
+    RATE_LIMIT_USER: str = "300/60"
+    RATE_LIMIT_IP: str = "120/60"
+    RATE_LIMIT_ROUTES: dict[str, str] = {
+        "POST /api/contacts/create": "2/5",
+        "POST /api/auth/login": "10/60",
+        "POST /api/auth/signup": "5/60",
+    }
+    RATE_LIMIT_EXEMPT: list[str] = ["/docs", "/redoc", "/openapi.json", "/metrics"]
+    RATE_LIMIT_LOCAL_PRECHECK: bool = True
+    RATE_LIMIT_TRUST_FORWARDED: bool = False
+    # Required X-Internal-Key header value for /api/internal routes and /metrics, which are disabled when empty
+    INTERNAL_API_KEY: str | None = None
+    # Avatars: "cloudinary" or "local" storage, directory and url path of local files, size in pixels, JPEG
+    # quality, largest upload in bytes, image processing threads and extra waiting jobs before answering 503
+    AVATAR_STORAGE: str = "cloudinary"
+    AVATAR_LOCAL_DIR: str = "media/avatars"
+    AVATAR_URL_PREFIX: str = "/media/avatars"
+    AVATAR_SIZE: int = 250
+    AVATAR_QUALITY: int = 85
+    AVATAR_MAX_BYTES: int = 5 * 1024 * 1024
+    AVATAR_WORKERS: int = 2
+    AVATAR_QUEUE: int = 16
     CLOUDINARY_NAME: str
     CLOUDINARY_API_KEY: str
     CLOUDINARY_API_SECRET: str
@@ -1,26 +1,53 @@
-from sqlalchemy import Column, Integer, String, func, UniqueConstraint, Boolean
-from sqlalchemy.sql.sqltypes import DateTime
+from datetime import date
+from sqlalchemy import Column, Integer, SmallInteger, String, func, UniqueConstraint, Boolean, Index
+from sqlalchemy.sql.sqltypes import Date, DateTime
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.sql.schema import ForeignKey
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, validates
 
 Base = declarative_base()
 
 
+def birthday_key(birthday: date | None) -> int | None:
+    """
+        Day of the year of a birthday encoded as month * 100 + day, e.g. 317 for March 17.
+
+        :param birthday: The birthday
+        :type birthday: date | None
+
+        :return: The month/day key or None
+        :rtype: int | None
+    """
+    if birthday is None:
+        return None
+    return birthday.month * 100 + birthday.day
+
+
 class Contact(Base):
     __tablename__ = "contacts"
     __table_args__ = (
         UniqueConstraint('first_name', 'last_name', 'user_id', name='unique_contact_user'),
+        Index('ix_contacts_user_id_id', 'user_id', 'id'),
+        Index('ix_contacts_user_id_birthday_md', 'user_id', 'birthday_md'),
     )
     id = Column(Integer, primary_key=True)
     first_name = Column(String)
     last_name = Column(String)
     email = Column(String)
     phone = Column(String(10))
-    birthday = Column(String)
+    birthday = Column(Date)
+    # month * 100 + day of birthday, maintained by set_birthday, see birthday_key
+    birthday_md = Column(SmallInteger)
     user_id = Column('user_id', ForeignKey('users.id', ondelete='CASCADE'), default=None)
     user = relationship('User', backref="notes")
 
+    @validates('birthday')
+    def set_birthday(self, key, value):
+        if isinstance(value, str):
+            value = date.fromisoformat(value)
+        self.birthday_md = birthday_key(value)
+        return value
+
     def __iter__(self):
         yield self
 
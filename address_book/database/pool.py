@@ -0,0 +1,64 @@
+import time
+
+from sqlalchemy import exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool, Pool, QueuePool
+
+from address_book.services.metrics import Histogram
+
+CHECKOUT_WAIT_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0)
+
+
+class _InstrumentedPoolMixin:
+    """
+        Records how long every connection checkout waited for the pool and how many checkouts timed out.
+
+        Attributes:
+        - checkout_wait: Histogram of checkout wait time in seconds
+        - timeouts: Number of checkouts that failed with "QueuePool limit ... reached"
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkout_wait = Histogram(CHECKOUT_WAIT_BUCKETS)
+        self.timeouts = 0
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            self.timeouts += 1
+            raise
+        finally:
+            self.checkout_wait.observe(time.perf_counter() - started)
+
+
+class InstrumentedQueuePool(_InstrumentedPoolMixin, QueuePool):
+    """
+        QueuePool of the sync engine with checkout wait time instrumentation.
+    """
+
+
+class InstrumentedAsyncAdaptedQueuePool(_InstrumentedPoolMixin, AsyncAdaptedQueuePool):
+    """
+        AsyncAdaptedQueuePool of the async engine with checkout wait time instrumentation.
+    """
+
+
+def pool_stats(pool: Pool) -> dict:
+    """
+        Get a snapshot of a connection pool.
+
+        :param pool: The engine's pool
+        :type pool: Pool
+
+        :return: The dictionary of pool size, checked out and overflow connections, timeouts and checkout wait times
+        :rtype: dict
+    """
+    stats = {"class": type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        stats.update(size=pool.size(), checked_in=pool.checkedin(), checked_out=pool.checkedout(),
+                     overflow=max(pool.overflow(), 0), max_overflow=pool._max_overflow, timeout=pool.timeout())
+    if isinstance(pool, _InstrumentedPoolMixin):
+        stats.update(timeouts=pool.timeouts, checkout_wait_seconds=pool.checkout_wait.snapshot())
+    return stats
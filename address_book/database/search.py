@@ -0,0 +1,109 @@
+from sqlalchemy import DDL, Float, case, cast, event, func, literal, literal_column, or_, text
+from sqlalchemy.orm import Query, Session
+
+from address_book.database.models import Contact
+
+# Trigram indexes can only serve queries of at least three characters
+MIN_INDEXED_QUERY = 3
+
+# Postgres: one trigram GIN index over the lowercased searchable text of a contact
+PG_SEARCH_TEXT_SQL = ("lower(coalesce(first_name, '') || ' ' || coalesce(last_name, '') || ' ' || "
+                      "coalesce(email, ''))")
+PG_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    f"CREATE INDEX IF NOT EXISTS ix_contacts_search_trgm ON contacts USING gin (({PG_SEARCH_TEXT_SQL}) gin_trgm_ops)",
+]
+PG_DROP_DDL = ["DROP INDEX IF EXISTS ix_contacts_search_trgm"]
+
+# SQLite: an external content FTS5 table with the trigram tokenizer, kept in sync by triggers
+SQLITE_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS contacts_fts USING fts5(first_name, last_name, email, content='contacts', "
+    "content_rowid='id', tokenize='trigram case_sensitive 0')",
+    "CREATE TRIGGER IF NOT EXISTS contacts_fts_ai AFTER INSERT ON contacts BEGIN "
+    "INSERT INTO contacts_fts(rowid, first_name, last_name, email) "
+    "VALUES (new.id, new.first_name, new.last_name, new.email); END",
+    "CREATE TRIGGER IF NOT EXISTS contacts_fts_ad AFTER DELETE ON contacts BEGIN "
+    "INSERT INTO contacts_fts(contacts_fts, rowid, first_name, last_name, email) "
+    "VALUES ('delete', old.id, old.first_name, old.last_name, old.email); END",
+    "CREATE TRIGGER IF NOT EXISTS contacts_fts_au AFTER UPDATE ON contacts BEGIN "
+    "INSERT INTO contacts_fts(contacts_fts, rowid, first_name, last_name, email) "
+    "VALUES ('delete', old.id, old.first_name, old.last_name, old.email); "
+    "INSERT INTO contacts_fts(rowid, first_name, last_name, email) "
+    "VALUES (new.id, new.first_name, new.last_name, new.email); END",
+    "INSERT INTO contacts_fts(contacts_fts) VALUES ('rebuild')",
+]
+SQLITE_DROP_DDL = ["DROP TABLE IF EXISTS contacts_fts"]
+
+for statement in PG_DDL:
+    event.listen(Contact.__table__, "after_create", DDL(statement).execute_if(dialect="postgresql"))
+for statement in SQLITE_DDL:
+    event.listen(Contact.__table__, "after_create", DDL(statement).execute_if(dialect="sqlite"))
+for statement in SQLITE_DROP_DDL:
+    event.listen(Contact.__table__, "after_drop", DDL(statement).execute_if(dialect="sqlite"))
+
+
+def _escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _fts_phrase(value: str) -> str:
+    return '"' + value.replace('"', '""') + '"'
+
+
+def _match_tier(needle: str):
+    # 3: a name is the query, 2: a name or the email starts with it, 1: it is found inside
+    names = (func.lower(Contact.first_name), func.lower(Contact.last_name))
+    prefix = f'{_escape_like(needle)}%'
+    return case((or_(*(name == needle for name in names)), 3.0),
+                (or_(*(column.like(prefix, escape='\\') for column in (*names, func.lower(Contact.email)))), 2.0),
+                else_=1.0)
+
+
+def search_query(session: Session, user_id: int, query: str, *entities) -> tuple[Query, object | None]:
+    """
+        Build a query of (Contact, search_rank) rows of one user that match the search text case-insensitively in
+        first_name, last_name or email. Higher rank means a more relevant match.
+
+        Postgres uses the pg_trgm GIN index and word_similarity, SQLite finds matches in the contacts_fts FTS5 table
+        and ranks them by match tier (exact name, prefix, substring), short queries and other databases fall back to
+        a LIKE scan of the user's contacts with a constant rank of 0, in that case the returned rank expression is
+        None and results should be ordered by id only. The rank of a row depends only on the row and the query, so
+        (rank, id) is a stable keyset between page requests.
+
+        :param session: The database session.
+        :type session: Session
+        :param user_id: Owner of the contacts
+        :type user_id: int
+        :param query: search query text
+        :type query: str
+        :param entities: Contact columns to select instead of the Contact entity
+
+        :return: The query and the rank column expression
+        :rtype: tuple[Query, object | None]
+    """
+    dialect = getattr(session.get_bind().dialect, "name", None)
+    entities = entities or (Contact,)
+    needle = query.lower()
+    if len(needle) >= MIN_INDEXED_QUERY and dialect == "postgresql":
+        # Literals are inlined so the expression matches ix_contacts_search_trgm under server-side binds too
+        empty, space = literal_column("''"), literal_column("' '")
+        search_text = func.lower(func.coalesce(Contact.first_name, empty) + space
+                                 + func.coalesce(Contact.last_name, empty) + space
+                                 + func.coalesce(Contact.email, empty))
+        # word_similarity returns real, which psycopg2 reads back shortened (0.33333334), the cursor of the next
+        # page would then not equal the rank of its own row, double precision round-trips exactly
+        rank = cast(func.word_similarity(needle, search_text), Float(53))
+        return session.query(*entities, rank.label('search_rank')).filter(Contact.user_id == user_id).filter(
+            search_text.like(f'%{_escape_like(needle)}%', escape='\\')), rank
+    if len(needle) >= MIN_INDEXED_QUERY and dialect == "sqlite":
+        # Not bm25: its scores depend on the contacts of every user and shift with any write between two pages
+        matches = text("SELECT rowid AS id FROM contacts_fts WHERE contacts_fts MATCH :fts_query") \
+            .bindparams(fts_query=_fts_phrase(needle)).columns(id=Contact.id.type).subquery("matches")
+        rank = _match_tier(needle)
+        return session.query(*entities, rank.label('search_rank')).join(matches, matches.c.id == Contact.id).filter(
+            Contact.user_id == user_id), rank
+    pattern = f'%{_escape_like(needle)}%'
+    return session.query(*entities, literal(0.0).label('search_rank')).filter(Contact.user_id == user_id).filter(
+        or_(func.lower(Contact.first_name).like(pattern, escape='\\'),
+            func.lower(Contact.last_name).like(pattern, escape='\\'),
+            func.lower(Contact.email).like(pattern, escape='\\'))), None
@@ -0,0 +1,170 @@
+import logging
+import sys
+import threading
+from collections import deque
+from datetime import date, datetime, time as dt_time, timezone
+from decimal import Decimal
+
+from address_book.conf.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Statements EXPLAIN accepts on both PostgreSQL and SQLite
+EXPLAINABLE = ("select", "insert", "update", "delete", "with", "values")
+# Bound values shown as they are, everything else (strings, bytes) is replaced by its type and length
+PLAIN_TYPES = (bool, int, float, Decimal, date, datetime, dt_time, type(None))
+# Modules whose functions are reported as the caller of a query
+CALLER_MODULES = ("address_book.repository.", "address_book.services.")
+
+
+def redact(value):
+    """
+        Redact a bound parameter: numbers, dates and None are kept, text is replaced by its type and length.
+
+        :param value: The parameter value
+        :return: The value or a placeholder such as "<str len=17>"
+    """
+    if isinstance(value, PLAIN_TYPES):
+        return value if not isinstance(value, (Decimal, date, dt_time)) else str(value)
+    if isinstance(value, (list, tuple)):
+        return [redact(item) for item in value]
+    if isinstance(value, dict):
+        return {key: redact(item) for key, item in value.items()}
+    try:
+        return f"<{type(value).__name__} len={len(value)}>"
+    except TypeError:
+        return f"<{type(value).__name__}>"
+
+
+def find_caller() -> str | None:
+    """
+        Find the repository (or service) function that runs the current query by walking up the stack.
+
+        :return: The qualified name, e.g. "address_book.repository.contacts.search_contacts.<locals>._search"
+        :rtype: str | None
+    """
+    frame = sys._getframe(1)
+    while frame is not None:
+        module = frame.f_globals.get("__name__", "")
+        if module.startswith(CALLER_MODULES):
+            return f"{module}.{frame.f_code.co_qualname}"
+        frame = frame.f_back
+    return None
+
+
+def explain(conn, statement: str, parameters) -> list[str]:
+    """
+        Get the plan of a statement on the connection it ran on, without running it again.
+
+        :param conn: The SQLAlchemy connection
+        :param statement: The SQL as sent to the driver
+        :param parameters: The driver parameters of the statement
+        :return: The lines of the plan
+        :rtype: list[str]
+        :raises NotImplementedError: For dialects other than PostgreSQL and SQLite
+    """
+    dialect = conn.dialect.name
+    cursor = conn.connection.dbapi_connection.cursor()
+    try:
+        if dialect == "sqlite":
+            cursor.execute("EXPLAIN QUERY PLAN " + statement, parameters)
+            # Rows are (id, parent, notused, detail)
+            return [row[-1] for row in cursor.fetchall()]
+        if dialect == "postgresql":
+            # A failed EXPLAIN must not abort the transaction of the request
+            cursor.execute("SAVEPOINT slow_query_explain")
+            try:
+                cursor.execute("EXPLAIN " + statement, parameters)
+                plan = [row[0] for row in cursor.fetchall()]
+            except Exception:
+                cursor.execute("ROLLBACK TO SAVEPOINT slow_query_explain")
+                raise
+            cursor.execute("RELEASE SAVEPOINT slow_query_explain")
+            return plan
+        raise NotImplementedError(f"EXPLAIN is not supported for '{dialect}'")
+    finally:
+        cursor.close()
+
+
+class SlowQueryLog:
+    """
+        Ring buffer of the statements that took longer than a threshold, with their redacted parameters, the
+        function that ran them and their plan.
+
+        Attributes:
+        - threshold: Seconds from which a query is slow, None disables the log
+        - explain: Capture the plan of slow statements
+        - entries: The newest slow queries, oldest first
+    """
+
+    def __init__(self, threshold: float | None = 0.2, maxlen: int = 100, explain: bool = True):
+        self.threshold = threshold
+        self.explain = explain
+        self.entries: deque[dict] = deque(maxlen=maxlen)
+        self.recorded = 0
+        self._lock = threading.Lock()
+
+    def is_slow(self, seconds: float) -> bool:
+        return self.threshold is not None and seconds >= self.threshold
+
+    def record(self, conn, statement: str, parameters, executemany: bool, seconds: float) -> dict:
+        """
+            Store and log a slow query.
+
+            :param conn: The SQLAlchemy connection the statement ran on
+            :param statement: The SQL as sent to the driver
+            :type statement: str
+            :param parameters: The driver parameters, a sequence of them for executemany
+            :param executemany: Whether the statement ran once per parameter set
+            :type executemany: bool
+            :param seconds: The query time
+            :type seconds: float
+
+            :return: The log entry
+            :rtype: dict
+        """
+        entry = {
+            "at": datetime.now(timezone.utc).isoformat(),
+            "duration_ms": round(seconds * 1000, 3),
+            "statement": statement,
+            "parameters": redact(parameters[:1] if executemany else parameters),
+            "executemany": len(parameters) if executemany else None,
+            "caller": find_caller(),
+            "plan": None,
+            "explain_error": None,
+        }
+        if self.explain and not executemany and statement.lstrip().split(None, 1)[0].lower() in EXPLAINABLE:
+            try:
+                entry["plan"] = explain(conn, statement, parameters)
+            except Exception as err:
+                entry["explain_error"] = str(err)
+        with self._lock:
+            self.entries.append(entry)
+            self.recorded += 1
+        logger.warning("Slow query %.1f ms in %s: %s", entry["duration_ms"], entry["caller"], statement)
+        return entry
+
+    def snapshot(self, limit: int | None = None) -> list[dict]:
+        """
+            Get the logged queries, newest first.
+
+            :param limit: Return at most this many entries
+            :type limit: int | None
+
+            :return: The log entries
+            :rtype: list[dict]
+        """
+        with self._lock:
+            entries = list(reversed(self.entries))
+        return entries[:limit] if limit is not None else entries
+
+    def clear(self) -> None:
+        """
+            Remove every entry.
+        """
+        with self._lock:
+            self.entries.clear()
+
+
+slow_query_log = SlowQueryLog(threshold=settings.SLOW_QUERY_THRESHOLD, maxlen=settings.SLOW_QUERY_LOG_SIZE,
+                              explain=settings.SLOW_QUERY_EXPLAIN)
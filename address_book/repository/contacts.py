@@ -1,58 +1,188 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import or_, and_
-from typing import List, Type
-from address_book.database.models import Contact, User
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import or_, and_, case, select, insert, update, delete, literal, Row
+from sqlalchemy.exc import DataError, DBAPIError, IntegrityError
+from typing import AsyncIterator, List, Sequence, Type
+from address_book.database.db import run_sync, dialect_insert
+from address_book.database.models import Contact, User, birthday_key
+from address_book.database.search import search_query
 from address_book.schemas import ContactBase
-from datetime import datetime
+from address_book.services.cache import contacts_version
+import calendar
+from datetime import date, timedelta
+import logging
 
+logger = logging.getLogger(__name__)
 
-async def get_contacts(user: User, db: Session) -> List[Type[Contact]]:
+# Reported for a contact the database rejects, the driver message stays in the server log
+ROW_ERROR = "Duplicate or invalid contact"
+
+# Columns of ContactResponse plus the id used by cursors. Projected reads select only these and return Row tuples,
+# no Contact entities, identity map entries or relationship state are created for them.
+CONTACT_COLUMNS = (Contact.id, Contact.first_name, Contact.last_name, Contact.email, Contact.phone, Contact.birthday)
+
+
+def _page(query, limit: int | None, after_id: int | None):
+    # Keyset pagination over (user_id, id), served by the ix_contacts_user_id_id index
+    if after_id is not None:
+        query = query.filter(Contact.id > after_id)
+    if limit is not None:
+        query = query.order_by(Contact.id).limit(limit)
+    return query
+
+
+async def get_contacts(user: User, db: Session | AsyncSession, limit: int | None = None, after_id: int | None = None,
+                       projected: bool = False) -> List[Type[Contact]] | Sequence[Row]:
     """
         Retrieves a list of contacts for a specific user.
         :param user: The user to retrieve contacts for
         :type user: User
         :param db: The database session.
-        :type db: Session
-        :return: A list of contacts.
-        :rtype: List[Type[Contact]]
+        :type db: Session | AsyncSession
+        :param limit: Maximum number of contacts, all contacts when None
+        :type limit: int | None
+        :param after_id: Return only contacts with id greater than this one
+        :type after_id: int | None
+        :param projected: Return CONTACT_COLUMNS rows instead of Contact entities
+        :type projected: bool
+        :return: A list of contacts ordered by id when limit is given.
+        :rtype: List[Type[Contact]] | Sequence[Row]
     """
-    return db.query(Contact).filter(Contact.user_id == user.id).all()
+    if projected:
+        stmt = _page(select(*CONTACT_COLUMNS).where(Contact.user_id == user.id), limit, after_id)
+        return await run_sync(db, lambda session: session.execute(stmt).all())
+    return await run_sync(db, lambda session: _page(session.query(Contact).filter(Contact.user_id == user.id),
+                                                    limit, after_id).all())
 
 
-async def get_contact(user: User, contact_id: int, db: Session) -> Type[Contact]:
+async def stream_contacts(user: User, db: Session | AsyncSession,
+                          batch_size: int = 1000) -> AsyncIterator[Sequence[Row]]:
+    """
+        Streams all contacts of a specific user through a server-side cursor, batch by batch, without loading ORM
+        objects, so memory use does not grow with the number of contacts.
+        :param user: The user to retrieve contacts for
+        :type user: User
+        :param db: The database session.
+        :type db: Session | AsyncSession
+        :param batch_size: Rows fetched from the cursor at a time
+        :type batch_size: int
+        :return: Batches of rows with first_name, last_name, email, phone and birthday ordered by id.
+        :rtype: AsyncIterator[Sequence[Row]]
+    """
+    stmt = select(Contact.first_name, Contact.last_name, Contact.email, Contact.phone, Contact.birthday) \
+        .where(Contact.user_id == user.id).order_by(Contact.id).execution_options(yield_per=batch_size)
+    if isinstance(db, AsyncSession):
+        result = await db.stream(stmt)
+        async for partition in result.partitions():
+            yield partition
+    else:
+        for partition in db.execute(stmt).partitions():
+            yield partition
+
+
+async def get_contact(user: User, contact_id: int, db: Session | AsyncSession,
+                      projected: bool = False) -> Type[Contact] | Row | None:
     """
         Retrieves first contact for a specific user.
         :param user: The user to retrieve contact for
         :type user: User
         :param db: The database session.
-        :type db: Session
+        :type db: Session | AsyncSession
+        :param projected: Return a CONTACT_COLUMNS row instead of the Contact entity
+        :type projected: bool
         :return: A list of contacts.
-        :rtype: Type[Contact]
+        :rtype: Type[Contact] | Row | None
     """
-    return db.query(Contact).filter(and_(Contact.id == contact_id, Contact.user_id == user.id)).first()
+    if projected:
+        stmt = select(*CONTACT_COLUMNS).where(Contact.id == contact_id, Contact.user_id == user.id)
+        return await run_sync(db, lambda session: session.execute(stmt).first())
+    return await run_sync(db, lambda session: session.query(Contact).filter(
+        and_(Contact.id == contact_id, Contact.user_id == user.id)).first())
 
 
-async def create_contact(user: User, body: ContactBase, db: Session):
+async def create_contact(user: User, body: ContactBase, db: Session | AsyncSession) -> Contact:
     """
-        Creates a new contact in database for a specific user
+        Creates a new contact in database for a specific user with one INSERT ... RETURNING statement
         :param user: The user to create contact for
         :type user: User
         :param body: body of the contact
         :type body: ContactBase
         :param db: The database session.
-        :type db: Session
+        :type db: Session | AsyncSession
+
+        :return: The created contact
+        :rtype: Contact
     """
-    contact = Contact(first_name=body.first_name, last_name=body.last_name, email=body.email, phone=body.phone,
-                      birthday=body.birthday, user_id=user.id)
-    db.add(contact)
-    db.commit()
-    db.refresh(contact)
+    stmt = insert(Contact).values(first_name=body.first_name, last_name=body.last_name, email=body.email,
+                                  phone=body.phone, birthday=body.birthday, birthday_md=birthday_key(body.birthday),
+                                  user_id=user.id).returning(Contact)
+
+    def _create(session: Session):
+        contact = session.execute(stmt).scalar_one()
+        session.commit()
+        return contact
+
+    contact = await run_sync(db, _create)
+    await contacts_version.bump(user.id)
     return contact
 
 
-async def update_contact(user: User, contact_id: int, body: ContactBase, db: Session) -> Contact | None:
+async def insert_contacts(user: User, bodies: List[ContactBase], db: Session | AsyncSession) -> List[str | None]:
     """
-        Updates contact in database for a specific user
+        Inserts a batch of contacts for a specific user with one INSERT ... ON CONFLICT DO NOTHING statement.
+        Contacts that already exist (unique_contact_user) are skipped. If the batch fails as a whole, e.g. on a value
+        the column does not accept, every contact is retried on its own to report the failing ones as ROW_ERROR.
+        :param user: The user to create contacts for
+        :type user: User
+        :param bodies: Bodies of the contacts
+        :type bodies: List[ContactBase]
+        :param db: The database session.
+        :type db: Session | AsyncSession
+
+        :return: For every body None if it was inserted, otherwise the reason it was not
+        :rtype: List[str | None]
+    """
+    rows = [dict(body.model_dump(), birthday_md=birthday_key(body.birthday), user_id=user.id) for body in bodies]
+
+    def _insert(session: Session, batch: List[dict]) -> List[str | None]:
+        stmt = dialect_insert(session, Contact).on_conflict_do_nothing(
+            index_elements=['first_name', 'last_name', 'user_id']).returning(Contact.first_name, Contact.last_name)
+        inserted = {tuple(row) for row in session.execute(stmt, batch)}
+        session.commit()
+        result = []
+        for row in batch:
+            key = (row['first_name'], row['last_name'])
+            result.append(None if key in inserted else 'Contact already exists')
+            inserted.discard(key)
+        return result
+
+    def _insert_batch(session: Session) -> List[str | None]:
+        try:
+            return _insert(session, rows)
+        except DBAPIError:
+            session.rollback()
+        result = []
+        for row in rows:
+            try:
+                result.extend(_insert(session, [row]))
+            except (IntegrityError, DataError) as err:
+                session.rollback()
+                logger.warning("Contact import row rejected: %s", str(err.orig).strip())
+                result.append(ROW_ERROR)
+            except DBAPIError:
+                session.rollback()
+                raise
+        return result
+
+    result = await run_sync(db, _insert_batch)
+    if None in result:
+        await contacts_version.bump(user.id)
+    return result
+
+
+async def update_contact(user: User, contact_id: int, body: ContactBase, db: Session | AsyncSession) -> Contact | None:
+    """
+        Updates contact in database for a specific user with one UPDATE ... RETURNING statement
         :param user: The user to update contact for
         :type user: User
         :param contact_id: Contact's id from the database
@@ -60,100 +190,221 @@ async def update_contact(user: User, contact_id: int, body: ContactBase, db: Ses
         :param body: body of the contact
         :type body: ContactBase
         :param db: The database session.
-        :type db: Session
+        :type db: Session | AsyncSession
 
         :return: Contact's object if found
         :rtype: Contact | None
     """
-    contact = db.query(Contact).filter(and_(Contact.id == contact_id, Contact.user_id == user.id)).first()
-    if contact:
-        contact.first_name = body.first_name
-        contact.last_name = body.last_name
-        contact.email = body.email
-        contact.phone = body.phone
-        contact.birthday = body.birthday
-        contact.user_id = user.id
-        db.commit()
+    stmt = update(Contact).where(Contact.id == contact_id, Contact.user_id == user.id).values(
+        first_name=body.first_name, last_name=body.last_name, email=body.email, phone=body.phone,
+        birthday=body.birthday, birthday_md=birthday_key(body.birthday)).returning(Contact)
+
+    def _update(session: Session):
+        contact = session.execute(stmt).scalar_one_or_none()
+        session.commit()
         return contact
 
+    contact = await run_sync(db, _update)
+    if contact:
+        await contacts_version.bump(user.id)
+    return contact
+
 
-async def remove_contact(user: User, contact_id: int, db: Session) -> Type[Contact] | None:
+async def remove_contact(user: User, contact_id: int, db: Session | AsyncSession) -> Contact | None:
     """
-        Removes contact in database for a specific user
+        Removes contact in database for a specific user with one DELETE ... RETURNING statement
         :param user: The user to remove contact for
         :type user: User
         :param contact_id: Contact's id from the database
         :type contact_id: int
         :param db: The database session.
-        :type db: Session
+        :type db: Session | AsyncSession
 
         :return: Contact's object if deleted
-        :rtype: Type[Contact] | None
+        :rtype: Contact | None
     """
-    contact = db.query(Contact).filter(and_(Contact.id == contact_id, Contact.user_id == user.id)).first()
-    if contact:
-        db.delete(contact)
-        db.commit()
+    stmt = delete(Contact).where(Contact.id == contact_id, Contact.user_id == user.id).returning(Contact)
+
+    def _remove(session: Session):
+        contact = session.execute(stmt).scalar_one_or_none()
+        session.commit()
         return contact
 
+    contact = await run_sync(db, _remove)
+    if contact:
+        await contacts_version.bump(user.id)
+    return contact
+
+
+async def update_contacts(user: User, changes: dict[int, dict], db: Session | AsyncSession) -> List[int]:
+    """
+        Updates many contacts of a specific user with one set-based UPDATE ... WHERE id IN (...) AND user_id = :uid
+        statement. Every contact gets its own values through CASE id WHEN ... expressions, columns that are not
+        changed for a contact keep their value.
+        :param user: The user to update contacts for
+        :type user: User
+        :param changes: Changed fields by contact id, e.g. {1: {"phone": "0957800062"}}
+        :type changes: dict[int, dict]
+        :param db: The database session.
+        :type db: Session | AsyncSession
 
-async def search_contacts(user: User, query: str, db: Session) -> List[Type[Contact]]:
+        :return: Ids of the updated contacts, ids of other users' or missing contacts are left out
+        :rtype: List[int]
+        :raises IntegrityError: If a change collides with another contact of the user, nothing is updated then
+    """
+    changes = {contact_id: dict(fields) for contact_id, fields in changes.items()}
+    for fields in changes.values():
+        if fields.get("birthday") is not None:
+            fields["birthday_md"] = birthday_key(fields["birthday"])
+    values = {}
+    for column in ("first_name", "last_name", "email", "phone", "birthday", "birthday_md"):
+        attribute = getattr(Contact, column)
+        whens = {contact_id: literal(fields[column], attribute.type)
+                 for contact_id, fields in changes.items() if fields.get(column) is not None}
+        if whens:
+            values[column] = case(whens, value=Contact.id, else_=attribute)
+    where = and_(Contact.user_id == user.id, Contact.id.in_(list(changes)))
+
+    def _update(session: Session) -> List[int]:
+        try:
+            if session.get_bind().dialect.update_returning:
+                ids = session.execute(update(Contact).where(where).values(values).returning(Contact.id)
+                                      .execution_options(synchronize_session=False)).scalars().all()
+            else:
+                ids = session.execute(select(Contact.id).where(where)).scalars().all()
+                session.execute(update(Contact).where(where).values(values)
+                                .execution_options(synchronize_session=False))
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        return sorted(ids)
+
+    ids = await run_sync(db, _update)
+    if ids:
+        await contacts_version.bump(user.id)
+    return ids
+
+
+async def remove_contacts(user: User, contact_ids: List[int], db: Session | AsyncSession) -> List[int]:
+    """
+        Removes many contacts of a specific user with one DELETE ... WHERE id IN (...) AND user_id = :uid statement.
+        :param user: The user to remove contacts for
+        :type user: User
+        :param contact_ids: Ids of the contacts
+        :type contact_ids: List[int]
+        :param db: The database session.
+        :type db: Session | AsyncSession
+
+        :return: Ids of the deleted contacts, ids of other users' or missing contacts are left out
+        :rtype: List[int]
+    """
+    where = and_(Contact.user_id == user.id, Contact.id.in_(list(contact_ids)))
+
+    def _remove(session: Session) -> List[int]:
+        try:
+            if session.get_bind().dialect.delete_returning:
+                ids = session.execute(delete(Contact).where(where).returning(Contact.id)
+                                      .execution_options(synchronize_session=False)).scalars().all()
+            else:
+                ids = session.execute(select(Contact.id).where(where)).scalars().all()
+                session.execute(delete(Contact).where(where).execution_options(synchronize_session=False))
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        return sorted(ids)
+
+    ids = await run_sync(db, _remove)
+    if ids:
+        await contacts_version.bump(user.id)
+    return ids
+
+
+async def search_contacts(user: User, query: str, db: Session | AsyncSession, limit: int | None = None,
+                          after: tuple[float, int] | None = None,
+                          projected: bool = False) -> List[Type[Contact]] | Sequence[Row] | None:
     """
         Retrieves a list of contacts for a specific user by search query. Function searches contacts only by Contact.first_name, Contact.last_name and Contact.email
+        case-insensitively through the search index, best matches first. Every returned contact gets its relevance in
+        the search_rank attribute.
         :param user: The user to retrieve contacts for
         :type user: User
         :param query: search query text
         :type query: str
         :param db: The database session.
-        :type db: Session
+        :type db: Session | AsyncSession
+        :param limit: Maximum number of contacts, all matches when None
+        :type limit: int | None
+        :param after: (search_rank, id) of the last contact of the previous page
+        :type after: tuple[float, int] | None
+        :param projected: Return CONTACT_COLUMNS rows with a search_rank column instead of Contact entities
+        :type projected: bool
 
         :return: A list of contacts.
-        :rtype: List[Type[Contact]]
+        :rtype: List[Type[Contact]] | Sequence[Row] | None
     """
-    result = db.query(Contact).filter(Contact.user_id == user.id).filter(or_(Contact.first_name.like(f'%{query}%'),
-                                        Contact.last_name.like(f'%{query}%'), Contact.email.like(f'%{query}%'))).all()
+
+    def _search(session: Session):
+        matches, rank = search_query(session, user.id, query, *(CONTACT_COLUMNS if projected else ()))
+        if rank is None:
+            if after is not None:
+                matches = matches.filter(Contact.id > after[1])
+            matches = matches.order_by(Contact.id)
+        else:
+            if after is not None:
+                matches = matches.filter(or_(rank < after[0], and_(rank == after[0], Contact.id > after[1])))
+            matches = matches.order_by(rank.desc(), Contact.id)
+        if limit is not None:
+            matches = matches.limit(limit)
+        if projected:
+            return matches.all()
+        contacts = []
+        for contact, search_rank in matches.all():
+            contact.search_rank = search_rank
+            contacts.append(contact)
+        return contacts
+
+    result = await run_sync(db, _search)
     if result:
         return result
 
 
-async def get_birthdays(user: User, db: Session) -> List[Type[Contact]]:
+def _birthday_window(today: date, days: int) -> tuple[int, int] | None:
+    # birthday_md keys of the first and the last day of the window, a Feb 29 birthday falls on Feb 28 in common years
+    if days >= 366:
+        return None
+    last_day = today + timedelta(days=days - 1)
+    start, end = birthday_key(today), birthday_key(last_day)
+    if end == 228 and not calendar.isleap(last_day.year):
+        end = 229
+    return start, end
+
+
+async def get_birthdays(user: User, db: Session | AsyncSession, days: int = 7) -> List[Type[Contact]]:
     """
-        Retrieves a list of contacts for a specific user that have birthday coming up in the next 7 days
+        Retrieves a list of contacts for a specific user that have birthday coming up in the next days, today included,
+        ordered by the upcoming birthday. The window wraps over the new year.
         :param user: The user to retrieve contacts for
         :type user: User
         :param db: The database session.
-        :type db: Session
+        :type db: Session | AsyncSession
+        :param days: Length of the window in days (default is 7)
+        :type days: int
 
         :return: A list of contacts.
         :rtype: List[Type[Contact]]
     """
-    contacts = db.query(Contact).filter(Contact.user_id == user.id).all()
-
-    response = []
-    # for contact in contacts:
-    #     print(contact.first_name, contact.last_name, contact.email, contact.phone, contact.birthday)
-
-    if contacts:
-        for contact in contacts:
-
-            today = datetime.today()
-            current_year = today.year
-            next_year = current_year + 1
-
-            contact_birthday = datetime.strptime(contact.birthday, "%Y-%m-%d")
-
-            # substitute bday year to the current one to make possible to define if bday is ahead or in the past
-            if (today.month == 12 and today.day in [26, 27, 28, 29, 30, 31]) and (
-                    contact_birthday.month == 1 and contact_birthday.day in [1, 2, 3, 4, 5, 6]):
-                bday = contact_birthday.replace(year=next_year)
-            else:
-                bday = contact_birthday.replace(year=current_year)
-
-            # Calculate days before of after today to the bday. Positive means that bday is ahead. Negative - in the past
-            delta = (bday - today).days
-
-            # If delta is in range 0-6, then we have to add it to the final list
-            if 0 <= delta <= 6:
-                response.append(contact)
+    today = date.today()
+    window = _birthday_window(today, days)
+    start = birthday_key(today)
+    if window is None:
+        in_window = Contact.birthday_md.isnot(None)
+    elif window[0] <= window[1]:
+        in_window = Contact.birthday_md.between(*window)
+    else:
+        in_window = or_(Contact.birthday_md >= window[0], Contact.birthday_md <= window[1])
 
-        return response
\ No newline at end of file
+    return await run_sync(db, lambda session: session.query(Contact).filter(Contact.user_id == user.id)
+                          .filter(in_window)
+                          .order_by(case((Contact.birthday_md >= start, 0), else_=1), Contact.birthday_md).all())
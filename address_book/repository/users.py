@@ -1,49 +1,74 @@
-from libgravatar import Gravatar
+from sqlalchemy import exists, insert, select, update
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Type
 
+from address_book.database.db import run_sync, dialect_insert
 from address_book.database.models import User
 from address_book.schemas import UserModel
+from address_book.services.cache import user_cache
 
 
-async def get_user_by_email(email: str, db: Session) -> Type[User]:
+async def get_user_by_email(email: str, db: Session | AsyncSession) -> Type[User]:
     """
         Retrieves first user by email.
         :param email: The email to retrieve user for
         :type email: str
         :param db: The database session.
-        :type db: Session
+        :type db: Session | AsyncSession
         :return: User object.
         :rtype: Type[User]
     """
-    return db.query(User).filter(User.email == email).first()
+    return await run_sync(db, lambda session: session.query(User).filter(User.email == email).first())
 
 
-async def create_user(body: UserModel, db: Session) -> User:
+async def user_exists(email: str, db: Session | AsyncSession) -> bool:
     """
-        Creates a new user in database
+        Checks if a user with the email exists without loading the row.
+        :param email: The email to check
+        :type email: str
+        :param db: The database session.
+        :type db: Session | AsyncSession
+        :return: True if the email is taken.
+        :rtype: bool
+    """
+    stmt = select(exists().where(User.email == email))
+    return await run_sync(db, lambda session: bool(session.execute(stmt).scalar()))
+
+
+async def create_user(body: UserModel, db: Session | AsyncSession) -> User | None:
+    """
+        Creates a new user in database with one INSERT ... ON CONFLICT (email) DO NOTHING RETURNING statement. The
+        avatar stays empty, UserDb derives the Gravatar url on read
         :param body: User's object
         :type body: UserModel
         :param db: The database session.
-        :type db: Session
+        :type db: Session | AsyncSession
 
-        :return: User's object.
-        :rtype: User
+        :return: User's object, or None if the email is already registered.
+        :rtype: User | None
     """
-    avatar = None
-    try:
-        g = Gravatar(body.email)
-        avatar = g.get_image()
-    except Exception as e:
-        print(e)
-    new_user = User(**body.model_dump(), avatar=avatar)
-    db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
-    return new_user
-
-
-async def update_token(user: User, token: str | None, db: Session) -> None:
+    def _create(session: Session):
+        try:
+            stmt = dialect_insert(session, User).on_conflict_do_nothing(index_elements=[User.email])
+        except NotImplementedError:
+            # Without ON CONFLICT the unique constraint still rejects the duplicate
+            stmt = insert(User)
+        stmt = stmt.values(**body.model_dump()).returning(User)
+        try:
+            new_user = session.execute(stmt).scalar_one_or_none()
+            session.commit()
+        except IntegrityError:
+            session.rollback()
+            return None
+        return new_user
+
+    return await run_sync(db, _create)
+
+
+async def update_token(user: User, token: str | None, db: Session | AsyncSession) -> None:
     """
         Updates user's authorization token in database
         :param user: User's object
@@ -51,26 +76,40 @@ async def update_token(user: User, token: str | None, db: Session) -> None:
         :param token: Token string
         :type token: str | None
         :param db: The database session.
-        :type db: Session
+        :type db: Session | AsyncSession
     """
-    user.refresh_token = token
-    db.commit()
+    stmt = update(User).where(User.id == user.id).values(refresh_token=token) \
+        .execution_options(synchronize_session=False)
+
+    def _update(session: Session):
+        session.execute(stmt)
+        session.commit()
+
+    await run_sync(db, _update)
+    # The user may be detached (e.g. from the user cache), keep it in line with the row without marking it dirty
+    set_committed_value(user, "refresh_token", token)
+    await user_cache.invalidate(user.email)
 
 
-async def confirmed_email(email: str, db: Session) -> None:
+async def confirmed_email(email: str, db: Session | AsyncSession) -> None:
     """
         Confirmes user's email in database
         :param email: email string
         :type email: str
         :param db: The database session.
-        :type db: Session
+        :type db: Session | AsyncSession
     """
-    user = await get_user_by_email(email, db)
-    user.confirmed = True
-    db.commit()
+    stmt = update(User).where(User.email == email).values(confirmed=True)
 
+    def _update(session: Session):
+        session.execute(stmt)
+        session.commit()
 
-async def update_avatar(email, url: str, db: Session) -> Type[User]:
+    await run_sync(db, _update)
+    await user_cache.invalidate(email)
+
+
+async def update_avatar(email, url: str, db: Session | AsyncSession) -> Type[User]:
     """
         Updates user's avatar
         :param email: email string
@@ -78,12 +117,18 @@ async def update_avatar(email, url: str, db: Session) -> Type[User]:
         :param url: email string
         :type url: str
         :param db: The database session.
-        :type db: Session
+        :type db: Session | AsyncSession
         
         :return: User's object.
         :rtype: Type[User]
     """
-    user = await get_user_by_email(email, db)
-    user.avatar = url
-    db.commit()
+    stmt = update(User).where(User.email == email).values(avatar=url).returning(User)
+
+    def _update(session: Session):
+        user = session.execute(stmt).scalar_one_or_none()
+        session.commit()
+        return user
+
+    user = await run_sync(db, _update)
+    await user_cache.invalidate(email)
     return user
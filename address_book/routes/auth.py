@@ -1,16 +1,42 @@
-from fastapi import APIRouter, HTTPException, Depends, status, Security, Response, BackgroundTasks, Request
+from typing import Annotated, List
+
+from fastapi import APIRouter, HTTPException, Depends, status, Security, Response, BackgroundTasks, Request, Header
 from fastapi.security import OAuth2PasswordRequestForm, HTTPAuthorizationCredentials, HTTPBearer
 from sqlalchemy.orm import Session
 from address_book.services.email import send_email
 from address_book.database.db import get_db
 from address_book.repository import users as repository_users
+from address_book.database.models import User
 from address_book.services.auth import auth_service
-from address_book.schemas import UserModel, UserResponse, TokenModel, RequestEmail
+from address_book.services.sessions import Rotation, new_token_id, refresh_sessions
+from address_book.schemas import UserModel, UserResponse, TokenModel, RequestEmail, SessionResponse
 
 
 router = APIRouter(prefix='/auth', tags=["auth"])
 security = HTTPBearer()
 
+# Longest User-Agent stored as the device of a session
+MAX_DEVICE_LENGTH = 256
+
+
+async def issue_tokens(email: str, sid: str, jti: str) -> dict:
+    """
+        Create the access and the refresh token of a session.
+
+        :param email: The user's email
+        :type email: str
+        :param sid: The session id
+        :type sid: str
+        :param jti: The id of the refresh token, the one the session accepts next
+        :type jti: str
+
+        :return: The dictionary of the access token, refresh token and a token type
+        :rtype: dict
+    """
+    access_token = await auth_service.create_access_token(data={"sub": email, "sid": sid})
+    refresh_token = await auth_service.create_refresh_token(data={"sub": email, "sid": sid, "jti": jti})
+    return {"access_token": access_token, "refresh_token": refresh_token, "token_type": "bearer"}
+
 
 @router.post("/signup", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
 async def signup(body: UserModel, background_tasks: BackgroundTasks, request: Request, db: Session = Depends(get_db)):
@@ -28,23 +54,28 @@ async def signup(body: UserModel, background_tasks: BackgroundTasks, request: Re
         :return: The dictionary of the new user object and a string 'User successfully created. Check your email for confirmation'
         :rtype: dict
     """
-    exist_user = await repository_users.get_user_by_email(body.email, db)
-    if exist_user:
+    # Cheap check before spending a bcrypt hash, the INSERT below still resolves concurrent signups
+    if await repository_users.user_exists(body.email, db):
         raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Account already exists")
-    body.password = auth_service.get_password_hash(body.password)
+    body.password = await auth_service.get_password_hash_async(body.password)
     new_user = await repository_users.create_user(body, db)
+    if new_user is None:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Account already exists")
     background_tasks.add_task(send_email, new_user.email, new_user.username, request.base_url)
     return new_user.to_dict()
 
 
 @router.post("/login", response_model=TokenModel)
-async def login(body: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+async def login(body: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db),
+                user_agent: Annotated[str | None, Header()] = None):
     """
-        Frontend route for user's login
+        Frontend route for user's login, every login opens a new session on the device
         :param body: user's object body
         :type body: OAuth2PasswordRequestForm
         :param db: The database session
         :type db: Session
+        :param user_agent: User-Agent header, stored as the device of the session
+        :type user_agent: str | None
 
         :return: The dictionary of the access token, refresh token and a token type
         :rtype: dict
@@ -54,38 +85,95 @@ async def login(body: OAuth2PasswordRequestForm = Depends(), db: Session = Depen
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid email")
     if not user.confirmed:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Email not confirmed")
-    if not auth_service.verify_password(body.password, user.password):
+    if not await auth_service.verify_password_async(body.password, user.password):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid password")
     # Generate JWT
-    access_token = await auth_service.create_access_token(data={"sub": user.email})
-    refresh_token = await auth_service.create_refresh_token(data={"sub": user.email})
-    await repository_users.update_token(user, refresh_token, db)
-    return {"access_token": access_token, "refresh_token": refresh_token, "token_type": "bearer"}
+    jti = new_token_id()
+    device = user_agent[:MAX_DEVICE_LENGTH] if user_agent else None
+    sid = await refresh_sessions.create(user.email, jti, device)
+    return await issue_tokens(user.email, sid, jti)
 
 
 @router.get('/refresh_token', response_model=TokenModel)
-async def updatee_token(credentials: HTTPAuthorizationCredentials = Security(security), db: Session = Depends(get_db)):
+async def updatee_token(credentials: HTTPAuthorizationCredentials = Security(security)):
     """
-        Frontend route for refreshing user's token
+        Frontend route for refreshing user's token. The refresh token is exchanged for a new one in its session,
+        presenting it a second time revokes the session
         :param credentials: credentials object
         :type credentials: HTTPAuthorizationCredentials
-        :param db: The database session
-        :type db: Session
 
         :return: The dictionary of the access token, refresh token and a token type
         :rtype: dict
     """
-    token = credentials.credentials
-    email = await auth_service.decode_refresh_token(token)
-    user = await repository_users.get_user_by_email(email, db)
-    if user.refresh_token != token:
-        await repository_users.update_token(user, None, db)
+    claims = await auth_service.decode_refresh_claims(credentials.credentials)
+    email, sid, jti = claims.get("sub"), claims.get("sid"), claims.get("jti")
+    if not (email and sid and jti):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid refresh token")
+    new_jti = new_token_id()
+    rotation = await refresh_sessions.rotate(email, sid, jti, new_jti)
+    if rotation is Rotation.REUSED:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
+                            detail="Refresh token was already used, the session is revoked")
+    if rotation is Rotation.MISSING:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Session expired or revoked")
+    return await issue_tokens(email, sid, new_jti)
+
+
+@router.post('/logout', status_code=status.HTTP_204_NO_CONTENT)
+async def logout(credentials: HTTPAuthorizationCredentials = Security(security)):
+    """
+        Frontend route for logging out, revokes the session of the refresh token
+        :param credentials: credentials object with the refresh token
+        :type credentials: HTTPAuthorizationCredentials
 
-    access_token = await auth_service.create_access_token(data={"sub": email})
-    refresh_token = await auth_service.create_refresh_token(data={"sub": email})
-    await repository_users.update_token(user, refresh_token, db)
-    return {"access_token": access_token, "refresh_token": refresh_token, "token_type": "bearer"}
+        :return: None
+        :rtype: None
+    """
+    claims = await auth_service.decode_refresh_claims(credentials.credentials)
+    if claims.get("sid"):
+        await refresh_sessions.revoke(claims["sub"], claims["sid"])
+
+
+@router.get('/sessions', response_model=List[SessionResponse])
+async def read_sessions(current_user: User = Depends(auth_service.get_current_user)):
+    """
+        List the active sessions (logged in devices) of the current user
+        :param current_user: The current authenticated user
+        :type current_user: User
+
+        :return: The sessions, newest first
+        :rtype: List[SessionResponse]
+    """
+    return await refresh_sessions.list(current_user.email)
+
+
+@router.delete('/sessions/{sid}', status_code=status.HTTP_204_NO_CONTENT)
+async def revoke_session(sid: str, current_user: User = Depends(auth_service.get_current_user)):
+    """
+        Revoke one session of the current user, its refresh token stops working
+        :param sid: The session id
+        :type sid: str
+        :param current_user: The current authenticated user
+        :type current_user: User
+
+        :return: None
+        :rtype: None
+    """
+    if not await refresh_sessions.revoke(current_user.email, sid):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Session not found")
+
+
+@router.delete('/sessions')
+async def revoke_sessions(current_user: User = Depends(auth_service.get_current_user)):
+    """
+        Revoke every session of the current user (log out on all devices)
+        :param current_user: The current authenticated user
+        :type current_user: User
+
+        :return: The dictionary {"revoked": <number of sessions>}
+        :rtype: dict
+    """
+    return {"revoked": await refresh_sessions.revoke_all(current_user.email)}
 
 
 @router.get('/confirmed_email/{token}')
@@ -1,31 +1,96 @@
-from typing import List
-from fastapi import APIRouter, HTTPException, Depends, status, Response
-from fastapi_limiter.depends import RateLimiter
+from typing import List, Annotated
+from fastapi import APIRouter, HTTPException, Depends, status, Response, Query, Request, Header
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from address_book.services.auth import auth_service
 from address_book.database.db import get_db
-from address_book.schemas import ContactBase, ContactResponse
+from address_book.conf.config import settings
+from sqlalchemy.exc import IntegrityError
+from address_book.schemas import ContactBase, ContactResponse, ImportReport, ContactsBulkUpdate, ContactsBulkDelete, \
+    BulkResult
 from address_book.database.models import User
 from address_book.repository import contacts as repository_contacts
+from address_book.services.pagination import decode_cursor, paginate, NEXT_CURSOR_HEADER
+from address_book.services import contacts_io
+from address_book.services.serialization import ContactListResponse
+from address_book.services.etag import contacts_etag, etag_matches, not_modified
+from address_book.services.cache import contacts_version
+from address_book.services import contacts_reader
 
 router = APIRouter(prefix='/contacts')
 
 
+PageLimit = Annotated[int, Query(ge=1, le=500)]
+IfNoneMatch = Annotated[str | None, Header()]
+
+
 @router.get("/get_all", response_model=List[ContactResponse])
-async def read_contacts(db: Session = Depends(get_db), current_user: User = Depends(auth_service.get_current_user)):
-    contacts = await repository_contacts.get_contacts(current_user, db)
-    return contacts
+async def read_contacts(limit: PageLimit = 50, cursor: str | None = None, if_none_match: IfNoneMatch = None,
+                        db: Session = Depends(get_db), current_user: User = Depends(auth_service.get_current_user)):
+    """
+        Get a page of the current user's contacts ordered by id, served from the contacts cache when possible.
+        The X-Next-Cursor header is set when more contacts exist. Answers 304 Not Modified without querying the
+        contacts when If-None-Match has the ETag of the current page.
+
+        :param limit: The page size.
+        :type limit: int
+        :param cursor: The X-Next-Cursor value of the previous page, None for the first page.
+        :type cursor: str | None
+        :param if_none_match: ETag of the page the client already has.
+        :type if_none_match: str | None
+        :param db: The database session.
+        :type db: Session
+        :param current_user: The current authenticated user.
+        :type current_user: User
+
+        :return: List of contacts.
+        :rtype: Response
+    """
+    after = decode_cursor(cursor)
+    version = await contacts_version.get(current_user.id)
+    etag = contacts_etag(version, "get_all", limit, cursor)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    body, next_cursor = await contacts_reader.read_page(current_user, db, limit, after and after[0], version)
+    headers = {}
+    if next_cursor:
+        headers[NEXT_CURSOR_HEADER] = next_cursor
+    if etag:
+        headers["ETag"] = etag
+    return Response(body, media_type="application/json", headers=headers)
 
 
 @router.get("/get/{contact_id}", response_model=ContactResponse)
-async def read_contact(contact_id: int, db: Session = Depends(get_db), current_user: User = Depends(auth_service.get_current_user)):
-    contact = await repository_contacts.get_contact(current_user, contact_id, db)
-    if contact is None:
+async def read_contact(contact_id: int, if_none_match: IfNoneMatch = None,
+                       db: Session = Depends(get_db), current_user: User = Depends(auth_service.get_current_user)):
+    """
+        Get a contact of the current user, served from the contacts cache when possible. Answers 304 Not Modified
+        when If-None-Match has its current ETag.
+
+        :param contact_id: The ID of the contact.
+        :type contact_id: int
+        :param if_none_match: ETag of the contact the client already has.
+        :type if_none_match: str | None
+        :param db: The database session.
+        :type db: Session
+        :param current_user: The current authenticated user.
+        :type current_user: User
+
+        :return: The contact.
+        :rtype: Response
+    """
+    version = await contacts_version.get(current_user.id)
+    etag = contacts_etag(version, "get", contact_id)
+    # The contact is resolved first: "If-None-Match: *" matches any existing contact, a missing one is still a 404
+    body = await contacts_reader.read_contact(current_user, contact_id, db, version)
+    if body is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Contact not found")
-    return contact
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    return Response(body, media_type="application/json", headers={"ETag": etag} if etag else None)
 
 
-@router.post("/create", dependencies=[Depends(RateLimiter(times=2, seconds=5))])
+@router.post("/create")
 async def create_new(body: ContactBase, db: Session = Depends(get_db), current_user: User = Depends(auth_service.get_current_user)):
     """
         Create a new contact for the current user.
@@ -44,6 +109,61 @@ async def create_new(body: ContactBase, db: Session = Depends(get_db), current_u
     return Response(status_code=status.HTTP_201_CREATED, content='Contact successfully created')
 
 
+@router.post("/import", response_model=ImportReport)
+async def import_contacts(request: Request, db: Session = Depends(get_db),
+                          current_user: User = Depends(auth_service.get_current_user)):
+    """
+        Import contacts for the current user from a CSV (text/csv, with a header row) or NDJSON (application/x-ndjson)
+        request body. The body is streamed and inserted in batches, existing contacts are skipped.
+
+        :param request: A HTTP request object
+        :type request: Request
+        :param db: The database session.
+        :type db: Session
+        :param current_user: The current authenticated user.
+        :type current_user: User
+
+        :return: Number of inserted and failed rows and the errors with their line numbers.
+        :rtype: ImportReport
+    """
+    media_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    lines = contacts_io.iter_lines(request.stream(), max_line_length=settings.IMPORT_MAX_LINE_LENGTH)
+    if media_type in contacts_io.CSV_MEDIA_TYPES:
+        records = contacts_io.iter_csv_records(lines, max_record_lines=settings.IMPORT_MAX_RECORD_LINES)
+    elif media_type in contacts_io.NDJSON_MEDIA_TYPES:
+        records = contacts_io.iter_ndjson_records(lines)
+    else:
+        raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+                            detail="Send text/csv or application/x-ndjson")
+    return await contacts_io.import_records(current_user, records, db, batch_size=settings.IMPORT_BATCH_SIZE,
+                                            max_errors=settings.IMPORT_MAX_ERRORS)
+
+
+@router.get("/export")
+async def export_contacts(export_format: Annotated[str, Query(alias="format", pattern="^(csv|ndjson)$")] = "csv",
+                          db: Session = Depends(get_db), current_user: User = Depends(auth_service.get_current_user)):
+    """
+        Stream all contacts of the current user as CSV or NDJSON, in the format accepted by /contacts/import.
+
+        :param export_format: "csv" or "ndjson" (default is csv).
+        :type export_format: str
+        :param db: The database session.
+        :type db: Session
+        :param current_user: The current authenticated user.
+        :type current_user: User
+
+        :return: The streamed file.
+        :rtype: StreamingResponse
+    """
+    batches = repository_contacts.stream_contacts(current_user, db, batch_size=settings.EXPORT_BATCH_SIZE)
+    if export_format == "ndjson":
+        content, media_type = contacts_io.export_ndjson(batches), "application/x-ndjson"
+    else:
+        content, media_type = contacts_io.export_csv(batches), "text/csv"
+    return StreamingResponse(content, media_type=media_type,
+                             headers={"Content-Disposition": f'attachment; filename="contacts.{export_format}"'})
+
+
 @router.put("/update/{contact_id}", response_model=ContactResponse)
 async def update_contact(body: ContactBase, contact_id: int, db: Session = Depends(get_db), current_user: User = Depends(auth_service.get_current_user)):
     """
@@ -88,38 +208,93 @@ async def remove_contact(contact_id: int, db: Session = Depends(get_db), current
     return 'Contact successfully deleted'
 
 
-@router.get("/search")
-async def search_contacts(query: str, db: Session = Depends(get_db), current_user: User = Depends(auth_service.get_current_user)):
+@router.patch("/bulk_update", response_model=BulkResult)
+async def bulk_update_contacts(body: ContactsBulkUpdate, db: Session = Depends(get_db),
+                               current_user: User = Depends(auth_service.get_current_user)):
+    """
+        Update many contacts of the current user in one statement. Only the given fields of every contact change.
+
+        :param body: Changed fields by contact id.
+        :type body: ContactsBulkUpdate
+        :param db: The database session.
+        :type db: Session
+        :param current_user: The current authenticated user.
+        :type current_user: User
+
+        :return: Ids of the updated contacts and of the contacts that were not found.
+        :rtype: BulkResult
+    """
+    changes = {contact_id: fields.model_dump(exclude_none=True) for contact_id, fields in body.contacts.items()}
+    try:
+        affected = await repository_contacts.update_contacts(current_user, changes, db)
+    except IntegrityError:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Contact already exists")
+    return BulkResult(affected=affected, not_found=sorted(set(changes) - set(affected)))
+
+
+@router.post("/bulk_delete", response_model=BulkResult)
+async def bulk_delete_contacts(body: ContactsBulkDelete, db: Session = Depends(get_db),
+                               current_user: User = Depends(auth_service.get_current_user)):
+    """
+        Delete many contacts of the current user in one statement.
+
+        :param body: Ids of the contacts to delete.
+        :type body: ContactsBulkDelete
+        :param db: The database session.
+        :type db: Session
+        :param current_user: The current authenticated user.
+        :type current_user: User
+
+        :return: Ids of the deleted contacts and of the contacts that were not found.
+        :rtype: BulkResult
+    """
+    affected = await repository_contacts.remove_contacts(current_user, body.ids, db)
+    return BulkResult(affected=affected, not_found=sorted(set(body.ids) - set(affected)))
+
+
+@router.get("/search", response_model=List[ContactResponse])
+async def search_contacts(query: str, limit: PageLimit = 50, cursor: str | None = None, db: Session = Depends(get_db),
+                          current_user: User = Depends(auth_service.get_current_user)):
     """
-        Search for contacts by a query string for the current user.
+        Search for contacts by a query string for the current user, best matches first. The X-Next-Cursor header
+        is set when more matches exist.
 
         :param query: The search query.
         :type query: str
+        :param limit: The page size.
+        :type limit: int
+        :param cursor: The X-Next-Cursor value of the previous page, None for the first page.
+        :type cursor: str | None
         :param db: The database session.
         :type db: Session
         :param current_user: The current authenticated user.
         :type current_user: User
 
         :return: List of contacts matching the search query.
-        :rtype: List[ContactResponse]
+        :rtype: ContactListResponse
     """
-    contacts = await repository_contacts.search_contacts(current_user, query, db)
-    if not contacts:
+    rows = await repository_contacts.search_contacts(current_user, query, db, limit=limit + 1,
+                                                     after=decode_cursor(cursor, size=2), projected=True)
+    if not rows:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Nothing found")
-    return contacts
+    contacts, next_cursor = paginate(rows, limit, key=lambda contact: (contact.search_rank, contact.id))
+    return ContactListResponse(contacts, headers={NEXT_CURSOR_HEADER: next_cursor} if next_cursor else None)
 
 
-@router.get("/search_birthdays")
-async def search_birthdays(db: Session = Depends(get_db), current_user: User = Depends(auth_service.get_current_user)):
+@router.get("/search_birthdays", response_model=List[ContactResponse])
+async def search_birthdays(days: Annotated[int, Query(ge=1, le=366)] = 7, db: Session = Depends(get_db),
+                           current_user: User = Depends(auth_service.get_current_user)):
     """
-        Search for contacts with birthdays for the current user.
+        Search for contacts with birthdays in the next days for the current user.
 
+        :param days: Length of the window in days, today included (default is 7).
+        :type days: int
         :param db: The database session.
         :type db: Session
         :param current_user: The current authenticated user.
         :type current_user: User
 
         :return: List of contacts with birthdays.
-        :rtype: List[ContactResponse]
+        :rtype: ContactListResponse
     """
-    return await repository_contacts.get_birthdays(current_user, db)
\ No newline at end of file
+    return ContactListResponse(await repository_contacts.get_birthdays(current_user, db, days=days))
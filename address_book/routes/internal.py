@@ -0,0 +1,135 @@
+import hmac
+
+from fastapi import APIRouter, HTTPException, Depends, Header, Query, status
+from address_book.conf.config import settings
+from address_book.database import db
+from address_book.database.pool import pool_stats
+from address_book.database.slow_queries import slow_query_log
+from address_book.services.auth import auth_service
+from address_book.services.avatars import avatar_pipeline
+from address_book.services.cache import user_cache, contacts_cache
+from address_book.services.email import email_dispatcher
+from address_book.services.ratelimit import rate_limiter
+from address_book.services.sessions import refresh_sessions
+
+
+async def verify_internal_key(x_internal_key: str | None = Header(default=None)):
+    """
+        Guards internal routes with the X-Internal-Key header. Without settings.INTERNAL_API_KEY the routes are
+        disabled and answer 404.
+
+        :param x_internal_key: Value of the X-Internal-Key header
+        :type x_internal_key: str | None
+    """
+    if not settings.INTERNAL_API_KEY:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    if x_internal_key is None or not hmac.compare_digest(x_internal_key.encode(), settings.INTERNAL_API_KEY.encode()):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Forbidden")
+
+
+router = APIRouter(prefix='/internal', tags=["internal"], include_in_schema=False,
+                   dependencies=[Depends(verify_internal_key)])
+
+
+@router.get('/cache')
+async def cache_stats():
+    """
+        Hit and miss counters of the application caches.
+
+        :return: The dictionary of cache counters
+        :rtype: dict
+    """
+    return {"users": user_cache.stats(), "contacts": contacts_cache.stats(), "tokens": auth_service.token_cache.stats()}
+
+
+@router.get('/password_hashing')
+async def password_hashing_stats():
+    """
+        Queue depth, wait time and throughput counters of the password hashing pool.
+
+        :return: The dictionary of pool metrics
+        :rtype: dict
+    """
+    return auth_service.password_pool.stats()
+
+
+@router.get('/avatars')
+async def avatar_stats():
+    """
+        Queue depth, wait times and rejected jobs of the avatar processing pool.
+
+        :return: The dictionary of pool metrics
+        :rtype: dict
+    """
+    return avatar_pipeline.pool.stats()
+
+
+@router.get('/pool')
+async def database_pool_stats():
+    """
+        Checked out and overflow connections, timeouts and the checkout wait time histogram of the database pools.
+
+        :return: The dictionary of pool metrics per engine
+        :rtype: dict
+    """
+    stats = {"sync": pool_stats(db.engine.pool)}
+    if db.async_engine is not None:
+        stats["async"] = pool_stats(db.async_engine.pool)
+    return stats
+
+
+@router.get('/email')
+async def email_stats():
+    """
+        Queue depth, delivery counters and send time histogram of the email dispatcher.
+
+        :return: The dictionary of dispatcher metrics
+        :rtype: dict
+    """
+    return email_dispatcher.stats()
+
+
+@router.get('/sessions')
+async def session_stats():
+    """
+        Counters of the refresh token session store.
+
+        :return: The dictionary of created, rotated, reused and revoked sessions
+        :rtype: dict
+    """
+    return refresh_sessions.stats()
+
+
+@router.get('/rate_limit')
+async def rate_limit_stats():
+    """
+        Allowed and rejected requests of the rate limiter.
+
+        :return: The dictionary of rate limit counters
+        :rtype: dict
+    """
+    return rate_limiter.stats()
+
+
+@router.get('/slow_queries')
+async def slow_queries(limit: int = Query(default=20, ge=1, le=1000)):
+    """
+        The latest statements slower than the threshold, with their redacted parameters, the function that ran them
+        and their plan.
+
+        :param limit: Number of entries to return, newest first
+        :type limit: int
+
+        :return: The threshold in seconds, the number of slow queries recorded and the entries
+        :rtype: dict
+    """
+    return {"threshold": slow_query_log.threshold, "recorded": slow_query_log.recorded,
+            "queries": slow_query_log.snapshot(limit)}
+
+
+@router.delete('/slow_queries', status_code=status.HTTP_204_NO_CONTENT)
+async def clear_slow_queries():
+    """
+        Empty the slow query log.
+    """
+    slow_query_log.clear()
@@ -0,0 +1,46 @@
+from fastapi import APIRouter, Depends
+from fastapi.responses import PlainTextResponse
+
+from address_book.database import db
+from address_book.database.pool import pool_stats
+from address_book.routes.internal import verify_internal_key
+from address_book.services.metrics import MetricFamily, registry
+
+router = APIRouter(tags=["metrics"], include_in_schema=False, dependencies=[Depends(verify_internal_key)])
+
+pool_connections = registry.register(MetricFamily(
+    "db_pool_connections", "Connections of the database pool by state.", "gauge", ("engine", "state")))
+pool_timeouts = registry.register(MetricFamily(
+    "db_pool_checkout_timeouts", "Checkouts that gave up waiting for a connection.", "gauge", ("engine",)))
+
+
+def collect_pool_stats() -> None:
+    """
+        Copy the state of the database pools into their gauges.
+    """
+    engines = {"sync": db.engine}
+    if db.async_engine is not None:
+        engines["async"] = db.async_engine
+    for name, engine in engines.items():
+        stats = pool_stats(engine.pool)
+        # Pools other than QueuePool do not report their state
+        for state in ("checked_in", "checked_out", "overflow"):
+            if state in stats:
+                pool_connections.labels(name, state).set(stats[state])
+        if "timeouts" in stats:
+            pool_timeouts.labels(name).set(stats["timeouts"])
+
+
+registry.add_collector(collect_pool_stats)
+
+
+@router.get('/metrics', response_class=PlainTextResponse)
+async def metrics():
+    """
+        Application metrics in the Prometheus text format: request latency, in-flight requests and database queries
+        per route, database pool state.
+
+        :return: The exposition document
+        :rtype: PlainTextResponse
+    """
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
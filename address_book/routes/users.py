@@ -1,12 +1,10 @@
 from fastapi import APIRouter, Depends, UploadFile, File
 from sqlalchemy.orm import Session
-import cloudinary
-import cloudinary.uploader
 from address_book.database.db import get_db
 from address_book.database.models import User
 from address_book.repository import users as repository_users
 from address_book.services.auth import auth_service
-from address_book.conf.config import settings
+from address_book.services.avatars import avatar_pipeline
 from address_book.schemas import UserDb
 
 router = APIRouter(prefix="/users", tags=["users"])
@@ -42,15 +40,8 @@ async def update_avatar_user(file: UploadFile = File(), current_user: User = Dep
         :return: The updated user information.
         :rtype: UserDb
     """
-    cloudinary.config(
-        cloud_name=settings.CLOUDINARY_NAME,
-        api_key=settings.CLOUDINARY_API_KEY,
-        api_secret=settings.CLOUDINARY_API_SECRET,
-        secure=True
-    )
-
-    r = cloudinary.uploader.upload(file.file, public_id=f'NotesApp/{current_user.username}', overwrite=True)
-    src_url = cloudinary.CloudinaryImage(f'NotesApp/{current_user.username}')\
-                        .build_url(width=250, height=250, crop='fill', version=r.get('version'))
+    # Reading one byte past the limit is enough to reject oversized uploads
+    data = await file.read(avatar_pipeline.max_bytes + 1)
+    src_url = await avatar_pipeline.upload(str(current_user.id), data)
     user = await repository_users.update_avatar(current_user.email, src_url, db)
     return user
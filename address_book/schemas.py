@@ -1,5 +1,7 @@
-from datetime import datetime
-from pydantic import BaseModel, Field, EmailStr
+from datetime import date, datetime
+from pydantic import BaseModel, Field, EmailStr, model_validator
+
+from address_book.services.gravatar import gravatar_url
 
 
 class ContactBase(BaseModel):
@@ -7,7 +9,7 @@ class ContactBase(BaseModel):
     last_name: str = Field(max_length=50)
     email: str = Field(max_length=50)
     phone: str = Field(max_length=50)
-    birthday: str = Field(max_length=50)
+    birthday: date
 
 
 class ContactResponse(ContactBase):
@@ -16,6 +18,44 @@ class ContactResponse(ContactBase):
         exclude_unset = True
 
 
+class ContactUpdate(BaseModel):
+    first_name: str | None = Field(default=None, max_length=50)
+    last_name: str | None = Field(default=None, max_length=50)
+    email: str | None = Field(default=None, max_length=50)
+    phone: str | None = Field(default=None, max_length=50)
+    birthday: date | None = None
+
+    @model_validator(mode='after')
+    def check_fields(self):
+        if not self.model_dump(exclude_none=True):
+            raise ValueError('At least one field to update is required')
+        return self
+
+
+class ContactsBulkUpdate(BaseModel):
+    contacts: dict[int, ContactUpdate] = Field(min_length=1, max_length=1000)
+
+
+class ContactsBulkDelete(BaseModel):
+    ids: list[int] = Field(min_length=1, max_length=1000)
+
+
+class BulkResult(BaseModel):
+    affected: list[int] = []
+    not_found: list[int] = []
+
+
+class ImportRowError(BaseModel):
+    line: int
+    error: str
+
+
+class ImportReport(BaseModel):
+    inserted: int = 0
+    failed: int = 0
+    errors: list[ImportRowError] = []
+
+
 class UserModel(BaseModel):
     username: str = Field(min_length=5, max_length=16)
     email: str
@@ -33,11 +73,18 @@ class UserDb(BaseModel):
     username: str
     email: str
     created_at: datetime
-    avatar: str
+    avatar: str | None = None
 
     class Config:
         from_attributes = True
 
+    @model_validator(mode="after")
+    def default_avatar(self):
+        # Users without an uploaded avatar get their Gravatar, derived here instead of being stored at signup
+        if self.avatar is None:
+            self.avatar = gravatar_url(self.email)
+        return self
+
     def __iter__(self):
         yield self
 
@@ -56,5 +103,12 @@ class TokenModel(BaseModel):
     token_type: str = "bearer"
 
 
+class SessionResponse(BaseModel):
+    sid: str
+    device: str | None
+    created_at: datetime
+    refreshed_at: datetime
+
+
 class RequestEmail(BaseModel):
     email: EmailStr
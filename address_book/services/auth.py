@@ -1,14 +1,27 @@
 from typing import Optional
 from address_book.conf.config import settings
-from jose import JWTError, jwt
 from fastapi import HTTPException, status, Depends
 from fastapi.security import OAuth2PasswordBearer
 from passlib.context import CryptContext
 from datetime import datetime, timedelta
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from address_book.database.db import get_db
 from address_book.repository import users as repository_users
+from address_book.services.cache import user_cache
+from address_book.services.workers import BoundedExecutor, PoolSaturated
+from address_book.services.jwt_backends import InvalidToken, VerifiedTokenCache, get_backend
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+
+def _hash_password(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def _verify_password(plain_password: str, hashed_password: str) -> bool:
+    return pwd_context.verify(plain_password, hashed_password)
 
 
 class Auth:
@@ -20,11 +33,20 @@ class Auth:
         - SECRET_KEY: Secret key for JWT encoding and decoding
         - ALGORITHM: Algorithm for JWT encoding and decoding
         - oauth2_scheme: OAuth2 password bearer scheme for token authentication
+        - user_cache: Cache of authenticated users keyed by email
+        - password_pool: Bounded worker pool that runs bcrypt off the event loop
+        - jwt_backend: JWT implementation selected by settings.JWT_BACKEND
+        - token_cache: Claims of verified tokens, valid until the tokens expire
     """
-    pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+    pwd_context = pwd_context
     SECRET_KEY = settings.SECRET_KEY
     ALGORITHM = settings.ALGORITHM
     oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
+    user_cache = user_cache
+    password_pool = BoundedExecutor(workers=settings.PASSWORD_HASH_WORKERS, max_queue=settings.PASSWORD_HASH_QUEUE,
+                                    kind=settings.PASSWORD_HASH_EXECUTOR)
+    jwt_backend = get_backend(settings.JWT_BACKEND)
+    token_cache = VerifiedTokenCache(maxsize=settings.JWT_CACHE_SIZE)
 
     def verify_password(self, plain_password, hashed_password):
         """
@@ -52,6 +74,58 @@ class Auth:
         """
         return self.pwd_context.hash(password)
 
+    async def _run_hashing(self, fn, *args):
+        try:
+            return await self.password_pool.run(fn, *args)
+        except PoolSaturated:
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                                detail="Server is busy, try again later", headers={"Retry-After": "1"})
+
+    async def verify_password_async(self, plain_password: str, hashed_password: str) -> bool:
+        """
+            Verify the plain password against the hashed password on the password hashing pool.
+
+            :param plain_password: The plain text password
+            :type plain_password: str
+            :param hashed_password: The hashed password
+            :type hashed_password: str
+
+            :return: True if the passwords match, False otherwise
+            :rtype: bool
+            :raises HTTPException: 503 when the pool backlog is full
+        """
+        return await self._run_hashing(_verify_password, plain_password, hashed_password)
+
+    async def get_password_hash_async(self, password: str) -> str:
+        """
+            Get the hashed version of a password, computed on the password hashing pool.
+
+            :param password: The password to hash
+            :type password: str
+
+            :return: The hashed password
+            :rtype: str
+            :raises HTTPException: 503 when the pool backlog is full
+        """
+        return await self._run_hashing(_hash_password, password)
+
+    def decode_token(self, token: str) -> dict:
+        """
+            Verify a token and get its claims, memoized until the token expires.
+
+            :param token: The encoded token
+            :type token: str
+
+            :return: The verified claims
+            :rtype: dict
+            :raises InvalidToken: If the token fails verification
+        """
+        claims = self.token_cache.get(token)
+        if claims is None:
+            claims = self.jwt_backend.decode(token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
+            self.token_cache.set(token, claims)
+        return claims
+
     async def create_access_token(self, data: dict, expires_delta: Optional[float] = None):
         """
             Generate a new access token.
@@ -70,7 +144,7 @@ class Auth:
         else:
             expire = datetime.utcnow() + timedelta(minutes=15)
         to_encode.update({"iat": datetime.utcnow(), "exp": expire, "scope": "access_token"})
-        encoded_access_token = jwt.encode(to_encode, self.SECRET_KEY, algorithm=self.ALGORITHM)
+        encoded_access_token = self.jwt_backend.encode(to_encode, self.SECRET_KEY, algorithm=self.ALGORITHM)
         return encoded_access_token
 
     async def create_refresh_token(self, data: dict, expires_delta: Optional[float] = None):
@@ -79,21 +153,36 @@ class Auth:
 
             :param data: The data to encode in the token
             :type data: dict
-            :param expires_delta: The expiration delta in seconds (default is 7 days)
+            :param expires_delta: The expiration delta in seconds (default is settings.REFRESH_TOKEN_TTL, 7 days)
             :type expires_delta: Optional[float]
 
             :return: The encoded refresh token
             :rtype: str
         """
         to_encode = data.copy()
-        if expires_delta:
-            expire = datetime.utcnow() + timedelta(seconds=expires_delta)
-        else:
-            expire = datetime.utcnow() + timedelta(days=7)
+        expire = datetime.utcnow() + timedelta(seconds=expires_delta or settings.REFRESH_TOKEN_TTL)
         to_encode.update({"iat": datetime.utcnow(), "exp": expire, "scope": "refresh_token"})
-        encoded_refresh_token = jwt.encode(to_encode, self.SECRET_KEY, algorithm=self.ALGORITHM)
+        encoded_refresh_token = self.jwt_backend.encode(to_encode, self.SECRET_KEY, algorithm=self.ALGORITHM)
         return encoded_refresh_token
 
+    async def decode_refresh_claims(self, refresh_token: str) -> dict:
+        """
+            Decode and validate a refresh token.
+
+            :param refresh_token: The refresh token to decode
+            :type refresh_token: str
+
+            :return: The claims of the token: sub (email), sid (session id) and jti (token id) among others
+            :rtype: dict
+        """
+        try:
+            payload = self.decode_token(refresh_token)
+        except InvalidToken:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Could not validate credentials')
+        if payload.get('scope') != 'refresh_token':
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Invalid scope for token')
+        return payload
+
     async def decode_refresh_token(self, refresh_token: str):
         """
             Decode and validate a refresh token.
@@ -104,23 +193,17 @@ class Auth:
             :return: The email associated with the token
             :rtype: str
         """
-        try:
-            payload = jwt.decode(refresh_token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
-            if payload['scope'] == 'refresh_token':
-                email = payload['sub']
-                return email
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Invalid scope for token')
-        except JWTError:
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Could not validate credentials')
+        payload = await self.decode_refresh_claims(refresh_token)
+        return payload['sub']
 
-    async def get_current_user(self, token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+    async def get_current_user(self, token: str = Depends(oauth2_scheme), db: Session | AsyncSession = Depends(get_db)):
         """
             Get the current authenticated user.
 
             :param token: The authentication token
             :type token: str
             :param db: The database session
-            :type db: Session
+            :type db: Session | AsyncSession
 
             :return: The current authenticated user
             :rtype: User
@@ -133,19 +216,23 @@ class Auth:
 
         try:
             # Decode JWT
-            payload = jwt.decode(token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
+            payload = self.decode_token(token)
             if payload['scope'] == 'access_token':
                 email = payload["sub"]
                 if email is None:
                     raise credentials_exception
             else:
                 raise credentials_exception
-        except JWTError as e:
+        except InvalidToken as e:
             raise credentials_exception
 
+        user = await self.user_cache.get(email)
+        if user is not None:
+            return user
         user = await repository_users.get_user_by_email(email, db)
         if user is None:
             raise credentials_exception
+        await self.user_cache.set(user)
         return user
 
     async def create_email_token(self, data: dict):
@@ -161,7 +248,7 @@ class Auth:
         to_encode = data.copy()
         expire = datetime.utcnow() + timedelta(days=7)
         to_encode.update({"iat": datetime.utcnow(), "exp": expire})
-        token = jwt.encode(to_encode, self.SECRET_KEY, algorithm=self.ALGORITHM)
+        token = self.jwt_backend.encode(to_encode, self.SECRET_KEY, algorithm=self.ALGORITHM)
         return token
 
     async def get_email_from_token(self, token: str):
@@ -175,10 +262,10 @@ class Auth:
             :rtype: str
         """
         try:
-            payload = jwt.decode(token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
+            payload = self.decode_token(token)
             email = payload["sub"]
             return email
-        except JWTError as e:
+        except InvalidToken as e:
             print(e)
             raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
                                 detail="Invalid token for email verification")
@@ -0,0 +1,207 @@
+import asyncio
+import hashlib
+import io
+import os
+import tempfile
+from pathlib import Path
+
+from fastapi import HTTPException, status
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from address_book.conf.config import settings
+from address_book.services.workers import BoundedExecutor, PoolSaturated
+
+# Larger images are rejected before decoding, 40 megapixels covers any camera photo
+MAX_IMAGE_PIXELS = 40_000_000
+
+
+class InvalidImage(ValueError):
+    """
+        Raised for uploads that are not a decodable image.
+    """
+
+
+def process_avatar(data: bytes, size: int = 250, quality: int = 85) -> bytes:
+    """
+        Crop an image to a centered square, resize it and recompress it as JPEG. Blocking, runs on a worker pool.
+
+        :param data: The uploaded file
+        :type data: bytes
+        :param size: Width and height of the avatar in pixels
+        :type size: int
+        :param quality: JPEG quality
+        :type quality: int
+
+        :return: The JPEG image
+        :rtype: bytes
+        :raises InvalidImage: If data is not an image or has more than MAX_IMAGE_PIXELS
+    """
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            if image.width * image.height > MAX_IMAGE_PIXELS:
+                raise InvalidImage("Image is too large")
+            # JPEG draft mode decodes at a fraction of the resolution when that is still larger than the avatar
+            image.draft("RGB", (size, size))
+            image = ImageOps.exif_transpose(image).convert("RGB")
+            image = ImageOps.fit(image, (size, size), Image.Resampling.LANCZOS)
+    except (UnidentifiedImageError, OSError, Image.DecompressionBombError) as err:
+        raise InvalidImage(str(err)) from err
+    output = io.BytesIO()
+    image.save(output, format="JPEG", quality=quality, optimize=True)
+    return output.getvalue()
+
+
+class CloudinaryStorage:
+    """
+        Stores avatars in Cloudinary, uploads run on a thread so they do not block the event loop.
+    """
+    name = "cloudinary"
+
+    def __init__(self, folder: str = "NotesApp"):
+        import cloudinary
+        import cloudinary.uploader
+        self.folder = folder
+        self._uploader = cloudinary.uploader
+        cloudinary.config(
+            cloud_name=settings.CLOUDINARY_NAME,
+            api_key=settings.CLOUDINARY_API_KEY,
+            api_secret=settings.CLOUDINARY_API_SECRET,
+            secure=True
+        )
+
+    async def save(self, key: str, data: bytes) -> str:
+        """
+            Upload an avatar.
+
+            :param key: Unique key of the avatar owner, the user id, the public id within the folder
+            :type key: str
+            :param data: The JPEG image
+            :type data: bytes
+
+            :return: The avatar url
+            :rtype: str
+        """
+        result = await asyncio.to_thread(self._uploader.upload, io.BytesIO(data), public_id=f"{self.folder}/{key}",
+                                         overwrite=True)
+        return result["secure_url"]
+
+
+class LocalStorage:
+    """
+        Stores avatars as files in a directory served by the application.
+
+        Attributes:
+        - root: The directory of the avatar files
+        - url_prefix: The url path the directory is served under
+    """
+    name = "local"
+
+    def __init__(self, root: str = "media/avatars", url_prefix: str = "/media/avatars"):
+        self.root = Path(root)
+        self.url_prefix = url_prefix.rstrip("/")
+
+    def _write(self, filename: str, data: bytes) -> None:
+        self.root.mkdir(parents=True, exist_ok=True)
+        # Every write has its own temporary file, concurrent uploads replace the avatar whole, one after the other
+        with tempfile.NamedTemporaryFile(dir=self.root, prefix=filename, suffix=".tmp", delete=False) as tmp:
+            tmp.write(data)
+        try:
+            # Temporary files are private, the avatar is served to everybody
+            os.chmod(tmp.name, 0o644)
+            os.replace(tmp.name, self.root / filename)
+        except OSError:
+            os.unlink(tmp.name)
+            raise
+
+    async def save(self, key: str, data: bytes) -> str:
+        """
+            Write an avatar file, replacing the previous one of the same owner.
+
+            :param key: Unique key of the avatar owner, the user id
+            :type key: str
+            :param data: The JPEG image
+            :type data: bytes
+
+            :return: The avatar url, with a version parameter that changes with the content
+            :rtype: str
+        """
+        # The file name is derived from the key instead of containing it
+        filename = hashlib.sha256(key.encode()).hexdigest()[:32] + ".jpg"
+        await asyncio.to_thread(self._write, filename, data)
+        return f"{self.url_prefix}/{filename}?v={hashlib.sha256(data).hexdigest()[:12]}"
+
+
+STORAGES = {storage.name: storage for storage in (CloudinaryStorage, LocalStorage)}
+
+
+def get_storage(name: str):
+    """
+        Create an avatar storage by name.
+
+        :param name: "cloudinary" or "local"
+        :type name: str
+
+        :return: The storage with save(key, data) returning the avatar url
+        :raises ValueError: For an unknown storage name
+    """
+    if name == LocalStorage.name:
+        return LocalStorage(settings.AVATAR_LOCAL_DIR, settings.AVATAR_URL_PREFIX)
+    if name not in STORAGES:
+        raise ValueError(f"Unknown avatar storage '{name}', use one of {', '.join(STORAGES)}")
+    return STORAGES[name]()
+
+
+class AvatarPipeline:
+    """
+        Turns uploaded images into avatars: the image is processed on a bounded worker pool and stored.
+
+        Attributes:
+        - storage: Backend with save(key, data) returning the avatar url
+        - pool: Bounded worker pool for the image processing
+        - size: Width and height of the avatars in pixels
+        - quality: JPEG quality
+        - max_bytes: Largest accepted upload
+    """
+
+    def __init__(self, storage, pool: BoundedExecutor, size: int = 250, quality: int = 85,
+                 max_bytes: int = 5 * 1024 * 1024):
+        self.storage = storage
+        self.pool = pool
+        self.size = size
+        self.quality = quality
+        self.max_bytes = max_bytes
+
+    async def upload(self, key: str, data: bytes) -> str:
+        """
+            Process and store an avatar.
+
+            :param key: Unique key of the avatar owner, the user id (usernames are not unique)
+            :type key: str
+            :param data: The uploaded file
+            :type data: bytes
+
+            :return: The avatar url
+            :rtype: str
+            :raises HTTPException: 413 for a too large upload, 422 if it is not an image, 503 when the pool backlog
+                is full
+        """
+        if len(data) > self.max_bytes:
+            raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                                detail=f"Avatar must not exceed {self.max_bytes} bytes")
+        try:
+            avatar = await self.pool.run(process_avatar, data, self.size, self.quality)
+        except InvalidImage:
+            raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="Unsupported image")
+        except PoolSaturated:
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                                detail="Server is busy, try again later", headers={"Retry-After": "1"})
+        return await self.storage.save(key, avatar)
+
+
+avatar_pipeline = AvatarPipeline(
+    storage=get_storage(settings.AVATAR_STORAGE),
+    pool=BoundedExecutor(workers=settings.AVATAR_WORKERS, max_queue=settings.AVATAR_QUEUE, kind="thread"),
+    size=settings.AVATAR_SIZE,
+    quality=settings.AVATAR_QUALITY,
+    max_bytes=settings.AVATAR_MAX_BYTES,
+)
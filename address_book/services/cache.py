@@ -0,0 +1,396 @@
+import asyncio
+import json
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Hashable
+
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+from address_book.conf.config import settings
+from address_book.database.models import User
+
+_redis: Redis | None = None
+
+
+def init_redis(client: Redis | None) -> None:
+    """
+        Registers the redis client created on application startup so cache layers can share it.
+
+        :param client: The redis client, or None to disable the redis tier
+        :type client: Redis | None
+    """
+    global _redis
+    _redis = client
+
+
+def get_redis() -> Redis | None:
+    """
+        Returns the shared redis client.
+
+        :return: The redis client registered with init_redis, or None if redis is not available
+        :rtype: Redis | None
+    """
+    return _redis
+
+
+class TTLCache:
+    """
+        In-process LRU cache where every entry expires after a time to live.
+
+        Attributes:
+        - maxsize: Maximum number of entries, the least recently used entry is evicted first
+        - ttl: Default time to live of an entry in seconds
+    """
+    _missing = object()
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """
+            Get a value from the cache.
+
+            :param key: The cache key
+            :type key: Hashable
+            :param default: Value returned when the key is missing or expired
+            :type default: Any
+
+            :return: The cached value or default
+            :rtype: Any
+        """
+        item = self._data.get(key, self._missing)
+        if item is self._missing:
+            return default
+        expires_at, value = item
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            return default
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: float | None = None) -> None:
+        """
+            Put a value into the cache.
+
+            :param key: The cache key
+            :type key: Hashable
+            :param value: The value to store
+            :type value: Any
+            :param ttl: Time to live in seconds (default is the cache ttl)
+            :type ttl: float | None
+        """
+        self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def delete(self, key: Hashable) -> None:
+        """
+            Remove a value from the cache.
+
+            :param key: The cache key
+            :type key: Hashable
+        """
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        """
+            Remove every value from the cache.
+        """
+        self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class UserCache:
+    """
+        Two-tier cache of user rows keyed by email: an in-process TTL LRU in front of redis.
+
+        Secrets (password hash and refresh token) are never cached, users returned from the cache are detached
+        User objects that carry the remaining columns.
+
+        Attributes:
+        - local: In-process TTLCache tier
+        - ttl: Time to live in seconds of both tiers
+        - prefix: Redis key prefix
+    """
+    fields = ("id", "username", "email", "created_at", "avatar", "confirmed")
+
+    def __init__(self, maxsize: int = 1024, ttl: int = 60, prefix: str = "user:"):
+        self.local = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.ttl = ttl
+        self.prefix = prefix
+        self.local_hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+
+    def _dump(self, user: User) -> dict:
+        data = {field: getattr(user, field) for field in self.fields}
+        if isinstance(data["created_at"], datetime):
+            data["created_at"] = data["created_at"].isoformat()
+        return data
+
+    @staticmethod
+    def _load(data: dict) -> User:
+        data = dict(data)
+        if data.get("created_at"):
+            data["created_at"] = datetime.fromisoformat(data["created_at"])
+        return User(**data)
+
+    async def get(self, email: str) -> User | None:
+        """
+            Get a user by email from the local tier, then from redis.
+
+            :param email: The user's email
+            :type email: str
+
+            :return: A detached User object or None on a cache miss
+            :rtype: User | None
+        """
+        data = self.local.get(email)
+        if data is not None:
+            self.local_hits += 1
+            return self._load(data)
+        redis = get_redis()
+        if redis is not None:
+            try:
+                raw = await redis.get(self.prefix + email)
+            except RedisError:
+                raw = None
+            if raw:
+                data = json.loads(raw)
+                self.local.set(email, data)
+                self.redis_hits += 1
+                return self._load(data)
+        self.misses += 1
+        return None
+
+    async def set(self, user: User) -> None:
+        """
+            Store a user in both tiers.
+
+            :param user: The user to cache
+            :type user: User
+        """
+        data = self._dump(user)
+        self.local.set(user.email, data)
+        redis = get_redis()
+        if redis is not None:
+            try:
+                await redis.set(self.prefix + user.email, json.dumps(data), ex=self.ttl)
+            except RedisError:
+                pass
+
+    async def invalidate(self, email: str) -> None:
+        """
+            Remove a user from both tiers.
+
+            :param email: The user's email
+            :type email: str
+        """
+        self.local.delete(email)
+        redis = get_redis()
+        if redis is not None:
+            try:
+                await redis.delete(self.prefix + email)
+            except RedisError:
+                pass
+
+    def stats(self) -> dict:
+        """
+            Get hit and miss counters.
+
+            :return: The dictionary of counters and the hit ratio
+            :rtype: dict
+        """
+        total = self.local_hits + self.redis_hits + self.misses
+        return {
+            "local_hits": self.local_hits,
+            "redis_hits": self.redis_hits,
+            "misses": self.misses,
+            "hit_ratio": (self.local_hits + self.redis_hits) / total if total else 0.0,
+            "local_size": len(self.local),
+        }
+
+
+class ContactsVersion:
+    """
+        Per-user version token of the contacts in redis, replaced by every write to the user's contacts.
+
+        Tokens are random rather than counters, so a key lost to eviction or a redis restart gets a token no client
+        has seen before and can never validate a stale ETag.
+
+        Attributes:
+        - prefix: Redis key prefix
+    """
+
+    def __init__(self, prefix: str = "contacts_version:"):
+        self.prefix = prefix
+
+    async def get(self, user_id: int) -> str | None:
+        """
+            Get the current version token of a user's contacts, creating one if there is none yet.
+
+            :param user_id: The owner of the contacts
+            :type user_id: int
+
+            :return: The version token, or None if redis is not available
+            :rtype: str | None
+        """
+        redis = get_redis()
+        if redis is None:
+            return None
+        key = self.prefix + str(user_id)
+        try:
+            version = await redis.get(key)
+            if version is None:
+                token = uuid.uuid4().hex
+                version = token if await redis.set(key, token, nx=True) else await redis.get(key)
+        except RedisError:
+            return None
+        return version.decode() if isinstance(version, bytes) else version
+
+    async def bump(self, user_id: int) -> None:
+        """
+            Replace the version token of a user's contacts after a write.
+
+            :param user_id: The owner of the contacts
+            :type user_id: int
+        """
+        redis = get_redis()
+        if redis is not None:
+            try:
+                await redis.set(self.prefix + str(user_id), uuid.uuid4().hex)
+            except RedisError:
+                pass
+
+
+class ReadThroughCache:
+    """
+        Redis read-through cache of serialized values.
+
+        A miss is loaded once per key: concurrent misses in the process wait for the running load, and across
+        processes the first one takes a short redis lock while the others poll for its result. Keys should contain
+        a version (see ContactsVersion) so writes make old entries unreachable instead of deleting them.
+
+        Attributes:
+        - ttl: Time to live of an entry in seconds
+        - lock_ttl: Seconds a load may hold the lock, also the longest time other processes wait for it
+        - poll_interval: Seconds between redis reads while waiting for another process
+        - prefix: Redis key prefix
+    """
+
+    def __init__(self, ttl: int = 300, lock_ttl: float = 5.0, poll_interval: float = 0.05, prefix: str = "cache:"):
+        self.ttl = ttl
+        self.lock_ttl = lock_ttl
+        self.poll_interval = poll_interval
+        self.prefix = prefix
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.lock_waits = 0
+        self.errors = 0
+        self._inflight: dict[str, asyncio.Future] = {}
+
+    async def _get(self, redis: Redis, key: str) -> str | None:
+        try:
+            value = await redis.get(key)
+        except RedisError:
+            self.errors += 1
+            return None
+        return value.decode() if isinstance(value, bytes) else value
+
+    async def _load(self, redis: Redis, key: str, loader: Callable[[], Awaitable[str | None]]) -> str | None:
+        lock = key + ":lock"
+        try:
+            locked = await redis.set(lock, "1", nx=True, px=int(self.lock_ttl * 1000))
+        except RedisError:
+            self.errors += 1
+            locked = True
+        if not locked:
+            deadline = time.monotonic() + self.lock_ttl
+            while time.monotonic() < deadline:
+                await asyncio.sleep(self.poll_interval)
+                value = await self._get(redis, key)
+                if value is not None:
+                    self.lock_waits += 1
+                    return value
+        value = await loader()
+        try:
+            if value is not None:
+                await redis.set(key, value, ex=self.ttl)
+            if locked:
+                await redis.delete(lock)
+        except RedisError:
+            self.errors += 1
+        return value
+
+    async def get_or_load(self, key: str, loader: Callable[[], Awaitable[str | None]]) -> str | None:
+        """
+            Get a value from redis, or load and store it on a miss. None values are not cached.
+
+            :param key: The cache key without prefix
+            :type key: str
+            :param loader: Coroutine function producing the serialized value
+            :type loader: Callable[[], Awaitable[str | None]]
+
+            :return: The cached or loaded value
+            :rtype: str | None
+        """
+        redis = get_redis()
+        if redis is None:
+            return await loader()
+        key = self.prefix + key
+        value = await self._get(redis, key)
+        if value is not None:
+            self.hits += 1
+            return value
+        self.misses += 1
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.coalesced += 1
+            await asyncio.wait([inflight])
+            if not inflight.cancelled():
+                return inflight.result()
+            return await self._load(redis, key, loader)
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await self._load(redis, key, loader)
+        except BaseException:
+            # Waiters load on their own instead of sharing the error
+            future.cancel()
+            raise
+        finally:
+            del self._inflight[key]
+        future.set_result(value)
+        return value
+
+    def stats(self) -> dict:
+        """
+            Get hit and miss counters.
+
+            :return: The dictionary of counters and the hit ratio
+            :rtype: dict
+        """
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "lock_waits": self.lock_waits,
+            "errors": self.errors,
+            "hit_ratio": self.hits / total if total else 0.0,
+        }
+
+
+user_cache = UserCache(maxsize=settings.USER_CACHE_SIZE, ttl=settings.USER_CACHE_TTL)
+contacts_version = ContactsVersion()
+contacts_cache = ReadThroughCache(ttl=settings.CONTACTS_CACHE_TTL, lock_ttl=settings.CONTACTS_CACHE_LOCK_TTL,
+                                  prefix="contacts:")
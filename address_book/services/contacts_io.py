@@ -0,0 +1,291 @@
+import codecs
+import csv
+import io
+import json
+from collections import deque
+from typing import AsyncIterator, Sequence
+
+from pydantic import ValidationError
+from sqlalchemy import Row
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from address_book.database.models import User
+from address_book.repository import contacts as repository_contacts
+from address_book.schemas import ContactBase, ImportReport, ImportRowError
+
+CSV_MEDIA_TYPES = ("text/csv", "application/csv")
+NDJSON_MEDIA_TYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl")
+EXPORT_FIELDS = ("first_name", "last_name", "email", "phone", "birthday")
+# Longest line and most lines of a CSV record accepted by the import, they bound the memory of a bad upload
+MAX_LINE_LENGTH = 64 * 1024
+MAX_RECORD_LINES = 100
+
+
+class LineTooLong(str):
+    """
+        Placeholder iter_lines yields instead of a line longer than its limit, the line itself is dropped.
+    """
+
+
+async def iter_lines(chunks: AsyncIterator[bytes],
+                     max_line_length: int = MAX_LINE_LENGTH) -> AsyncIterator[str]:
+    """
+        Split a stream of utf-8 bytes into lines without holding more than one line in memory. A line longer than
+        max_line_length is skipped up to its line ending and reported by a LineTooLong placeholder, so line numbers
+        stay right.
+
+        :param chunks: Raw body chunks
+        :type chunks: AsyncIterator[bytes]
+        :param max_line_length: Longest line in characters
+        :type max_line_length: int
+
+        :return: Lines including their line endings
+        :rtype: AsyncIterator[str]
+    """
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending, skipping = "", False
+    async for chunk in chunks:
+        *lines, rest = (pending + decoder.decode(chunk)).split("\n")
+        for line in lines:
+            yield LineTooLong() if skipping or len(line) > max_line_length else line + "\n"
+            skipping = False
+        skipping = skipping or len(rest) > max_line_length
+        pending = "" if skipping else rest
+    pending += decoder.decode(b"", final=True)
+    if skipping or len(pending) > max_line_length:
+        yield LineTooLong()
+    elif pending:
+        yield pending
+
+
+class _RecordLines:
+    """
+        Lines of one CSV record for csv.reader, remembers whether the reader asked for more lines than there are,
+        i.e. the record ends inside a quoted field.
+    """
+
+    def __init__(self, lines: list[str]):
+        self.lines = iter(lines)
+        self.exhausted = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> str:
+        try:
+            return next(self.lines)
+        except StopIteration:
+            self.exhausted = True
+            raise
+
+
+async def iter_csv_records(lines: AsyncIterator[str], max_record_lines: int = MAX_RECORD_LINES
+                           ) -> AsyncIterator[tuple[int, dict | None, str | None]]:
+    """
+        Parse CSV records with a header row. Quoted fields may span up to max_record_lines lines. A record that spans
+        several lines and does not parse (a stray quote) is reported at its first line and parsing resumes at its
+        second line, so one bad row does not swallow the rest of the document.
+
+        :param lines: Lines of the CSV document
+        :type lines: AsyncIterator[str]
+        :param max_record_lines: Most lines a record may span
+        :type max_record_lines: int
+
+        :return: (line number, record, None) or (line number, None, parse error) for every record
+        :rtype: AsyncIterator[tuple[int, dict | None, str | None]]
+    """
+    header, line_no, source, done = None, 0, aiter(lines), False
+    # Lines of the current record, and lines to parse again after a bad multi-line record, both (number, line)
+    record: list[tuple[int, str]] = []
+    replay: deque[tuple[int, str]] = deque()
+    while True:
+        if replay:
+            number, line = replay.popleft()
+        elif not done:
+            try:
+                line = await anext(source)
+            except StopAsyncIteration:
+                done = True
+                continue
+            line_no += 1
+            number = line_no
+        elif record:
+            yield record[0][0], None, "Unterminated quoted field"
+            replay.extend(record[1:])
+            record.clear()
+            continue
+        else:
+            break
+
+        if isinstance(line, LineTooLong):
+            if record:
+                yield record[0][0], None, "Unterminated quoted field"
+                replay.extendleft(reversed(record[1:] + [(number, line)]))
+                record.clear()
+            else:
+                yield number, None, "Line too long"
+            continue
+        if not record and not line.strip():
+            continue
+        record.append((number, line))
+        reader_lines = _RecordLines([text for _, text in record])
+        error = None
+        try:
+            values = next(csv.reader(reader_lines))
+        except csv.Error as err:
+            error = str(err)
+        if error is None and reader_lines.exhausted:
+            if len(record) < max_record_lines:
+                continue
+            error = "Unterminated quoted field"
+        if error is None and header is not None and len(values) != len(header):
+            error = f"Expected {len(header)} columns, got {len(values)}"
+        start = record[0][0]
+        if error is not None:
+            yield start, None, error
+            # The first line is the bad one, the others may be fine rows read as part of a quoted field
+            replay.extendleft(reversed(record[1:]))
+            record.clear()
+            continue
+        record.clear()
+        if header is None:
+            header = [value.strip() for value in values]
+            continue
+        yield start, dict(zip(header, values)), None
+
+
+async def iter_ndjson_records(lines: AsyncIterator[str]) -> AsyncIterator[tuple[int, dict | None, str | None]]:
+    """
+        Parse newline delimited JSON objects.
+
+        :param lines: Lines of the NDJSON document
+        :type lines: AsyncIterator[str]
+
+        :return: (line number, record, None) or (line number, None, parse error) for every record
+        :rtype: AsyncIterator[tuple[int, dict | None, str | None]]
+    """
+    line_no = 0
+    async for line in lines:
+        line_no += 1
+        if isinstance(line, LineTooLong):
+            yield line_no, None, "Line too long"
+            continue
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as err:
+            yield line_no, None, f"Invalid JSON: {err}"
+            continue
+        if not isinstance(record, dict):
+            yield line_no, None, "Expected a JSON object"
+            continue
+        yield line_no, record, None
+
+
+def validate_contact(record: dict) -> tuple[ContactBase | None, str | None]:
+    """
+        Validate a parsed record with ContactBase.
+
+        :param record: The parsed record
+        :type record: dict
+
+        :return: The contact body or a readable validation error
+        :rtype: tuple[ContactBase | None, str | None]
+    """
+    try:
+        return ContactBase.model_validate(record), None
+    except ValidationError as err:
+        return None, "; ".join(f"{'.'.join(map(str, error['loc']))}: {error['msg']}" for error in err.errors())
+
+
+async def import_records(user: User, records: AsyncIterator[tuple[int, dict | None, str | None]],
+                         db: Session | AsyncSession, batch_size: int = 1000, max_errors: int = 1000) -> ImportReport:
+    """
+        Validate parsed records and insert them in batches. Memory use is bounded by batch_size and max_errors,
+        not by the number of records.
+
+        :param user: The user to import contacts for
+        :type user: User
+        :param records: Records from iter_csv_records or iter_ndjson_records
+        :type records: AsyncIterator[tuple[int, dict | None, str | None]]
+        :param db: The database session.
+        :type db: Session | AsyncSession
+        :param batch_size: Contacts per INSERT statement
+        :type batch_size: int
+        :param max_errors: Number of failed rows listed in the report, further failures are only counted
+        :type max_errors: int
+
+        :return: The import report
+        :rtype: ImportReport
+    """
+    report = ImportReport()
+    batch: list[ContactBase] = []
+    lines: list[int] = []
+
+    def fail(line_no: int, error: str):
+        report.failed += 1
+        if len(report.errors) < max_errors:
+            report.errors.append(ImportRowError(line=line_no, error=error))
+
+    async def flush():
+        for line_no, error in zip(lines, await repository_contacts.insert_contacts(user, batch, db)):
+            if error is None:
+                report.inserted += 1
+            else:
+                fail(line_no, error)
+        batch.clear()
+        lines.clear()
+
+    async for line_no, record, error in records:
+        body = None
+        if error is None:
+            body, error = validate_contact(record)
+        if error is not None:
+            fail(line_no, error)
+            continue
+        batch.append(body)
+        lines.append(line_no)
+        if len(batch) >= batch_size:
+            await flush()
+    if batch:
+        await flush()
+    report.errors.sort(key=lambda row_error: row_error.line)
+    return report
+
+
+async def export_csv(batches: AsyncIterator[Sequence[Row]]) -> AsyncIterator[str]:
+    """
+        Format batches of contact rows as CSV with a header row, one chunk per batch. The output can be imported back.
+
+        :param batches: Batches from repository.contacts.stream_contacts
+        :type batches: AsyncIterator[Sequence[Row]]
+
+        :return: CSV chunks
+        :rtype: AsyncIterator[str]
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow(EXPORT_FIELDS)
+    async for batch in batches:
+        writer.writerows(batch)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+async def export_ndjson(batches: AsyncIterator[Sequence[Row]]) -> AsyncIterator[str]:
+    """
+        Format batches of contact rows as newline delimited JSON, one chunk per batch.
+
+        :param batches: Batches from repository.contacts.stream_contacts
+        :type batches: AsyncIterator[Sequence[Row]]
+
+        :return: NDJSON chunks
+        :rtype: AsyncIterator[str]
+    """
+    async for batch in batches:
+        yield "".join(json.dumps(dict(zip(EXPORT_FIELDS, row)), default=str) + "\n" for row in batch)
@@ -0,0 +1,64 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from address_book.database.models import User
+from address_book.repository import contacts as repository_contacts
+from address_book.services.cache import contacts_cache
+from address_book.services.pagination import paginate
+from address_book.services.serialization import dump_contact, dump_contacts, pack_page, unpack_page
+
+
+async def read_page(user: User, db: Session | AsyncSession, limit: int, after_id: int | None,
+                    version: str | None) -> tuple[str, str | None]:
+    """
+        Get a serialized page of the user's contacts through the contacts cache.
+
+        :param user: The owner of the contacts
+        :type user: User
+        :param db: The database session.
+        :type db: Session | AsyncSession
+        :param limit: The page size
+        :type limit: int
+        :param after_id: Id of the last contact of the previous page
+        :type after_id: int | None
+        :param version: The user's contacts version, the cache is bypassed without one
+        :type version: str | None
+
+        :return: The JSON document of the page and the next cursor
+        :rtype: tuple[str, str | None]
+    """
+
+    async def load() -> str:
+        rows = await repository_contacts.get_contacts(user, db, limit=limit + 1, after_id=after_id, projected=True)
+        contacts, next_cursor = paginate(rows, limit)
+        return pack_page(dump_contacts(contacts), next_cursor)
+
+    if version is None:
+        return unpack_page(await load())
+    return unpack_page(await contacts_cache.get_or_load(f"{user.id}:{version}:page:{limit}:{after_id}", load))
+
+
+async def read_contact(user: User, contact_id: int, db: Session | AsyncSession, version: str | None) -> str | None:
+    """
+        Get a serialized contact of the user through the contacts cache.
+
+        :param user: The owner of the contact
+        :type user: User
+        :param contact_id: The ID of the contact
+        :type contact_id: int
+        :param db: The database session.
+        :type db: Session | AsyncSession
+        :param version: The user's contacts version, the cache is bypassed without one
+        :type version: str | None
+
+        :return: The JSON document of the contact, None if it does not exist
+        :rtype: str | None
+    """
+
+    async def load() -> str | None:
+        contact = await repository_contacts.get_contact(user, contact_id, db, projected=True)
+        return None if contact is None else dump_contact(contact).decode()
+
+    if version is None:
+        return await load()
+    return await contacts_cache.get_or_load(f"{user.id}:{version}:contact:{contact_id}", load)
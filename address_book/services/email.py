@@ -1,10 +1,11 @@
+from email.message import EmailMessage
+from email.utils import formataddr
 from pathlib import Path
 from address_book.conf.config import settings
-from fastapi_mail import FastMail, MessageSchema, ConnectionConfig, MessageType
-from fastapi_mail.errors import ConnectionErrors
-from pydantic import EmailStr
+from fastapi_mail import ConnectionConfig
 
 from address_book.services.auth import auth_service
+from address_book.services.mailer import EmailDispatcher
 
 conf = ConnectionConfig(
     MAIL_USERNAME=settings.MAIL_USERNAME,
@@ -13,17 +14,34 @@ conf = ConnectionConfig(
     MAIL_PORT=settings.MAIL_PORT,
     MAIL_SERVER=settings.MAIL_SERVER,
     MAIL_FROM_NAME=settings.MAIL_FROM,
-    MAIL_STARTTLS=False,
-    MAIL_SSL_TLS=True,
+    MAIL_STARTTLS=settings.MAIL_STARTTLS,
+    MAIL_SSL_TLS=settings.MAIL_SSL_TLS,
     USE_CREDENTIALS=True,
     VALIDATE_CERTS=True,
     TEMPLATE_FOLDER=Path(__file__).parent / 'templates',
 )
+templates = conf.template_engine()
+
+email_dispatcher = EmailDispatcher(
+    hostname=settings.MAIL_SERVER,
+    port=settings.MAIL_PORT,
+    username=settings.MAIL_USERNAME,
+    password=settings.MAIL_PASSWORD,
+    use_tls=settings.MAIL_SSL_TLS,
+    start_tls=settings.MAIL_STARTTLS,
+    connections=settings.MAIL_POOL_SIZE,
+    batch_size=settings.MAIL_BATCH_SIZE,
+    max_queue=settings.MAIL_QUEUE_SIZE,
+    retries=settings.MAIL_MAX_RETRIES,
+    backoff=settings.MAIL_RETRY_BACKOFF,
+    idle_timeout=settings.MAIL_IDLE_TIMEOUT,
+    drain_timeout=settings.MAIL_DRAIN_TIMEOUT,
+)
 
 
 async def send_email(email, username: str, host: str):
     """
-        Send a confirmation email to the specified email address.
+        Queue a confirmation email to the specified email address on the email dispatcher.
 
         :param email: The recipient's email address
         :type email: str
@@ -32,17 +50,12 @@ async def send_email(email, username: str, host: str):
         :param host: The host URL for the email confirmation link
         :type host: str
     """
-    try:
-        token_verification = await auth_service.create_email_token({"sub": email})
-        message = MessageSchema(
-            subject="Confirm your email ",
-            recipients=[email],
-            template_body={"host": host, "username": username, "token": token_verification},
-            subtype=MessageType.html
-        )
-
-        fm = FastMail(conf)
-        await fm.send_message(message, template_name="email_template.html")
-    except ConnectionErrors as err:
-        print(err)
+    token_verification = await auth_service.create_email_token({"sub": email})
+    message = EmailMessage()
+    message["Subject"] = "Confirm your email "
+    message["From"] = formataddr((conf.MAIL_FROM_NAME, conf.MAIL_FROM))
+    message["To"] = email
+    message.set_content(templates.get_template("email_template.html").render(
+        host=host, username=username, token=token_verification), subtype="html")
+    await email_dispatcher.send(message)
 
@@ -0,0 +1,55 @@
+import hashlib
+
+from fastapi import Response, status
+
+
+def contacts_etag(version: str | None, *parts) -> str | None:
+    """
+        Build the ETag of a contacts read from the user's contacts version and the parameters of the request.
+
+        The version must be read before the contacts are queried: a write in between only makes the response newer
+        than its ETag, which costs the client one full response later and never a stale 304.
+
+        :param version: The user's contacts version from ContactsVersion.get
+        :type version: str | None
+        :param parts: Request parameters that select the response, e.g. page size and cursor
+
+        :return: A strong ETag, or None without a version
+        :rtype: str | None
+    """
+    if version is None:
+        return None
+    digest = hashlib.blake2b(repr(parts).encode(), digest_size=8).hexdigest()
+    return f'"{version}-{digest}"'
+
+
+def etag_matches(if_none_match: str | None, etag: str | None) -> bool:
+    """
+        Weak comparison of an If-None-Match header with an ETag (RFC 9110, 13.1.2).
+
+        :param if_none_match: The If-None-Match header value
+        :type if_none_match: str | None
+        :param etag: The current ETag
+        :type etag: str | None
+
+        :return: True if the client already has the current representation
+        :rtype: bool
+    """
+    if not if_none_match or not etag:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return etag.removeprefix("W/") in (tag.strip().removeprefix("W/") for tag in if_none_match.split(","))
+
+
+def not_modified(etag: str) -> Response:
+    """
+        The 304 Not Modified response for a matching conditional GET.
+
+        :param etag: The current ETag
+        :type etag: str
+
+        :return: An empty response with the ETag header
+        :rtype: Response
+    """
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
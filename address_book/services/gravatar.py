@@ -0,0 +1,18 @@
+from functools import lru_cache
+
+from libgravatar import Gravatar
+
+
+@lru_cache(maxsize=4096)
+def gravatar_url(email: str) -> str:
+    """
+        Gravatar image url of an email, the default avatar of users who did not upload one. Memoized, the url only
+        depends on the email.
+
+        :param email: The user's email
+        :type email: str
+
+        :return: The image url
+        :rtype: str
+    """
+    return Gravatar(email).get_image()
@@ -0,0 +1,145 @@
+import hashlib
+import time
+
+from address_book.services.cache import TTLCache
+
+
+class InvalidToken(Exception):
+    """
+        Raised by every JWT backend for a token that fails verification (signature, expiry, format).
+    """
+
+
+class JoseBackend:
+    """
+        JWT backend on python-jose.
+    """
+    name = "jose"
+
+    def __init__(self):
+        from jose import JWTError, jwt
+        self._jwt = jwt
+        self._error = JWTError
+
+    def encode(self, claims: dict, key: str, algorithm: str) -> str:
+        return self._jwt.encode(claims, key, algorithm=algorithm)
+
+    def decode(self, token: str, key: str, algorithms: list[str]) -> dict:
+        try:
+            return self._jwt.decode(token, key, algorithms=algorithms)
+        except self._error as err:
+            raise InvalidToken(str(err)) from err
+
+
+class PyJWTBackend:
+    """
+        JWT backend on PyJWT, an optional dependency (pip install pyjwt).
+    """
+    name = "pyjwt"
+
+    def __init__(self):
+        import jwt
+        self._jwt = jwt
+        self._error = jwt.PyJWTError
+
+    def encode(self, claims: dict, key: str, algorithm: str) -> str:
+        return self._jwt.encode(claims, key, algorithm=algorithm)
+
+    def decode(self, token: str, key: str, algorithms: list[str]) -> dict:
+        try:
+            # python-jose does not check iat, keep both backends accepting the same tokens
+            return self._jwt.decode(token, key, algorithms=algorithms, options={"verify_iat": False})
+        except self._error as err:
+            raise InvalidToken(str(err)) from err
+
+
+BACKENDS = {backend.name: backend for backend in (JoseBackend, PyJWTBackend)}
+
+
+def get_backend(name: str):
+    """
+        Create a JWT backend by name.
+
+        :param name: "jose" or "pyjwt"
+        :type name: str
+
+        :return: The backend with encode(claims, key, algorithm) and decode(token, key, algorithms)
+        :raises ValueError: For an unknown backend name
+        :raises ImportError: If the library of the backend is not installed
+    """
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown JWT backend '{name}', use one of {', '.join(BACKENDS)}")
+    return BACKENDS[name]()
+
+
+class VerifiedTokenCache:
+    """
+        Bounded cache of the claims of verified tokens keyed by the token's SHA-256 digest. An entry expires at the
+        token's exp claim, tokens without exp are never cached. Only successful verifications are stored.
+
+        Attributes:
+        - local: The TTLCache of claims
+    """
+
+    def __init__(self, maxsize: int = 4096):
+        self.local = TTLCache(maxsize=maxsize, ttl=0)
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token: str) -> dict | None:
+        """
+            Get the claims of a token verified before.
+
+            :param token: The encoded token
+            :type token: str
+
+            :return: A copy of the claims or None
+            :rtype: dict | None
+        """
+        claims = self.local.get(self._key(token))
+        if claims is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return dict(claims)
+
+    def set(self, token: str, claims: dict) -> None:
+        """
+            Store the claims of a verified token until it expires.
+
+            :param token: The encoded token
+            :type token: str
+            :param claims: The verified claims
+            :type claims: dict
+        """
+        exp = claims.get("exp")
+        if not isinstance(exp, (int, float)):
+            return
+        ttl = exp - time.time()
+        if ttl > 0:
+            self.local.set(self._key(token), dict(claims), ttl=ttl)
+
+    def clear(self) -> None:
+        """
+            Remove every entry.
+        """
+        self.local.clear()
+
+    def stats(self) -> dict:
+        """
+            Get hit and miss counters.
+
+            :return: The dictionary of counters and the hit ratio
+            :rtype: dict
+        """
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+            "size": len(self.local),
+        }
@@ -0,0 +1,209 @@
+import asyncio
+import logging
+import time
+from email.message import EmailMessage
+
+import aiosmtplib
+
+from address_book.services.metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+# Errors after which the message is sent again on a fresh connection
+TRANSIENT_ERRORS = (aiosmtplib.SMTPServerDisconnected, aiosmtplib.SMTPConnectError, aiosmtplib.SMTPTimeoutError,
+                    OSError)
+
+
+def _is_transient(err: Exception) -> bool:
+    if isinstance(err, TRANSIENT_ERRORS):
+        return True
+    # 4xx replies are temporary failures, 5xx replies are permanent
+    return isinstance(err, aiosmtplib.SMTPResponseException) and 400 <= err.code < 500
+
+
+class EmailDispatcher:
+    """
+        Sends emails from an async queue over a small pool of long-lived SMTP connections. Every worker owns one
+        connection, takes up to batch_size queued messages at a time and sends them over the same SMTP session,
+        reconnects on demand and closes its connection after idle_timeout seconds without mail.
+
+        Attributes:
+        - connections: Number of workers, each with its own SMTP connection
+        - batch_size: Messages a worker takes from the queue at once
+        - max_queue: Queued messages before send() drops new ones
+        - retries: Additional attempts for transient failures (disconnects, timeouts, 4xx replies)
+        - backoff: Seconds before the first retry, doubled for every further retry
+        - drain_timeout: Seconds stop() waits for the queue to drain before dropping the remaining messages
+        - send_time: Histogram of seconds spent per delivered message
+    """
+
+    def __init__(self, hostname: str, port: int, username: str | None = None, password: str | None = None,
+                 use_tls: bool = False, start_tls: bool = False, validate_certs: bool = True, connections: int = 2,
+                 batch_size: int = 20, max_queue: int = 1000, retries: int = 3, backoff: float = 1.0,
+                 idle_timeout: float = 30.0, timeout: float = 30.0, drain_timeout: float = 10.0):
+        self.hostname = hostname
+        self.port = port
+        self.username = username
+        self.password = password
+        self.use_tls = use_tls
+        self.start_tls = start_tls
+        self.validate_certs = validate_certs
+        self.connections = connections
+        self.batch_size = batch_size
+        self.max_queue = max_queue
+        self.retries = retries
+        self.backoff = backoff
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self.drain_timeout = drain_timeout
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.dropped = 0
+        self.batches = 0
+        self.connects = 0
+        self.send_time = Histogram()
+        self._queue: asyncio.Queue | None = None
+        self._workers: list[asyncio.Task] = []
+
+    @property
+    def running(self) -> bool:
+        return bool(self._workers)
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def start(self) -> None:
+        """
+            Start the workers. Does nothing if they are already running.
+        """
+        if self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.connections)]
+
+    async def stop(self, drain: bool = True) -> None:
+        """
+            Stop the workers and close their connections.
+
+            :param drain: Send the queued messages before stopping, for at most drain_timeout seconds
+            :type drain: bool
+        """
+        if not self.running:
+            return
+        if drain:
+            try:
+                await asyncio.wait_for(self._queue.join(), self.drain_timeout)
+            except asyncio.TimeoutError:
+                logger.error("Email queue not drained after %s s, dropped %d messages", self.drain_timeout,
+                             self.queue_depth)
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def send(self, message: EmailMessage) -> bool:
+        """
+            Queue a message for delivery, starting the workers on first use.
+
+            :param message: The message with From and To headers
+            :type message: EmailMessage
+
+            :return: False if the queue is full and the message was dropped
+            :rtype: bool
+        """
+        await self.start()
+        try:
+            self._queue.put_nowait(message)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            logger.error("Email queue is full, dropped message to %s", message["To"])
+            return False
+        return True
+
+    def _client(self) -> aiosmtplib.SMTP:
+        return aiosmtplib.SMTP(hostname=self.hostname, port=self.port, username=self.username,
+                               password=self.password, use_tls=self.use_tls, start_tls=self.start_tls,
+                               validate_certs=self.validate_certs, timeout=self.timeout)
+
+    async def _connect(self, client: aiosmtplib.SMTP) -> None:
+        if client.is_connected:
+            return
+        await client.connect()
+        self.connects += 1
+
+    @staticmethod
+    async def _close(client: aiosmtplib.SMTP) -> None:
+        if not client.is_connected:
+            return
+        try:
+            await client.quit()
+        except aiosmtplib.SMTPException:
+            client.close()
+
+    async def _deliver(self, client: aiosmtplib.SMTP, message: EmailMessage) -> None:
+        for attempt in range(self.retries + 1):
+            started = time.perf_counter()
+            try:
+                await self._connect(client)
+                await client.send_message(message)
+            except (aiosmtplib.SMTPException, OSError) as err:
+                if not _is_transient(err) or attempt == self.retries:
+                    self.failed += 1
+                    logger.error("Failed to send email to %s: %s", message["To"], err)
+                    return
+                self.retried += 1
+                client.close()
+                await asyncio.sleep(self.backoff * 2 ** attempt)
+                continue
+            self.sent += 1
+            self.send_time.observe(time.perf_counter() - started)
+            return
+
+    async def _worker(self) -> None:
+        client = self._client()
+        try:
+            while True:
+                try:
+                    message = await asyncio.wait_for(self._queue.get(), self.idle_timeout)
+                except asyncio.TimeoutError:
+                    await self._close(client)
+                    message = await self._queue.get()
+                batch = [message]
+                while len(batch) < self.batch_size and not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                self.batches += 1
+                try:
+                    for message in batch:
+                        try:
+                            await self._deliver(client, message)
+                        except Exception:
+                            # A message that cannot be built or sent must not take the worker down with it
+                            self.failed += 1
+                            logger.exception("Unexpected error sending email to %s", message["To"])
+                            client.close()
+                finally:
+                    for _ in batch:
+                        self._queue.task_done()
+        finally:
+            await self._close(client)
+
+    def stats(self) -> dict:
+        """
+            Get dispatcher metrics.
+
+            :return: The dictionary of queue depth, delivery counters and the send time histogram
+            :rtype: dict
+        """
+        return {
+            "connections": self.connections,
+            "queue_depth": self.queue_depth,
+            "sent": self.sent,
+            "failed": self.failed,
+            "retried": self.retried,
+            "dropped": self.dropped,
+            "batches": self.batches,
+            "connects": self.connects,
+            "send_time_seconds": self.send_time.snapshot(),
+        }
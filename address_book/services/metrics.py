@@ -0,0 +1,182 @@
+import threading
+from bisect import bisect_left
+
+
+class Histogram:
+    """
+        Cumulative histogram of observed values with fixed upper bounds.
+
+        Attributes:
+        - buckets: Sorted bucket upper bounds, an implicit +Inf bucket is always added
+        - counts: Number of observations per bucket (not cumulative)
+        - sum: Sum of all observed values
+        - count: Number of observations
+    """
+    default_buckets = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self, buckets: tuple[float, ...] = default_buckets):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        """
+            Record an observation.
+
+            :param value: Observed value, usually seconds
+            :type value: float
+        """
+        with self._lock:
+            self.counts[bisect_left(self.buckets, value)] += 1
+            self.sum += value
+            self.count += 1
+
+    def snapshot(self) -> dict:
+        """
+            Get cumulative bucket counts.
+
+            :return: The dictionary with buckets (upper bound -> cumulative count), sum and count
+            :rtype: dict
+        """
+        cumulative, buckets = 0, {}
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            cumulative += count
+            buckets["+Inf" if bound == float("inf") else str(bound)] = cumulative
+        return {"buckets": buckets, "sum": self.sum, "count": self.count}
+
+
+class Gauge:
+    """
+        Value that goes up and down, e.g. requests in flight.
+    """
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1) -> None:
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1) -> None:
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class MetricFamily:
+    """
+        Metrics of one name with a child Histogram or Gauge per label combination, rendered in the Prometheus text
+        exposition format.
+
+        Attributes:
+        - name: Metric name
+        - documentation: HELP text
+        - kind: "histogram" or "gauge"
+        - labelnames: Names of the labels
+        - buckets: Histogram bucket upper bounds
+    """
+
+    def __init__(self, name: str, documentation: str, kind: str, labelnames: tuple[str, ...] = (),
+                 buckets: tuple[float, ...] = Histogram.default_buckets):
+        if kind not in ("histogram", "gauge"):
+            raise ValueError(f"Unknown metric kind '{kind}'")
+        self.name = name
+        self.documentation = documentation
+        self.kind = kind
+        self.labelnames = tuple(labelnames)
+        self.buckets = buckets
+        self._children: dict[tuple[str, ...], Histogram | Gauge] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values: str) -> Histogram | Gauge:
+        """
+            Get the child metric of a label combination, creating it on first use.
+
+            :param values: Label values in the order of labelnames
+            :type values: str
+
+            :return: The Histogram or Gauge
+            :rtype: Histogram | Gauge
+        """
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            with self._lock:
+                child = self._children.setdefault(
+                    values, Histogram(self.buckets) if self.kind == "histogram" else Gauge())
+        return child
+
+    def render(self) -> list[str]:
+        """
+            Render the family in the Prometheus text format.
+
+            :return: The lines of the family
+            :rtype: list[str]
+        """
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in list(self._children.items()):
+            if isinstance(child, Gauge):
+                lines.append(f"{self.name}{_labels(self.labelnames, values)} {child.value:g}")
+                continue
+            snapshot = child.snapshot()
+            for bound, count in snapshot["buckets"].items():
+                le = 'le="%s"' % bound
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, values, le)} {count}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, values)} {snapshot['sum']:g}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, values)} {snapshot['count']}")
+        return lines
+
+
+class Registry:
+    """
+        Collection of metric families and collector callbacks served by the /metrics endpoint.
+    """
+
+    def __init__(self):
+        self.families: list[MetricFamily] = []
+        self.collectors = []
+
+    def register(self, family: MetricFamily) -> MetricFamily:
+        self.families.append(family)
+        return family
+
+    def add_collector(self, collector) -> None:
+        """
+            Register a callable that updates gauges right before they are rendered, for values that are read rather
+            than recorded (pool sizes, queue depths).
+        """
+        self.collectors.append(collector)
+
+    def render(self) -> str:
+        """
+            Render every family in the Prometheus text format.
+
+            :return: The exposition document
+            :rtype: str
+        """
+        for collector in self.collectors:
+            collector()
+        lines = []
+        for family in self.families:
+            lines.extend(family.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
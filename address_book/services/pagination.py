@@ -0,0 +1,70 @@
+import base64
+import binascii
+import json
+from typing import Callable, Sequence, TypeVar
+
+from fastapi import HTTPException, status
+
+T = TypeVar("T")
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(*key: int | float) -> str:
+    """
+        Build an opaque cursor pointing right after a row.
+
+        :param key: Sort key of the last row of the current page, e.g. its id
+        :type key: int | float
+
+        :return: The url-safe cursor string
+        :rtype: str
+    """
+    return base64.urlsafe_b64encode(json.dumps(list(key)).encode()).rstrip(b"=").decode()
+
+
+def decode_cursor(cursor: str | None, size: int = 1) -> tuple | None:
+    """
+        Decode a cursor created by encode_cursor.
+
+        :param cursor: The cursor string or None for the first page
+        :type cursor: str | None
+        :param size: Expected number of sort key values
+        :type size: int
+
+        :return: Sort key of the last row of the previous page, None for the first page
+        :rtype: tuple | None
+        :raises HTTPException: 400 when the cursor is malformed
+    """
+    if not cursor:
+        return None
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (binascii.Error, ValueError):
+        key = None
+    if not isinstance(key, list) or len(key) != size \
+            or not all(isinstance(value, (int, float)) and not isinstance(value, bool) for value in key):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+    return tuple(key)
+
+
+def paginate(rows: Sequence[T] | None, limit: int,
+             key: Callable[[T], tuple] = lambda row: (row.id,)) -> tuple[list[T], str | None]:
+    """
+        Split rows fetched with limit + 1 into a page and the cursor of the next page.
+
+        :param rows: Rows in keyset order, at most limit + 1 of them
+        :type rows: Sequence[T] | None
+        :param limit: Page size
+        :type limit: int
+        :param key: Returns the sort key of a row (default is its id)
+        :type key: Callable[[T], tuple]
+
+        :return: The page and the next cursor, None when this is the last page
+        :rtype: tuple[list[T], str | None]
+    """
+    rows = list(rows or [])
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, encode_cursor(*key(rows[-1]))
+    return rows, None
@@ -0,0 +1,351 @@
+import json
+import logging
+import math
+import time
+
+from redis.exceptions import RedisError
+
+from address_book.conf.config import settings
+from address_book.services.cache import TTLCache, get_redis
+from address_book.services.jwt_backends import InvalidToken
+
+logger = logging.getLogger(__name__)
+
+# Token buckets of all keys are checked and, only if every one has a token, charged together in a single round trip.
+# State is a hash {tokens, ts}, time comes from the redis server so the workers do not need synchronized clocks.
+TOKEN_BUCKET_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local tokens = {}
+local retry = 0
+for i = 1, #KEYS do
+    local rate = tonumber(ARGV[2 * i - 1])
+    local burst = tonumber(ARGV[2 * i])
+    local state = redis.call('HMGET', KEYS[i], 'tokens', 'ts')
+    local available = tonumber(state[1]) or burst
+    local ts = tonumber(state[2]) or now
+    available = math.min(burst, available + math.max(0, now - ts) * rate)
+    tokens[i] = available
+    if available < 1 then
+        retry = math.max(retry, (1 - available) / rate)
+    end
+end
+local allowed = 0
+if retry == 0 then
+    allowed = 1
+end
+for i = 1, #KEYS do
+    local rate = tonumber(ARGV[2 * i - 1])
+    local burst = tonumber(ARGV[2 * i])
+    redis.call('HSET', KEYS[i], 'tokens', tostring(tokens[i] - allowed), 'ts', tostring(now))
+    redis.call('PEXPIRE', KEYS[i], math.ceil(burst / rate * 1000))
+end
+return {allowed, tostring(retry)}
+"""
+
+
+class RatePolicy:
+    """
+        Token bucket policy: up to `times` requests at once, refilled at times/seconds requests per second.
+
+        Attributes:
+        - times: Bucket size (burst)
+        - seconds: Seconds to refill an empty bucket
+    """
+
+    def __init__(self, times: int, seconds: float):
+        if times < 1 or seconds <= 0:
+            raise ValueError("A rate policy needs times >= 1 and seconds > 0")
+        self.times = times
+        self.seconds = seconds
+
+    @property
+    def rate(self) -> float:
+        return self.times / self.seconds
+
+    @classmethod
+    def parse(cls, value: str) -> "RatePolicy":
+        """
+            Parse a policy written as "<times>/<seconds>", e.g. "2/5" for two requests per five seconds.
+
+            :param value: The policy string
+            :type value: str
+
+            :return: The policy
+            :rtype: RatePolicy
+            :raises ValueError: For a malformed policy
+        """
+        times, _, seconds = value.partition("/")
+        try:
+            return cls(int(times), float(seconds))
+        except ValueError:
+            raise ValueError(f"Invalid rate limit '{value}', expected '<times>/<seconds>'") from None
+
+    def __repr__(self):
+        return f"RatePolicy({self.times}/{self.seconds:g})"
+
+
+class LocalBuckets:
+    """
+        In-process token buckets, the same algorithm as TOKEN_BUCKET_SCRIPT.
+
+        Every worker only sees its own share of the traffic, so a client that empties a local bucket is over the
+        limit for sure and can be rejected without asking redis. Keys also remember the retry time of the last
+        redis rejection.
+
+        Attributes:
+        - local: TTLCache of (tokens, timestamp) per key, an idle entry expires once its bucket would be full
+    """
+
+    def __init__(self, maxsize: int = 10000):
+        self.local = TTLCache(maxsize=maxsize, ttl=60)
+        self.blocked = TTLCache(maxsize=maxsize, ttl=60)
+
+    def _refill(self, key: str, policy: RatePolicy, now: float) -> float:
+        tokens, ts = self.local.get(key, (policy.times, now))
+        return min(policy.times, tokens + max(0.0, now - ts) * policy.rate)
+
+    def acquire(self, keys: list[tuple[str, RatePolicy]]) -> float:
+        """
+            Take a token from every bucket if all of them have one.
+
+            :param keys: Pairs of bucket key and policy
+            :type keys: list[tuple[str, RatePolicy]]
+
+            :return: 0 if the request is allowed, otherwise the seconds until it would be
+            :rtype: float
+        """
+        now = time.monotonic()
+        retry = max((self.blocked.get(key, now) - now for key, _ in keys), default=0.0)
+        tokens = [self._refill(key, policy, now) for key, policy in keys]
+        for available, (_, policy) in zip(tokens, keys):
+            if available < 1:
+                retry = max(retry, (1 - available) / policy.rate)
+        charge = 0 if retry > 0 else 1
+        for available, (key, policy) in zip(tokens, keys):
+            self.local.set(key, (available - charge, now), ttl=policy.seconds)
+        return retry
+
+    def refund(self, keys: list[tuple[str, RatePolicy]]) -> None:
+        """
+            Give back the token acquire() took, for a request redis rejected.
+
+            :param keys: Pairs of bucket key and policy
+            :type keys: list[tuple[str, RatePolicy]]
+        """
+        now = time.monotonic()
+        for key, policy in keys:
+            self.local.set(key, (min(policy.times, self._refill(key, policy, now) + 1), now), ttl=policy.seconds)
+
+    def block(self, keys: list[tuple[str, RatePolicy]], seconds: float) -> None:
+        """
+            Reject the keys locally for some time, after redis found them over the limit.
+
+            :param keys: Pairs of bucket key and policy
+            :type keys: list[tuple[str, RatePolicy]]
+            :param seconds: Seconds until redis would allow a request
+            :type seconds: float
+        """
+        until = time.monotonic() + seconds
+        for key, _ in keys:
+            self.blocked.set(key, until, ttl=seconds)
+
+    def clear(self) -> None:
+        """
+            Forget every bucket.
+        """
+        self.local.clear()
+        self.blocked.clear()
+
+
+class RateLimiter:
+    """
+        Application-wide rate limiting. Every request is charged against the bucket of its client, the user from a
+        valid bearer token or else the IP address, and against the bucket of the route if the route has a policy
+        of its own. Buckets are shared through redis, one script call per request. Without redis, or on redis
+        errors, the local buckets alone limit each worker.
+
+        Attributes:
+        - user_policy: Policy per authenticated user
+        - ip_policy: Policy per IP address for anonymous requests
+        - route_policies: Policies keyed by "<METHOD> <path>", charged per client in addition to the client's one
+        - exempt: Path prefixes that are never limited
+        - local_precheck: Reject clients over the limit of the local buckets without asking redis
+        - trust_forwarded: Take the client IP from X-Forwarded-For (only behind a trusted proxy)
+        - prefix: Redis key prefix
+    """
+
+    def __init__(self, user_policy: RatePolicy, ip_policy: RatePolicy, route_policies: dict[str, RatePolicy] = None,
+                 exempt: tuple[str, ...] = (), local_precheck: bool = True, trust_forwarded: bool = False,
+                 prefix: str = "ratelimit:", local_size: int = 10000):
+        self.user_policy = user_policy
+        self.ip_policy = ip_policy
+        self.route_policies = route_policies or {}
+        self.exempt = tuple(exempt)
+        self.local_precheck = local_precheck
+        self.trust_forwarded = trust_forwarded
+        self.prefix = prefix
+        self.buckets = LocalBuckets(maxsize=local_size)
+        self.allowed = 0
+        self.rejected = 0
+        self.rejected_locally = 0
+        self.errors = 0
+        self._script = None
+        self._script_redis = None
+
+    @classmethod
+    def from_settings(cls) -> "RateLimiter":
+        """
+            Build the limiter from the RATE_LIMIT_* settings.
+
+            :return: The limiter
+            :rtype: RateLimiter
+        """
+        return cls(user_policy=RatePolicy.parse(settings.RATE_LIMIT_USER),
+                   ip_policy=RatePolicy.parse(settings.RATE_LIMIT_IP),
+                   route_policies={route: RatePolicy.parse(policy)
+                                   for route, policy in settings.RATE_LIMIT_ROUTES.items()},
+                   exempt=tuple(settings.RATE_LIMIT_EXEMPT), local_precheck=settings.RATE_LIMIT_LOCAL_PRECHECK,
+                   trust_forwarded=settings.RATE_LIMIT_TRUST_FORWARDED)
+
+    def client_ip(self, scope: dict) -> str:
+        if self.trust_forwarded:
+            for name, value in scope.get("headers", ()):
+                if name == b"x-forwarded-for":
+                    return value.decode("latin-1").split(",")[0].strip()
+        client = scope.get("client")
+        return client[0] if client else "unknown"
+
+    @staticmethod
+    def token_subject(scope: dict) -> str | None:
+        for name, value in scope.get("headers", ()):
+            if name == b"authorization":
+                scheme, _, token = value.decode("latin-1").partition(" ")
+                if scheme.lower() != "bearer" or not token:
+                    return None
+                # Imported here, the auth service pulls in the database layer
+                from address_book.services.auth import auth_service
+                try:
+                    return auth_service.decode_token(token).get("sub")
+                except InvalidToken:
+                    return None
+        return None
+
+    def keys(self, scope: dict) -> list[tuple[str, RatePolicy]]:
+        """
+            Get the buckets a request is charged against.
+
+            :param scope: The ASGI scope of an HTTP request
+            :type scope: dict
+
+            :return: Pairs of bucket key and policy, empty for exempt paths
+            :rtype: list[tuple[str, RatePolicy]]
+        """
+        path = scope["path"]
+        if path.startswith(self.exempt):
+            return []
+        subject = self.token_subject(scope)
+        if subject:
+            client, policy = f"user:{subject}", self.user_policy
+        else:
+            client, policy = f"ip:{self.client_ip(scope)}", self.ip_policy
+        # The client in a hash tag keeps all keys of a request in one redis cluster slot
+        keys = [(f"{self.prefix}{{{client}}}", policy)]
+        route = f"{scope['method']} {path}"
+        route_policy = self.route_policies.get(route)
+        if route_policy is not None:
+            keys.append((f"{self.prefix}{{{client}}}:{route}", route_policy))
+        return keys
+
+    async def _acquire_redis(self, redis, keys: list[tuple[str, RatePolicy]]) -> float:
+        if self._script is None or self._script_redis is not redis:
+            self._script = redis.register_script(TOKEN_BUCKET_SCRIPT)
+            self._script_redis = redis
+        args = []
+        for _, policy in keys:
+            args += [policy.rate, policy.times]
+        allowed, retry = await self._script(keys=[key for key, _ in keys], args=args)
+        return 0.0 if int(allowed) else float(retry)
+
+    async def acquire(self, keys: list[tuple[str, RatePolicy]]) -> float:
+        """
+            Charge a request against its buckets.
+
+            :param keys: Pairs of bucket key and policy from keys()
+            :type keys: list[tuple[str, RatePolicy]]
+
+            :return: 0 if the request is allowed, otherwise the seconds until it would be
+            :rtype: float
+        """
+        if not keys:
+            return 0.0
+        redis = get_redis()
+        charged = self.local_precheck or redis is None
+        if charged:
+            retry = self.buckets.acquire(keys)
+            if retry > 0:
+                self.rejected += 1
+                self.rejected_locally += 1
+                return retry
+        if redis is not None:
+            try:
+                retry = await self._acquire_redis(redis, keys)
+            except RedisError as err:
+                self.errors += 1
+                logger.warning("Rate limit store is not available, using the local buckets: %s", err)
+                retry = 0.0 if charged else self.buckets.acquire(keys)
+            if retry > 0:
+                # Only admitted requests use up the local share, the local limit stays the global policy
+                if charged:
+                    self.buckets.refund(keys)
+                self.buckets.block(keys, retry)
+        if retry > 0:
+            self.rejected += 1
+            return retry
+        self.allowed += 1
+        return 0.0
+
+    def stats(self) -> dict:
+        """
+            Get rate limit counters.
+
+            :return: The dictionary of allowed and rejected requests
+            :rtype: dict
+        """
+        return {
+            "allowed": self.allowed,
+            "rejected": self.rejected,
+            "rejected_locally": self.rejected_locally,
+            "errors": self.errors,
+            "local_buckets": len(self.buckets.local),
+        }
+
+
+class RateLimitMiddleware:
+    """
+        ASGI middleware that answers 429 Too Many Requests with a Retry-After header for requests over the limit.
+    """
+
+    def __init__(self, app, limiter: RateLimiter | None = None):
+        self.app = app
+        self.limiter = limiter or rate_limiter
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] == "OPTIONS":
+            await self.app(scope, receive, send)
+            return
+        retry = await self.limiter.acquire(self.limiter.keys(scope))
+        if retry <= 0:
+            await self.app(scope, receive, send)
+            return
+        body = json.dumps({"detail": "Too Many Requests"}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode()),
+                        (b"retry-after", str(math.ceil(retry)).encode())],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+
+rate_limiter = RateLimiter.from_settings()
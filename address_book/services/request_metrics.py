@@ -0,0 +1,115 @@
+import time
+from contextvars import ContextVar
+
+from address_book.services.metrics import MetricFamily, registry
+
+# Queries per request are counted, not timed
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+http_request_duration = registry.register(MetricFamily(
+    "http_request_duration_seconds", "Time to answer an HTTP request.", "histogram",
+    ("method", "route", "status")))
+http_requests_in_flight = registry.register(MetricFamily(
+    "http_requests_in_flight", "HTTP requests being answered.", "gauge")).labels()
+db_queries_per_request = registry.register(MetricFamily(
+    "http_request_db_queries", "Database queries run by an HTTP request.", "histogram", ("method", "route"),
+    buckets=QUERY_COUNT_BUCKETS))
+db_time_per_request = registry.register(MetricFamily(
+    "http_request_db_seconds", "Time an HTTP request spent in database queries.", "histogram", ("method", "route")))
+db_query_duration = registry.register(MetricFamily(
+    "db_query_duration_seconds", "Time of a database query, in requests or not.", "histogram")).labels()
+
+
+class QueryStats:
+    """
+        Database queries of one request, filled by the cursor execute hooks of the engines.
+
+        Attributes:
+        - count: Number of queries
+        - seconds: Time spent in the queries
+    """
+    __slots__ = ("count", "seconds")
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+
+# Set by MetricsMiddleware for the duration of a request, None outside of requests
+current_queries: ContextVar[QueryStats | None] = ContextVar("current_queries", default=None)
+
+
+def record_query(seconds: float) -> None:
+    """
+        Account a finished database query to the current request.
+
+        :param seconds: The query time
+        :type seconds: float
+    """
+    db_query_duration.observe(seconds)
+    stats = current_queries.get()
+    if stats is not None:
+        stats.count += 1
+        stats.seconds += seconds
+
+
+def route_template(scope: dict) -> str:
+    """
+        Get the full path template of the matched route ("/api/contacts/get/{contact_id}"), so ids in paths do not
+        create a label value each.
+
+        :param scope: The ASGI scope after routing
+        :type scope: dict
+
+        :return: The template, or "unmatched" for requests no route answered
+        :rtype: str
+    """
+    route = scope.get("route")
+    path_format = getattr(route, "path_format", None)
+    if path_format is None:
+        return "unmatched"
+    # Routes of included routers may keep their router-relative template ("/contacts/get/{contact_id}"), the prefixes
+    # of the routers are the part of the request path in front of what the route itself matched
+    path = scope.get("path", "")
+    start = 0
+    while start != -1:
+        if route.path_regex.match(path[start:]):
+            return path[:start] + path_format
+        start = path.find("/", start + 1)
+    return path_format
+
+
+class MetricsMiddleware:
+    """
+        ASGI middleware that records the latency and the database queries of every HTTP request per route, and the
+        number of requests in flight.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        stats = QueryStats()
+        token = current_queries.set(stats)
+        status = [500]
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        http_requests_in_flight.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            http_requests_in_flight.dec()
+            current_queries.reset(token)
+            route = route_template(scope)
+            http_request_duration.labels(scope["method"], route, str(status[0])).observe(elapsed)
+            db_queries_per_request.labels(scope["method"], route).observe(stats.count)
+            db_time_per_request.labels(scope["method"], route).observe(stats.seconds)
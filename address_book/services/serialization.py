@@ -0,0 +1,77 @@
+from typing import Any, List
+
+from fastapi import Response
+from pydantic import TypeAdapter
+
+from address_book.schemas import ContactResponse
+
+# Built once, FastAPI would otherwise run the same validation per request on top of its own bookkeeping
+CONTACT_LIST = TypeAdapter(List[ContactResponse])
+CONTACT = TypeAdapter(ContactResponse)
+
+
+def dump_contacts(contacts: Any) -> bytes:
+    """
+        Serialize contacts to a JSON array in one pass through pydantic-core.
+
+        :param contacts: ORM contacts or any objects with the ContactResponse attributes
+        :type contacts: Any
+
+        :return: The JSON document
+        :rtype: bytes
+    """
+    return CONTACT_LIST.dump_json(CONTACT_LIST.validate_python(contacts, from_attributes=True))
+
+
+def dump_contact(contact: Any) -> bytes:
+    """
+        Serialize one contact to a JSON object.
+
+        :param contact: ORM contact or any object with the ContactResponse attributes
+        :type contact: Any
+
+        :return: The JSON document
+        :rtype: bytes
+    """
+    return CONTACT.dump_json(CONTACT.validate_python(contact, from_attributes=True))
+
+
+def pack_page(body: bytes, next_cursor: str | None) -> str:
+    """
+        Pack a serialized page and its next cursor into one cache value: the cursor on the first line, then the body.
+        Cursors are urlsafe base64 and never contain a line break.
+
+        :param body: The JSON document of the page
+        :type body: bytes
+        :param next_cursor: The X-Next-Cursor value or None on the last page
+        :type next_cursor: str | None
+
+        :return: The cache value
+        :rtype: str
+    """
+    return f"{next_cursor or ''}\n{body.decode()}"
+
+
+def unpack_page(value: str) -> tuple[str, str | None]:
+    """
+        Split a cache value made by pack_page.
+
+        :param value: The cache value
+        :type value: str
+
+        :return: The JSON document of the page and the next cursor
+        :rtype: tuple[str, str | None]
+    """
+    next_cursor, _, body = value.partition("\n")
+    return body, next_cursor or None
+
+
+class ContactListResponse(Response):
+    """
+        JSON response of a list of contacts. Routes return it directly, so FastAPI skips jsonable_encoder and its
+        response_model validation, the response_model of the route is still used for the OpenAPI schema.
+    """
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dump_contacts(content)
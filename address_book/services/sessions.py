@@ -0,0 +1,295 @@
+import enum
+import logging
+import time
+import uuid
+
+from redis.asyncio import Redis
+from redis.exceptions import RedisError, WatchError
+
+from address_book.conf.config import settings
+from address_book.services.cache import TTLCache, get_redis
+
+logger = logging.getLogger(__name__)
+
+
+class Rotation(enum.Enum):
+    """
+        Outcome of RefreshSessionStore.rotate.
+    """
+    ROTATED = "rotated"
+    # The token was already exchanged: the session has been revoked
+    REUSED = "reused"
+    # The session expired, was revoked or belongs to another user
+    MISSING = "missing"
+
+
+def new_token_id() -> str:
+    """
+        Generate a random session or token id.
+
+        :return: 32 hex characters
+        :rtype: str
+    """
+    return uuid.uuid4().hex
+
+
+def _decode(data: dict) -> dict:
+    return {(k.decode() if isinstance(k, bytes) else k): (v.decode() if isinstance(v, bytes) else v)
+            for k, v in data.items()}
+
+
+def _public(sid: str, data: dict) -> dict:
+    return {
+        "sid": sid,
+        "device": data.get("device") or None,
+        "created_at": float(data["created_at"]),
+        "refreshed_at": float(data["refreshed_at"]),
+    }
+
+
+class RefreshSessionStore:
+    """
+        Refresh token sessions, one per login on a device. A session holds the id (jti) of the only refresh token
+        that may be exchanged next and every refresh replaces it. Presenting an older token of the session means
+        it was copied, so the session is revoked (reuse detection).
+
+        In redis a session is the hash <prefix><sid> that expires with its refresh token, and <prefix>user:<email>
+        is the set of the user's session ids for listing and bulk revoke. Without redis the sessions are kept in
+        process memory, which is only correct with a single worker.
+
+        Attributes:
+        - ttl: Lifetime of a refresh token in seconds, renewed on every rotation
+        - local: In-process TTLCache of sessions used when redis is not available
+        - prefix: Redis key prefix
+    """
+
+    def __init__(self, ttl: int = 604800, maxsize: int = 100000, prefix: str = "session:"):
+        self.ttl = ttl
+        self.prefix = prefix
+        self.local = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._local_index: dict[str, set[str]] = {}
+        self.created = 0
+        self.rotated = 0
+        self.reused = 0
+        self.revoked = 0
+
+    def _key(self, sid: str) -> str:
+        return self.prefix + sid
+
+    def _index(self, email: str) -> str:
+        return f"{self.prefix}user:{email}"
+
+    async def create(self, email: str, jti: str, device: str | None = None) -> str:
+        """
+            Open a session for a new login.
+
+            :param email: The user's email
+            :type email: str
+            :param jti: The id of the refresh token issued with the session
+            :type jti: str
+            :param device: Free-form device description, e.g. the User-Agent
+            :type device: str | None
+
+            :return: The session id
+            :rtype: str
+        """
+        sid = new_token_id()
+        now = str(time.time())
+        data = {"email": email, "jti": jti, "device": device or "", "created_at": now, "refreshed_at": now}
+        self.created += 1
+        redis = get_redis()
+        if redis is not None:
+            try:
+                async with redis.pipeline(transaction=True) as pipe:
+                    pipe.hset(self._key(sid), mapping=data)
+                    pipe.expire(self._key(sid), self.ttl)
+                    pipe.sadd(self._index(email), sid)
+                    pipe.expire(self._index(email), self.ttl)
+                    await pipe.execute()
+                return sid
+            except RedisError as err:
+                logger.warning("Session store is not available, keeping the session in memory: %s", err)
+        self.local.set(sid, data)
+        self._local_index.setdefault(email, set()).add(sid)
+        return sid
+
+    async def _rotate_redis(self, redis: Redis, email: str, sid: str, jti: str, new_jti: str) -> Rotation:
+        key = self._key(sid)
+        async with redis.pipeline(transaction=True) as pipe:
+            while True:
+                try:
+                    await pipe.watch(key)
+                    data = _decode(await pipe.hgetall(key))
+                    if not data or data.get("email") != email:
+                        await pipe.unwatch()
+                        return Rotation.MISSING
+                    pipe.multi()
+                    if data.get("jti") != jti:
+                        pipe.delete(key)
+                        pipe.srem(self._index(email), sid)
+                        await pipe.execute()
+                        return Rotation.REUSED
+                    pipe.hset(key, mapping={"jti": new_jti, "refreshed_at": str(time.time())})
+                    pipe.expire(key, self.ttl)
+                    pipe.expire(self._index(email), self.ttl)
+                    await pipe.execute()
+                    return Rotation.ROTATED
+                except WatchError:
+                    # A concurrent refresh of the same session changed it, check again
+                    continue
+
+    def _rotate_local(self, email: str, sid: str, jti: str, new_jti: str) -> Rotation:
+        data = self.local.get(sid)
+        if data is None or data["email"] != email:
+            return Rotation.MISSING
+        if data["jti"] != jti:
+            self._revoke_local(email, sid)
+            return Rotation.REUSED
+        self.local.set(sid, dict(data, jti=new_jti, refreshed_at=str(time.time())))
+        return Rotation.ROTATED
+
+    async def rotate(self, email: str, sid: str, jti: str, new_jti: str) -> Rotation:
+        """
+            Exchange the current refresh token of a session for a new one, atomically.
+
+            :param email: The user's email from the presented token
+            :type email: str
+            :param sid: The session id from the presented token
+            :type sid: str
+            :param jti: The id of the presented token
+            :type jti: str
+            :param new_jti: The id of the token issued instead
+            :type new_jti: str
+
+            :return: ROTATED, REUSED if the presented token was exchanged before (the session is revoked), or MISSING
+            :rtype: Rotation
+        """
+        result = None
+        redis = get_redis()
+        if redis is not None:
+            try:
+                result = await self._rotate_redis(redis, email, sid, jti, new_jti)
+            except RedisError as err:
+                logger.warning("Session store is not available, using the in-memory sessions: %s", err)
+        if result is None:
+            result = self._rotate_local(email, sid, jti, new_jti)
+        if result is Rotation.ROTATED:
+            self.rotated += 1
+        elif result is Rotation.REUSED:
+            self.reused += 1
+            logger.warning("Refresh token reuse detected, revoked session %s of %s", sid, email)
+        return result
+
+    def _revoke_local(self, email: str, sid: str) -> bool:
+        data = self.local.get(sid)
+        self._local_index.get(email, set()).discard(sid)
+        if data is None or data["email"] != email:
+            return False
+        self.local.delete(sid)
+        return True
+
+    async def revoke(self, email: str, sid: str) -> bool:
+        """
+            Revoke one session of a user, e.g. on logout.
+
+            :param email: The user's email
+            :type email: str
+            :param sid: The session id
+            :type sid: str
+
+            :return: True if the session existed
+            :rtype: bool
+        """
+        revoked = self._revoke_local(email, sid)
+        redis = get_redis()
+        if redis is not None:
+            try:
+                # Only sessions listed for this user are deleted, a sid alone must not revoke someone else's session
+                if await redis.srem(self._index(email), sid):
+                    await redis.delete(self._key(sid))
+                    revoked = True
+            except RedisError as err:
+                logger.warning("Session store is not available: %s", err)
+        if revoked:
+            self.revoked += 1
+        return revoked
+
+    async def revoke_all(self, email: str) -> int:
+        """
+            Revoke every session of a user, e.g. after a password change or a compromised account.
+
+            :param email: The user's email
+            :type email: str
+
+            :return: The number of revoked sessions
+            :rtype: int
+        """
+        count = sum(self._revoke_local(email, sid) for sid in list(self._local_index.pop(email, ())))
+        redis = get_redis()
+        if redis is not None:
+            try:
+                sids = [sid.decode() if isinstance(sid, bytes) else sid
+                        for sid in await redis.smembers(self._index(email))]
+                if sids:
+                    count += await redis.delete(*(self._key(sid) for sid in sids))
+                await redis.delete(self._index(email))
+            except RedisError as err:
+                logger.warning("Session store is not available: %s", err)
+        self.revoked += count
+        return count
+
+    async def list(self, email: str) -> list[dict]:
+        """
+            List the active sessions of a user.
+
+            :param email: The user's email
+            :type email: str
+
+            :return: Dictionaries with sid, device, created_at and refreshed_at (unix times), newest first
+            :rtype: list[dict]
+        """
+        sessions = []
+        for sid in list(self._local_index.get(email, ())):
+            data = self.local.get(sid)
+            if data is None:
+                self._local_index[email].discard(sid)
+            else:
+                sessions.append(_public(sid, data))
+        redis = get_redis()
+        if redis is not None:
+            try:
+                sids = [sid.decode() if isinstance(sid, bytes) else sid
+                        for sid in await redis.smembers(self._index(email))]
+                async with redis.pipeline(transaction=False) as pipe:
+                    for sid in sids:
+                        pipe.hgetall(self._key(sid))
+                    rows = await pipe.execute() if sids else []
+                expired = []
+                for sid, data in zip(sids, rows):
+                    if data:
+                        sessions.append(_public(sid, _decode(data)))
+                    else:
+                        expired.append(sid)
+                if expired:
+                    await redis.srem(self._index(email), *expired)
+            except RedisError as err:
+                logger.warning("Session store is not available: %s", err)
+        return sorted(sessions, key=lambda session: session["created_at"], reverse=True)
+
+    def stats(self) -> dict:
+        """
+            Get session counters.
+
+            :return: The dictionary of counters and the number of in-memory sessions
+            :rtype: dict
+        """
+        return {
+            "created": self.created,
+            "rotated": self.rotated,
+            "reused": self.reused,
+            "revoked": self.revoked,
+            "local_size": len(self.local),
+        }
+
+
+refresh_sessions = RefreshSessionStore(ttl=settings.REFRESH_TOKEN_TTL)
@@ -0,0 +1,101 @@
+import asyncio
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable
+
+from address_book.services.metrics import Histogram
+
+
+class PoolSaturated(Exception):
+    """
+        Raised when a BoundedExecutor already holds as many jobs as it accepts.
+    """
+
+
+def _timed_call(fn: Callable, submitted_at: float, *args) -> tuple[float, Any]:
+    return time.time() - submitted_at, fn(*args)
+
+
+class BoundedExecutor:
+    """
+        Runs blocking callables on a thread or process pool with a bounded backlog.
+
+        Attributes:
+        - workers: Number of pool workers
+        - max_queue: Number of jobs allowed to wait for a free worker, further jobs raise PoolSaturated
+        - kind: "thread" or "process"
+        - wait_time: Histogram of seconds a job waited before a worker picked it up
+    """
+
+    def __init__(self, workers: int = 4, max_queue: int = 64, kind: str = "thread"):
+        if kind not in ("thread", "process"):
+            raise ValueError(f"Unknown executor kind '{kind}'")
+        self.workers = workers
+        self.max_queue = max_queue
+        self.kind = kind
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.wait_time = Histogram()
+        self._executor: Executor | None = None
+
+    @property
+    def executor(self) -> Executor:
+        if self._executor is None:
+            pool_class = ThreadPoolExecutor if self.kind == "thread" else ProcessPoolExecutor
+            self._executor = pool_class(max_workers=self.workers)
+        return self._executor
+
+    @property
+    def queue_depth(self) -> int:
+        return max(0, self.pending - self.workers)
+
+    async def run(self, fn: Callable, *args) -> Any:
+        """
+            Run fn(*args) on the pool without blocking the event loop.
+
+            :param fn: The blocking callable, must be picklable for the process pool
+            :type fn: Callable
+            :param args: Positional arguments for fn
+
+            :return: The result of fn
+            :rtype: Any
+        """
+        if self.pending >= self.workers + self.max_queue:
+            self.rejected += 1
+            raise PoolSaturated()
+        self.pending += 1
+        try:
+            waited, result = await asyncio.get_running_loop().run_in_executor(
+                self.executor, _timed_call, fn, time.time(), *args)
+        finally:
+            self.pending -= 1
+        self.completed += 1
+        self.wait_time.observe(max(0.0, waited))
+        return result
+
+    def stats(self) -> dict:
+        """
+            Get pool metrics.
+
+            :return: The dictionary of queue depth, in-flight, completed and rejected jobs and the wait time histogram
+            :rtype: dict
+        """
+        return {
+            "kind": self.kind,
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "queue_depth": self.queue_depth,
+            "in_flight": self.pending,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "wait_time_seconds": self.wait_time.snapshot(),
+        }
+
+    def shutdown(self) -> None:
+        """
+            Stop the pool workers.
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
@@ -0,0 +1,241 @@
+"""
+Latency and throughput of the API hot paths, measured offline against the real main.app: SQLite, a fake redis
+(or none) and a seeded dataset. Every endpoint is driven by concurrent clients through an ASGI transport, results
+are p50/p95/p99 latency and requests per second. Results can be written as a JSON baseline and compared with a
+previous one, the comparison exits with status 1 when an endpoint regressed by more than the threshold.
+
+Usage:
+    python benchmarks/bench_api.py --users 20 --contacts 2000 --requests 400 --concurrency 1 8 64
+    python benchmarks/bench_api.py --output benchmarks/baselines/main.json
+    python benchmarks/bench_api.py --compare benchmarks/baselines/main.json --threshold 20
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import random
+import sys
+import time
+from datetime import date, datetime, timedelta, timezone
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import httpx
+import sqlalchemy
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+from main import app
+from address_book.database.db import get_db
+from address_book.database.models import Base, Contact, User, birthday_key
+from address_book.services.auth import auth_service
+from address_book.services.cache import init_redis
+from address_book.services.ratelimit import rate_limiter
+
+PASSWORD = 'password'
+ENDPOINTS = ('login', 'get_all', 'search', 'search_birthdays')
+
+
+def seed(url: str, users: int, contacts: int, pool_size: int, rng: random.Random) -> sessionmaker:
+    """
+        Create the schema and insert `users` confirmed users with `contacts` contacts each.
+    """
+    engine = create_engine(url, pool_size=pool_size, max_overflow=0)
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    # One bcrypt hash for everybody, seeding would otherwise be dominated by hashing
+    password = auth_service.get_password_hash(PASSWORD)
+    with engine.begin() as conn:
+        conn.execute(insert(User), [{'id': user_id, 'username': f'bench{user_id:05}', 'password': password,
+                                     'email': f'bench{user_id}@example.com', 'confirmed': True}
+                                    for user_id in range(1, users + 1)])
+        for user_id in range(1, users + 1):
+            rows = []
+            for i in range(contacts):
+                birthday = date(rng.randrange(1950, 2005), 1, 1) + timedelta(days=rng.randrange(365))
+                rows.append({'first_name': f'first{i}', 'last_name': f'last{rng.randrange(contacts)}',
+                             'email': f'c{i}.{user_id}@example.com', 'phone': f'{rng.randrange(10 ** 10):010}',
+                             'birthday': birthday, 'birthday_md': birthday_key(birthday), 'user_id': user_id})
+            conn.execute(insert(Contact), rows)
+    return sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
+
+
+def percentile(samples: list[float], p: float) -> float:
+    """
+        Nearest-rank percentile of sorted samples.
+    """
+    return samples[max(0, min(len(samples) - 1, math.ceil(p / 100 * len(samples)) - 1))]
+
+
+def summarize(samples: list[float], elapsed: float, errors: int) -> dict:
+    samples = sorted(samples)
+    return {
+        'requests': len(samples),
+        'errors': errors,
+        'rps': len(samples) / elapsed if elapsed else 0.0,
+        'mean_ms': sum(samples) / len(samples) * 1000,
+        'p50_ms': percentile(samples, 50) * 1000,
+        'p95_ms': percentile(samples, 95) * 1000,
+        'p99_ms': percentile(samples, 99) * 1000,
+    }
+
+
+def build_request(endpoint: str, i: int, tokens: list[str], rng: random.Random, contacts: int) -> dict:
+    user = i % len(tokens)
+    if endpoint == 'login':
+        return {'method': 'POST', 'url': '/api/auth/login',
+                'data': {'username': f'bench{user + 1}@example.com', 'password': PASSWORD}}
+    headers = {'Authorization': f'Bearer {tokens[user]}'}
+    if endpoint == 'get_all':
+        return {'method': 'GET', 'url': '/api/contacts/get_all', 'params': {'limit': 50}, 'headers': headers}
+    if endpoint == 'search':
+        return {'method': 'GET', 'url': '/api/contacts/search',
+                'params': {'query': f'first{rng.randrange(contacts)}', 'limit': 50}, 'headers': headers}
+    return {'method': 'GET', 'url': '/api/contacts/search_birthdays', 'params': {'days': 7}, 'headers': headers}
+
+
+async def drive(client: httpx.AsyncClient, endpoint: str, total: int, concurrency: int, tokens: list[str],
+                rng: random.Random, contacts: int) -> dict:
+    requests = [build_request(endpoint, i, tokens, rng, contacts) for i in range(total)]
+    samples = []
+    errors = [0]
+
+    async def worker():
+        while requests:
+            request = requests.pop()
+            started = time.perf_counter()
+            response = await client.request(**request)
+            samples.append(time.perf_counter() - started)
+            if response.status_code >= 400:
+                errors[0] += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(samples, time.perf_counter() - started, errors[0])
+
+
+async def run(args, rng: random.Random) -> dict:
+    results = {}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://bench') as client:
+        tokens = []
+        for user_id in range(1, args.users + 1):
+            response = await client.post('/api/auth/login', data={'username': f'bench{user_id}@example.com',
+                                                                  'password': PASSWORD})
+            response.raise_for_status()
+            tokens.append(response.json()['access_token'])
+        for endpoint in args.endpoints:
+            # Warm up caches and connections so the first measured concurrency level is not penalized
+            await drive(client, endpoint, min(args.requests, 20), 1, tokens, rng, args.contacts)
+            for concurrency in args.concurrency:
+                total = args.requests if endpoint != 'login' else max(1, args.requests // args.login_divisor)
+                result = await drive(client, endpoint, total, concurrency, tokens, rng, args.contacts)
+                results[f'{endpoint}@{concurrency}'] = result
+                print(f'{endpoint:>16} c={concurrency:<3} {result["rps"]:9.1f} req/s  p50 {result["p50_ms"]:8.2f} ms  '
+                      f'p95 {result["p95_ms"]:8.2f} ms  p99 {result["p99_ms"]:8.2f} ms  errors {result["errors"]}')
+    return results
+
+
+def compare(baseline: dict, results: dict, threshold: float) -> list[str]:
+    """
+        Compare results with a baseline, an endpoint regressed when its p95 latency grew or its throughput fell by
+        more than threshold percent.
+
+        :return: Descriptions of the regressions
+    """
+    regressions = []
+    print(f'\n{"endpoint":>20} {"p95 base":>10} {"p95 now":>10} {"change":>8} {"rps base":>10} {"rps now":>10} '
+          f'{"change":>8}')
+    for key, result in results.items():
+        base = baseline.get('results', {}).get(key)
+        if base is None:
+            continue
+        p95_change = (result['p95_ms'] / base['p95_ms'] - 1) * 100 if base['p95_ms'] else 0.0
+        rps_change = (result['rps'] / base['rps'] - 1) * 100 if base['rps'] else 0.0
+        flag = ''
+        if p95_change > threshold or rps_change < -threshold:
+            flag = '  REGRESSION'
+            regressions.append(f'{key}: p95 {p95_change:+.1f}%, req/s {rps_change:+.1f}%')
+        print(f'{key:>20} {base["p95_ms"]:10.2f} {result["p95_ms"]:10.2f} {p95_change:+7.1f}% '
+              f'{base["rps"]:10.1f} {result["rps"]:10.1f} {rps_change:+7.1f}%{flag}')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='sqlite:///./bench.db')
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--contacts', type=int, default=2000, help='contacts per user')
+    parser.add_argument('--requests', type=int, default=400, help='requests per endpoint and concurrency level')
+    parser.add_argument('--login-divisor', type=int, default=10,
+                        help='login runs requests/divisor requests, each one costs a bcrypt verification')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 64])
+    parser.add_argument('--endpoints', nargs='+', choices=ENDPOINTS, default=list(ENDPOINTS))
+    parser.add_argument('--redis', choices=('fake', 'none'), default='fake',
+                        help='fakeredis for the cache, session and rate limit layers, or no redis at all')
+    parser.add_argument('--rate-limit', action='store_true', help='keep the rate limiter enabled')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='write the results as a JSON baseline')
+    parser.add_argument('--compare', help='JSON baseline to compare the results with')
+    parser.add_argument('--threshold', type=float, default=20.0, help='allowed regression in percent')
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    session_maker = seed(args.url, args.users, args.contacts, max(args.concurrency), rng)
+
+    def override_get_db():
+        db = session_maker()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app.dependency_overrides[get_db] = override_get_db
+    if args.redis == 'fake':
+        try:
+            from fakeredis import FakeAsyncRedis
+        except ImportError:
+            parser.error('--redis fake needs fakeredis (pip install fakeredis), or use --redis none')
+        init_redis(FakeAsyncRedis(decode_responses=True))
+    else:
+        init_redis(None)
+
+    if not args.rate_limit:
+        # Measure the endpoints, not how fast the limiter rejects a single benchmark client
+        rate_limiter.keys = lambda scope: []
+    results = asyncio.run(run(args, rng))
+
+    report = {
+        'meta': {
+            'created_at': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'sqlalchemy': sqlalchemy.__version__,
+            'platform': platform.platform(),
+            'url': args.url,
+            'users': args.users,
+            'contacts': args.contacts,
+            'requests': args.requests,
+            'concurrency': args.concurrency,
+            'redis': args.redis,
+            'rate_limit': args.rate_limit,
+            'seed': args.seed,
+        },
+        'results': results,
+    }
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+        print(f'\nbaseline written to {args.output}')
+    if args.compare:
+        with open(args.compare) as file:
+            regressions = compare(json.load(file), results, args.threshold)
+        if regressions:
+            print('\nregressions over {:.0f}%:\n  {}'.format(args.threshold, '\n  '.join(regressions)))
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
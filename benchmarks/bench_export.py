@@ -0,0 +1,117 @@
+"""
+Memory benchmark of exporting every contact of a user: the streaming /api/contacts/export endpoint versus
+materializing all ORM objects and one JSON body (what an unpaginated /contacts/get_all used to do).
+
+Each mode runs in its own process and reports its peak RSS, so the numbers do not mix.
+
+Usage:
+    python benchmarks/bench_export.py --url sqlite:///./bench.db --contacts 1000000
+"""
+import argparse
+import asyncio
+import os
+import resource
+import subprocess
+import sys
+import time
+from datetime import date
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from pydantic import TypeAdapter
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+from main import app
+from address_book.database.db import get_db
+from address_book.database.models import Base, Contact, User
+from address_book.repository import contacts as repository_contacts
+from address_book.schemas import ContactResponse
+from address_book.services.auth import auth_service
+
+
+def seed(url: str, contacts: int) -> None:
+    engine = create_engine(url)
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        conn.execute(insert(User), [{'id': 1, 'username': 'benchmark', 'email': 'bench@example.com', 'password': 'x'}])
+        for start in range(0, contacts, 10000):
+            conn.execute(insert(Contact), [
+                {'first_name': f'first{i}', 'last_name': f'last{i}', 'email': f'c{i}@example.com',
+                 'phone': '0957800062', 'birthday': date(1986, 3, 17), 'birthday_md': 317, 'user_id': 1}
+                for i in range(start, min(start + 10000, contacts))])
+    engine.dispose()
+
+
+def peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+async def stream(session_maker: sessionmaker) -> int:
+    def override_get_db():
+        db = session_maker()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[auth_service.get_current_user] = lambda: User(id=1, email='bench@example.com')
+    size = 0
+
+    # The app is driven directly: httpx.ASGITransport would buffer the whole response body in memory
+    request_sent = asyncio.Event()
+
+    async def receive():
+        if request_sent.is_set():
+            # Nothing more to receive, the client stays connected until the response is complete
+            await asyncio.Event().wait()
+        request_sent.set()
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        nonlocal size
+        if message['type'] == 'http.response.body':
+            size += len(message.get('body', b''))
+
+    scope = {'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+             'path': '/api/contacts/export', 'raw_path': b'/api/contacts/export', 'query_string': b'format=ndjson',
+             'root_path': '', 'headers': [], 'client': ('127.0.0.1', 0), 'server': ('bench', 80)}
+    await app(scope, receive, send)
+    return size
+
+
+async def materialize(session_maker: sessionmaker) -> int:
+    with session_maker() as db:
+        contacts = await repository_contacts.get_contacts(User(id=1), db)
+        return len(TypeAdapter(list[ContactResponse]).dump_json(contacts))
+
+
+def run_mode(url: str, mode: str) -> None:
+    session_maker = sessionmaker(bind=create_engine(url), autoflush=False)
+    baseline = peak_rss_mb()
+    started = time.perf_counter()
+    size = asyncio.run({'stream': stream, 'materialize': materialize}[mode](session_maker))
+    elapsed = time.perf_counter() - started
+    print(f'{mode:>11}: {size / 2 ** 20:8.1f} MB out in {elapsed:6.2f} s, '
+          f'peak RSS {peak_rss_mb():7.1f} MB (+{peak_rss_mb() - baseline:.1f} MB over import baseline)')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='sqlite:///./bench.db')
+    parser.add_argument('--contacts', type=int, default=1000000)
+    parser.add_argument('--mode', choices=['stream', 'materialize'])
+    args = parser.parse_args()
+
+    if args.mode:
+        run_mode(args.url, args.mode)
+        return
+    seed(args.url, args.contacts)
+    for mode in ('stream', 'materialize'):
+        subprocess.run([sys.executable, __file__, '--url', args.url, '--mode', mode], check=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+"""
+Cost of verifying the same access token repeatedly with every installed JWT backend, uncached and through the
+VerifiedTokenCache that Auth.decode_token uses.
+
+Usage:
+    python benchmarks/bench_jwt.py --repeat 20000
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from address_book.services.jwt_backends import BACKENDS, VerifiedTokenCache
+
+SECRET_KEY = 'benchmark-secret'
+ALGORITHM = 'HS256'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=20000)
+    args = parser.parse_args()
+
+    claims = {"sub": "bench@example.com", "iat": datetime.utcnow(),
+              "exp": datetime.utcnow() + timedelta(minutes=15), "scope": "access_token"}
+    for name, backend_class in BACKENDS.items():
+        try:
+            backend = backend_class()
+        except ImportError:
+            print(f'{name:>6}: not installed')
+            continue
+        token = backend.encode(claims, SECRET_KEY, ALGORITHM)
+        cache = VerifiedTokenCache()
+
+        def cached_decode():
+            payload = cache.get(token)
+            if payload is None:
+                payload = backend.decode(token, SECRET_KEY, [ALGORITHM])
+                cache.set(token, payload)
+            return payload
+
+        for label, decode in (('uncached', lambda: backend.decode(token, SECRET_KEY, [ALGORITHM])),
+                              ('cached', cached_decode)):
+            started = time.perf_counter()
+            for _ in range(args.repeat):
+                decode()
+            elapsed = (time.perf_counter() - started) / args.repeat
+            print(f'{name:>6} {label:>8}: {elapsed * 1e6:8.2f} us per verification')
+
+
+if __name__ == '__main__':
+    main()
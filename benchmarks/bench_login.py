@@ -0,0 +1,95 @@
+"""
+Login throughput at 1/8/64 concurrent clients with bcrypt on the password hashing pool versus bcrypt inline on the
+event loop.
+
+Usage:
+    python benchmarks/bench_login.py --url sqlite:///./bench.db --requests 32
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from unittest.mock import patch
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import httpx
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from main import app
+from address_book.database.db import get_db
+from address_book.database.models import Base, User
+from address_book.services.auth import auth_service
+from address_book.services.ratelimit import rate_limiter
+
+EMAIL, PASSWORD = 'bench@example.com', 'password'
+
+
+def seed(url: str) -> sessionmaker:
+    engine = create_engine(url, pool_size=64, max_overflow=0)
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    session_maker = sessionmaker(bind=engine, autoflush=False)
+    with session_maker() as db:
+        db.add(User(username='benchmark', email=EMAIL, password=auth_service.get_password_hash(PASSWORD),
+                    confirmed=True))
+        db.commit()
+    return session_maker
+
+
+async def drive(total: int, concurrency: int) -> float:
+    remaining = [total]
+
+    async def worker(client: httpx.AsyncClient):
+        while remaining[0] > 0:
+            remaining[0] -= 1
+            response = await client.post('/api/auth/login', data={'username': EMAIL, 'password': PASSWORD})
+            response.raise_for_status()
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://bench') as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        return total / (time.perf_counter() - started)
+
+
+async def inline_verify(plain_password, hashed_password):
+    return auth_service.verify_password(plain_password, hashed_password)
+
+
+async def run(total: int) -> None:
+    for concurrency in (1, 8, 64):
+        pooled = await drive(total, concurrency)
+        with patch.object(auth_service, 'verify_password_async', inline_verify):
+            inline = await drive(total, concurrency)
+        print(f'concurrency {concurrency:>2}: pool {pooled:7.1f} logins/s, inline {inline:7.1f} logins/s')
+    print(auth_service.password_pool.stats())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='sqlite:///./bench.db')
+    parser.add_argument('--requests', type=int, default=32)
+    parser.add_argument('--rate-limit', action='store_true', help='keep the rate limiter enabled')
+    args = parser.parse_args()
+
+    session_maker = seed(args.url)
+
+    def override_get_db():
+        db = session_maker()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app.dependency_overrides[get_db] = override_get_db
+    if not args.rate_limit:
+        # Measure the endpoints, not how fast the limiter rejects a single benchmark client
+        rate_limiter.keys = lambda scope: []
+    asyncio.run(run(args.requests))
+
+
+if __name__ == '__main__':
+    main()
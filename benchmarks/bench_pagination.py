@@ -0,0 +1,64 @@
+"""
+Page latency of keyset pagination at increasing page depth: every page is an index range scan on
+(user_id, id), so fetching page 1000 should cost the same as fetching page 1.
+
+Usage:
+    python benchmarks/bench_pagination.py --url sqlite:///./bench.db --contacts 100000 --limit 50
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from datetime import date
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+from address_book.database.models import Base, Contact, User
+from address_book.repository import contacts as repository_contacts
+
+
+def seed(url: str, contacts: int) -> sessionmaker:
+    engine = create_engine(url)
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        conn.execute(insert(User), [{'id': 1, 'username': 'benchmark', 'email': 'bench@example.com', 'password': 'x'}])
+        conn.execute(insert(Contact), [{'first_name': f'first{i}', 'last_name': f'last{i}', 'email': f'c{i}@example.com',
+                                        'phone': '0957800062', 'birthday': date(1986, 3, 17), 'birthday_md': 317, 'user_id': 1}
+                                       for i in range(contacts)])
+    return sessionmaker(bind=engine, autoflush=False)
+
+
+async def run(session_maker: sessionmaker, contacts: int, limit: int, repeat: int) -> None:
+    user = User(id=1)
+    with session_maker() as db:
+        for depth in (1, 10, 100, 1000):
+            after_id = (depth - 1) * limit
+            if after_id >= contacts:
+                break
+            started = time.perf_counter()
+            for _ in range(repeat):
+                page = await repository_contacts.get_contacts(user, db, limit=limit, after_id=after_id)
+                db.expunge_all()
+            elapsed = (time.perf_counter() - started) / repeat
+            print(f'page {depth:>5}: {elapsed * 1000:7.3f} ms ({len(page)} rows)')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='sqlite:///./bench.db')
+    parser.add_argument('--contacts', type=int, default=100000)
+    parser.add_argument('--limit', type=int, default=50)
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    session_maker = seed(args.url, args.contacts)
+    asyncio.run(run(session_maker, args.contacts, args.limit, args.repeat))
+
+
+if __name__ == '__main__':
+    main()
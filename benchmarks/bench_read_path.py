@@ -0,0 +1,82 @@
+"""
+Latency and allocations of the ORM read path versus the column-projected one (projected=True) of get_contacts
+and search_contacts.
+
+Usage:
+    python benchmarks/bench_read_path.py --url sqlite:///./bench.db --contacts 20000 --limits 50 500 5000
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+import tracemalloc
+from datetime import date
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+from address_book.database.models import Base, Contact, User
+from address_book.repository import contacts as repository_contacts
+
+
+def seed(url: str, contacts: int) -> sessionmaker:
+    engine = create_engine(url)
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        conn.execute(insert(User), [{'id': 1, 'username': 'benchmark', 'email': 'bench@example.com', 'password': 'x'}])
+        conn.execute(insert(Contact), [{'first_name': f'first{i}', 'last_name': f'last{i}', 'email': f'c{i}@example.com',
+                                        'phone': '0957800062', 'birthday': date(1986, 3, 17), 'birthday_md': 317, 'user_id': 1}
+                                       for i in range(contacts)])
+    return sessionmaker(bind=engine, autoflush=False)
+
+
+async def measure(session_maker: sessionmaker, call, repeat: int) -> tuple[float, int]:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        with session_maker() as db:
+            await call(db)
+    elapsed = (time.perf_counter() - started) / repeat
+    with session_maker() as db:
+        tracemalloc.start()
+        rows = await call(db)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        del rows
+    return elapsed, peak
+
+
+async def run(session_maker: sessionmaker, limits: list[int], repeat: int) -> None:
+    user = User(id=1)
+    for limit in limits:
+        calls = {
+            'get_contacts': lambda db, projected: repository_contacts.get_contacts(user, db, limit=limit,
+                                                                                  projected=projected),
+            'search_contacts': lambda db, projected: repository_contacts.search_contacts(user, 'first1', db,
+                                                                                        limit=limit,
+                                                                                        projected=projected),
+        }
+        for name, call in calls.items():
+            for projected in (False, True):
+                elapsed, peak = await measure(session_maker, lambda db: call(db, projected), repeat)
+                print(f'{name:>15} limit {limit:>5} {"projected" if projected else "orm":>9}: '
+                      f'{elapsed * 1000:8.3f} ms, peak {peak / 1024:9.1f} KiB')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='sqlite:///./bench.db')
+    parser.add_argument('--contacts', type=int, default=20000)
+    parser.add_argument('--limits', type=int, nargs='+', default=[50, 500, 5000])
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    session_maker = seed(args.url, args.contacts)
+    asyncio.run(run(session_maker, args.limits, args.repeat))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""
+CPU time per response of serializing a list of ORM contacts:
+- jsonable_encoder: FastAPI route without response_model, jsonable_encoder + json.dumps
+- orjson: response_model validation + ORJSONResponse as default_response_class (needs orjson)
+- bulk: ContactListResponse, one TypeAdapter(List[ContactResponse]) validate + dump_json in pydantic-core
+
+Usage:
+    python benchmarks/bench_serialization.py --sizes 100 10000 100000
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import date
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from fastapi.encoders import jsonable_encoder
+
+from address_book.database.models import Contact
+from address_book.services.serialization import CONTACT_LIST, dump_contacts
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def contacts(size: int) -> list[Contact]:
+    return [Contact(id=i, first_name=f'first{i}', last_name=f'last{i}', email=f'c{i}@example.com',
+                    phone='0957800062', birthday=date(1986, 3, 17), user_id=1) for i in range(size)]
+
+
+def with_jsonable_encoder(rows: list[Contact]) -> bytes:
+    return json.dumps(jsonable_encoder(rows)).encode()
+
+
+def with_orjson(rows: list[Contact]) -> bytes:
+    return orjson.dumps(CONTACT_LIST.dump_python(CONTACT_LIST.validate_python(rows, from_attributes=True),
+                                                 mode='json'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 10000, 100000])
+    parser.add_argument('--budget', type=float, default=2.0, help='CPU seconds per size and variant')
+    args = parser.parse_args()
+
+    variants = {'jsonable_encoder': with_jsonable_encoder, 'bulk': dump_contacts}
+    if orjson is not None:
+        variants['orjson'] = with_orjson
+    for size in args.sizes:
+        rows = contacts(size)
+        for name, serialize in variants.items():
+            repeat, started = 0, time.process_time()
+            while True:
+                serialize(rows)
+                repeat += 1
+                elapsed = time.process_time() - started
+                if elapsed >= args.budget or repeat >= 1000:
+                    break
+            print(f'{size:>7} contacts {name:>16}: {elapsed / repeat * 1000:9.3f} ms CPU per response')
+
+
+if __name__ == '__main__':
+    main()
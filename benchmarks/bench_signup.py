@@ -0,0 +1,121 @@
+"""
+Signup latency with the Gravatar url resolved inline before the INSERT (the previous create_user) versus derived
+lazily by UserDb on read. Measures create_user alone and the whole /api/auth/signup request, which adds bcrypt.
+
+Usage:
+    python benchmarks/bench_signup.py --url sqlite:///./bench.db --requests 200
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from unittest.mock import patch
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import httpx
+from libgravatar import Gravatar
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+from main import app
+from address_book.database.db import get_db, run_sync
+from address_book.database.models import Base, User
+from address_book.repository import users as repository_users
+from address_book.schemas import UserModel
+from address_book.services.ratelimit import rate_limiter
+
+create_user = repository_users.create_user
+
+
+async def create_user_inline_gravatar(body, db):
+    # create_user before the Gravatar url moved to UserDb
+    avatar = None
+    try:
+        avatar = Gravatar(body.email).get_image()
+    except Exception as e:
+        print(e)
+    stmt = insert(User).values(**body.model_dump(), avatar=avatar).returning(User)
+
+    def _create(session):
+        new_user = session.execute(stmt).scalar_one()
+        session.commit()
+        return new_user
+
+    return await run_sync(db, _create)
+
+
+def reset(engine) -> None:
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+
+
+def summary(samples: list[float]) -> str:
+    samples = sorted(samples)
+    return (f'p50 {statistics.median(samples) * 1000:7.3f} ms, '
+            f'p95 {samples[int(len(samples) * 0.95)] * 1000:7.3f} ms')
+
+
+async def bench_repository(session_maker, engine, total: int, create) -> list[float]:
+    reset(engine)
+    samples = []
+    for i in range(total):
+        body = UserModel(username=f'user{i:05}', email=f'user{i}@example.com', password='secret')
+        with session_maker() as db:
+            started = time.perf_counter()
+            await create(body, db)
+            samples.append(time.perf_counter() - started)
+    return samples
+
+
+async def bench_route(engine, total: int) -> list[float]:
+    reset(engine)
+    samples = []
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://bench') as client:
+        for i in range(total):
+            started = time.perf_counter()
+            response = await client.post('/api/auth/signup', json={'username': f'user{i:05}',
+                                                                   'email': f'user{i}@example.com',
+                                                                   'password': 'secret'})
+            samples.append(time.perf_counter() - started)
+            response.raise_for_status()
+    return samples
+
+
+async def run(session_maker, engine, total: int) -> None:
+    for label, create in (('inline gravatar', create_user_inline_gravatar), ('lazy gravatar', create_user)):
+        samples = await bench_repository(session_maker, engine, total, create)
+        print(f'create_user {label:>15}: {summary(samples)}')
+    for label, create in (('inline gravatar', create_user_inline_gravatar), ('lazy gravatar', create_user)):
+        with patch.object(repository_users, 'create_user', create):
+            samples = await bench_route(engine, total)
+        print(f'     signup {label:>15}: {summary(samples)}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='sqlite:///./bench.db')
+    parser.add_argument('--requests', type=int, default=200)
+    args = parser.parse_args()
+
+    engine = create_engine(args.url)
+    session_maker = sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
+
+    def override_get_db():
+        db = session_maker()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app.dependency_overrides[get_db] = override_get_db
+    # Confirmation emails and rate limits are not part of the request latency
+    with patch('address_book.routes.auth.send_email'), patch.object(rate_limiter, 'keys', return_value=[]):
+        asyncio.run(run(session_maker, engine, args.requests))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,25 +1,40 @@
 from fastapi import FastAPI
-from fastapi_limiter import FastAPILimiter
 from fastapi.middleware.cors import CORSMiddleware
-from address_book.routes import contacts, auth, users
+from fastapi.staticfiles import StaticFiles
+from address_book.routes import contacts, auth, users, internal, metrics
 import redis.asyncio as redis
 from address_book.conf.config import settings
+from address_book.services.cache import init_redis
+from address_book.services.email import email_dispatcher
+from address_book.services.ratelimit import RateLimitMiddleware
+from address_book.services.request_metrics import MetricsMiddleware
 
 app = FastAPI()
 
 origins = ["*"]
 
+# Added before CORS so rate limit rejections carry the CORS headers as well
+app.add_middleware(RateLimitMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag"],
 )
+# Outermost, so rejected and failed requests are measured too
+app.add_middleware(MetricsMiddleware)
 
 app.include_router(contacts.router, prefix='/api')
 app.include_router(auth.router, prefix='/api')
 app.include_router(users.router, prefix='/api')
+app.include_router(internal.router, prefix='/api')
+app.include_router(metrics.router)
+
+if settings.AVATAR_STORAGE == "local":
+    app.mount(settings.AVATAR_URL_PREFIX, StaticFiles(directory=settings.AVATAR_LOCAL_DIR, check_dir=False),
+              name="avatars")
 
 
 @app.get("/")
@@ -36,7 +51,16 @@ def read_root():
 @app.on_event("startup")
 async def startup():
     """
-        Launches a redis server and FastAPILimiter (that allows to limit users frequency of requests to particular routes)
+        Connects to the redis server and shares the client with the cache, session and rate limit layers
     """
     r = await redis.Redis(host=settings.REDIS_HOST, port=settings.REDIS_PORT, db=0, encoding="utf-8", decode_responses=True)
-    await FastAPILimiter.init(r)
\ No newline at end of file
+    init_redis(r)
+    await email_dispatcher.start()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    """
+        Sends the queued emails and closes the SMTP connections
+    """
+    await email_dispatcher.stop()
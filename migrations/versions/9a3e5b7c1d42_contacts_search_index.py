@@ -0,0 +1,34 @@
+"""Contacts search index: pg_trgm GIN on Postgres, FTS5 table on SQLite
+
+Revision ID: 9a3e5b7c1d42
+Revises: 4f1c2a9d7e10
+Create Date: 2026-10-16 11:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+from address_book.database.search import PG_DDL, PG_DROP_DDL, SQLITE_DDL, SQLITE_DROP_DDL
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9a3e5b7c1d42'
+down_revision: Union[str, None] = '4f1c2a9d7e10'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    for statement in {"postgresql": PG_DDL, "sqlite": SQLITE_DDL}.get(dialect, []):
+        op.execute(statement)
+
+
+def downgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    if dialect == "sqlite":
+        for trigger in ("contacts_fts_ai", "contacts_fts_ad", "contacts_fts_au"):
+            op.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    for statement in {"postgresql": PG_DROP_DDL, "sqlite": SQLITE_DROP_DDL}.get(dialect, []):
+        op.execute(statement)
@@ -0,0 +1,101 @@
+"""Contacts birthday as DATE with an indexed month/day key
+
+Revision ID: c5d8e2f4a613
+Revises: 9a3e5b7c1d42
+Create Date: 2026-10-16 12:00:00.000000
+
+"""
+import logging
+import re
+from datetime import date
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from address_book.database.search import SQLITE_DDL
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c5d8e2f4a613'
+down_revision: Union[str, None] = '9a3e5b7c1d42'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+logger = logging.getLogger(f"alembic.runtime.migration.{revision}")
+
+ISO_DATE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+
+
+def clean_birthday(value: str | None) -> str | None:
+    # Birthdays were unvalidated text, only valid YYYY-MM-DD dates (surrounding spaces aside) survive the type change
+    if value is None:
+        return None
+    value = value.strip()
+    if not ISO_DATE.match(value):
+        return None
+    try:
+        date.fromisoformat(value)
+    except ValueError:
+        return None
+    return value
+
+
+def clean_birthdays() -> None:
+    if op.get_context().as_sql:
+        logger.warning("Offline migration: birthdays are not checked, clear the ones that are not YYYY-MM-DD dates")
+        return
+    bind = op.get_bind()
+    contacts = sa.table('contacts', sa.column('id', sa.Integer()), sa.column('birthday', sa.String()))
+    rows = bind.execute(sa.select(contacts.c.id, contacts.c.birthday).where(contacts.c.birthday.is_not(None)))
+    changes = [{'contact_id': contact_id, 'value': clean_birthday(birthday)}
+               for contact_id, birthday in rows if clean_birthday(birthday) != birthday]
+    if not changes:
+        return
+    bind.execute(contacts.update().where(contacts.c.id == sa.bindparam('contact_id'))
+                 .values(birthday=sa.bindparam('value')), changes)
+    cleared = sum(change['value'] is None for change in changes)
+    logger.warning("Cleared %d birthdays that are not YYYY-MM-DD dates, trimmed %d", cleared, len(changes) - cleared)
+
+
+def upgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    clean_birthdays()
+    op.add_column('contacts', sa.Column('birthday_md', sa.SmallInteger(), nullable=True))
+    if dialect == 'postgresql':
+        op.alter_column('contacts', 'birthday', type_=sa.Date(), existing_type=sa.String(),
+                        postgresql_using='birthday::date')
+        op.execute("UPDATE contacts SET birthday_md = EXTRACT(MONTH FROM birthday) * 100 + EXTRACT(DAY FROM birthday)")
+    else:
+        # SQLite stores DATE as 'YYYY-MM-DD' text, which clean_birthdays left in place. The batch copy converts the
+        # column with CAST(birthday AS DATE), a numeric cast in SQLite ('1986-03-17' becomes 1986), so the text is
+        # kept aside and put back
+        op.add_column('contacts', sa.Column('birthday_text', sa.String(), nullable=True))
+        op.execute("UPDATE contacts SET birthday_text = birthday")
+        with op.batch_alter_table('contacts') as batch_op:
+            batch_op.alter_column('birthday', type_=sa.Date(), existing_type=sa.String())
+        op.execute("UPDATE contacts SET birthday = birthday_text")
+        with op.batch_alter_table('contacts') as batch_op:
+            batch_op.drop_column('birthday_text')
+        # Recreating the table dropped the triggers that keep the contacts_fts search index in sync
+        for statement in SQLITE_DDL:
+            op.execute(statement)
+        op.execute("UPDATE contacts SET birthday_md = CAST(strftime('%m', birthday) AS INTEGER) * 100 "
+                   "+ CAST(strftime('%d', birthday) AS INTEGER)")
+    op.create_index('ix_contacts_user_id_birthday_md', 'contacts', ['user_id', 'birthday_md'], unique=False)
+
+
+def downgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    op.drop_index('ix_contacts_user_id_birthday_md', table_name='contacts')
+    if dialect == 'postgresql':
+        op.alter_column('contacts', 'birthday', type_=sa.String(), existing_type=sa.Date(),
+                        postgresql_using="to_char(birthday, 'YYYY-MM-DD')")
+    else:
+        with op.batch_alter_table('contacts') as batch_op:
+            batch_op.alter_column('birthday', type_=sa.String(), existing_type=sa.Date())
+            batch_op.drop_column('birthday_md')
+        for statement in SQLITE_DDL:
+            op.execute(statement)
+        return
+    op.drop_column('contacts', 'birthday_md')
@@ -0,0 +1,23 @@
+import unittest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+from address_book.database.search import search_query
+import logging
+logging.basicConfig(level=logging.ERROR)
+
+
+class TestSearchQuery(unittest.TestCase):
+
+    def test_postgres_rank_is_double_precision(self):
+        # Never connects, the engine only provides the dialect
+        engine = create_engine("postgresql+psycopg2://postgres@localhost/postgres")
+        with Session(bind=engine) as session:
+            query, rank = search_query(session, 1, 'Anna')
+            sql = str(query.statement.compile(dialect=engine.dialect))
+        self.assertIn("CAST(word_similarity(%(word_similarity_1)s, lower(", sql)
+        self.assertIn("AS FLOAT(53)) AS search_rank", sql)
+        self.assertEqual(str(rank.compile(dialect=engine.dialect)).count("FLOAT(53)"), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import os
+import tempfile
+import unittest
+from datetime import date
+from unittest.mock import patch
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+from address_book.database import db
+from address_book.database.models import Contact
+import logging
+logging.basicConfig(level=logging.ERROR)
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+
+class TestMigrations(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.url = f"sqlite:///{os.path.join(directory.name, 'migrations.db')}"
+        # No ini file, so alembic does not reconfigure logging
+        self.config = Config()
+        self.config.set_main_option("script_location", os.path.join(ROOT, "migrations"))
+
+    def upgrade(self, revision: str):
+        with patch.object(db, 'SQLALCHEMY_DATABASE_URL', self.url):
+            command.upgrade(self.config, revision)
+
+    def test_birthday_date_clears_malformed_values(self):
+        self.upgrade('9a3e5b7c1d42')
+        engine = create_engine(self.url)
+        self.addCleanup(engine.dispose)
+        with engine.begin() as conn:
+            conn.execute(text("INSERT INTO users (id, username, email, password, confirmed) "
+                              "VALUES (1, 'user', 'user@example.com', 'password', 1)"))
+            for contact_id, birthday in ((1, '1986-03-17'), (2, ' 1990-12-01 '), (3, '17.03.1986'),
+                                         (4, '2023-02-30'), (5, None), (6, 'soon')):
+                conn.execute(text("INSERT INTO contacts (id, first_name, last_name, email, phone, birthday, user_id) "
+                                  "VALUES (:id, :name, 'last', 'c@example.com', '0957800062', :birthday, 1)"),
+                             {'id': contact_id, 'name': f'first{contact_id}', 'birthday': birthday})
+
+        self.upgrade('c5d8e2f4a613')
+        with sessionmaker(bind=engine)() as session:
+            contacts = session.query(Contact).order_by(Contact.id).all()
+            self.assertEqual([(contact.birthday, contact.birthday_md) for contact in contacts],
+                             [(date(1986, 3, 17), 317), (date(1990, 12, 1), 1201)] + [(None, None)] * 4)
+        with engine.begin() as conn:
+            # The search index is still kept in sync after the table was recreated
+            conn.execute(text("UPDATE contacts SET first_name = 'Johanna' WHERE id = 6"))
+            self.assertEqual(conn.execute(text("SELECT rowid FROM contacts_fts WHERE contacts_fts MATCH 'hanna'"))
+                             .scalars().all(), [6])
+
+        with patch.object(db, 'SQLALCHEMY_DATABASE_URL', self.url):
+            command.downgrade(self.config, '9a3e5b7c1d42')
+        with engine.connect() as conn:
+            self.assertEqual(conn.execute(text("SELECT birthday FROM contacts ORDER BY id")).scalars().all(),
+                             ['1986-03-17', '1990-12-01', None, None, None, None])
+
+
+if __name__ == '__main__':
+    unittest.main()
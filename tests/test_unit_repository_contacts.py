@@ -1,9 +1,12 @@
 import unittest
-from unittest.mock import MagicMock
+from unittest.mock import MagicMock, patch
 
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import Session
 
-from address_book.database.models import Contact, User
+from address_book.database.models import Base, Contact, User
 from address_book.schemas import *
 from address_book.repository.contacts import (
     get_contacts,
@@ -12,8 +15,12 @@ from address_book.repository.contacts import (
     remove_contact,
     update_contact,
     search_contacts,
-    get_birthdays
+    get_birthdays,
+    _birthday_window
 )
+from address_book.repository import contacts as repository_contacts
+from address_book.repository import users as repository_users
+from datetime import date
 
 
 class TestRepositoryContacts(unittest.IsolatedAsyncioTestCase):
@@ -28,6 +35,17 @@ class TestRepositoryContacts(unittest.IsolatedAsyncioTestCase):
         result = await get_contacts(user=self.user, db=self.session)
         self.assertEqual(result, contacts)
 
+    async def test_get_contacts_projected(self):
+        rows = [(1, "first_name", "last_name", "email@gmail.com", "0957800062", date(1986, 3, 17))]
+        self.session.execute().all.return_value = rows
+        result = await get_contacts(user=self.user, db=self.session, limit=10, projected=True)
+        self.assertEqual(result, rows)
+
+    async def test_get_contact_projected(self):
+        self.session.execute().first.return_value = None
+        result = await get_contact(contact_id=1, user=self.user, db=self.session, projected=True)
+        self.assertIsNone(result)
+
     async def test_get_contact_found(self):
         contact = Contact()
         self.session.query().filter().first.return_value = contact
@@ -42,31 +60,33 @@ class TestRepositoryContacts(unittest.IsolatedAsyncioTestCase):
     async def test_create_contact(self):
         contact = Contact(first_name="first_name", last_name="last_name", email="email@gmail.com", phone="0957800062",
                           birthday="1986-03-17", user_id=self.user.id)
-        self.session.query().filter().all.return_value = contact
+        self.session.execute().scalar_one.return_value = contact
+        self.session.execute.reset_mock()
         result = await create_contact(body=contact, user=self.user, db=self.session)
-        self.assertEqual(result.first_name, contact.first_name)
-        self.assertEqual(result.last_name, contact.last_name)
-        self.assertEqual(result.email, contact.email)
-        self.assertEqual(result.phone, contact.phone)
-        self.assertEqual(result.birthday, contact.birthday)
-        self.assertEqual(result.user_id, self.user.id)
-        self.assertTrue(hasattr(result, "id"))
+        self.assertEqual(result, contact)
+        params = self.session.execute.call_args.args[0].compile().params
+        self.assertEqual(params['first_name'], contact.first_name)
+        self.assertEqual(params['birthday'], contact.birthday)
+        self.assertEqual(params['birthday_md'], 317)
+        self.assertEqual(params['user_id'], self.user.id)
+        self.session.execute.assert_called_once()
+        self.session.refresh.assert_not_called()
 
     async def test_remove_contact_found(self):
         contact = Contact()
-        self.session.query().filter().first.return_value = contact
+        self.session.execute().scalar_one_or_none.return_value = contact
         result = await remove_contact(contact_id=1, user=self.user, db=self.session)
         self.assertEqual(result, contact)
 
     async def test_remove_contact_not_found(self):
-        self.session.query().filter().first.return_value = None
+        self.session.execute().scalar_one_or_none.return_value = None
         result = await remove_contact(contact_id=1, user=self.user, db=self.session)
         self.assertIsNone(result)
 
     async def test_update_contact_found(self):
         contact = Contact(first_name="first_name", last_name="last_name", email="email@gmail.com", phone="0957800062",
                           birthday="1986-03-17", user_id=self.user.id)
-        self.session.query().filter().first.return_value = contact
+        self.session.execute().scalar_one_or_none.return_value = contact
         self.session.commit.return_value = None
         result = await update_contact(contact_id=self.user.id, body=contact, user=self.user, db=self.session)
         self.assertEqual(result, contact)
@@ -74,7 +94,7 @@ class TestRepositoryContacts(unittest.IsolatedAsyncioTestCase):
     async def test_update_note_not_found(self):
         contact = Contact(first_name="first_name", last_name="last_name", email="email@gmail.com", phone="0957800062",
                           birthday="1986-03-17", user_id=self.user.id)
-        self.session.query().filter().first.return_value = None
+        self.session.execute().scalar_one_or_none.return_value = None
         self.session.commit.return_value = None
         result = await update_contact(contact_id=self.user.id, body=contact, user=self.user, db=self.session)
         self.assertIsNone(result)
@@ -82,15 +102,16 @@ class TestRepositoryContacts(unittest.IsolatedAsyncioTestCase):
     async def test_search_contacts_found(self):
         contact = Contact(first_name="first_name", last_name="last_name", email="email@gmail.com", phone="0957800062",
                           birthday="1986-03-17", user_id=self.user.id)
-        self.session.query().filter().filter().all.return_value = contact
+        self.session.query().filter().filter().order_by().all.return_value = [(contact, 0.0)]
         self.session.commit.return_value = None
         result = await search_contacts(query='test', user=self.user, db=self.session)
-        self.assertEqual(result, contact)
+        self.assertEqual(result, [contact])
+        self.assertEqual(contact.search_rank, 0.0)
 
     async def test_search_contacts_not_found(self):
         contact = Contact(first_name="first_name", last_name="last_name", email="email@gmail.com", phone="0957800062",
                           birthday="1986-03-17", user_id=self.user.id)
-        self.session.query().filter().filter().all.return_value = None
+        self.session.query().filter().filter().order_by().all.return_value = []
         self.session.commit.return_value = None
         result = await search_contacts(query='email', user=self.user, db=self.session)
         self.assertIsNone(result)
@@ -98,7 +119,7 @@ class TestRepositoryContacts(unittest.IsolatedAsyncioTestCase):
     async def test_search_birthdays_found(self):
         contact = Contact(first_name="first_name", last_name="last_name", email="email@gmail.com", phone="0957800062",
                           birthday="1986-04-23", user_id=self.user.id)
-        self.session.query().filter().all.return_value = contact
+        self.session.query().filter().filter().order_by().all.return_value = [contact]
         self.session.commit.return_value = None
         result = await get_birthdays(user=self.user, db=self.session)
         self.assertEqual(result, [contact])
@@ -106,10 +127,179 @@ class TestRepositoryContacts(unittest.IsolatedAsyncioTestCase):
     async def test_search_birthdays_not_found(self):
         contact = Contact(first_name="first_name", last_name="last_name", email="email@gmail.com", phone="0957800062",
                           birthday="1986-03-17", user_id=self.user.id)
-        self.session.query().filter().all.return_value = None
+        self.session.query().filter().filter().order_by().all.return_value = []
         self.session.commit.return_value = None
         result = await get_birthdays(user=self.user, db=self.session)
-        self.assertIsNone(result)
+        self.assertEqual(result, [])
+
+    def test_birthday_window(self):
+        self.assertEqual(_birthday_window(date(2024, 4, 20), 7), (420, 426))
+        self.assertEqual(_birthday_window(date(2024, 12, 29), 7), (1229, 104))
+        self.assertEqual(_birthday_window(date(2025, 2, 22), 7), (222, 229))
+        self.assertEqual(_birthday_window(date(2024, 2, 22), 7), (222, 228))
+        self.assertIsNone(_birthday_window(date(2024, 2, 22), 366))
+
+    def test_birthday_key(self):
+        contact = Contact(birthday="1986-03-17")
+        self.assertEqual(contact.birthday, date(1986, 3, 17))
+        self.assertEqual(contact.birthday_md, 317)
+
+
+class TestRepositoryContactsDatabase(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.engine = create_async_engine("sqlite+aiosqlite://")
+        async with self.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        self.session_maker = async_sessionmaker(bind=self.engine, autoflush=False, expire_on_commit=False)
+
+    async def asyncTearDown(self):
+        await self.engine.dispose()
+
+    async def test_contacts_keyset_pages(self):
+        async with self.session_maker() as db:
+            user = await repository_users.create_user(
+                UserModel(username='username', email='email@example.com', password='password'), db)
+            for i in range(5):
+                await repository_contacts.create_contact(user, ContactBase(
+                    first_name=f'first{i}', last_name='last_name', email='email@example.com', phone='0957800062',
+                    birthday='1986-03-17'), db)
+            first = await repository_contacts.get_contacts(user, db, limit=2)
+            second = await repository_contacts.get_contacts(user, db, limit=2, after_id=first[-1].id)
+            last = await repository_contacts.get_contacts(user, db, limit=2, after_id=second[-1].id)
+            self.assertEqual([c.first_name for c in first + second + last], [f'first{i}' for i in range(5)])
+
+    async def test_search_ranked_case_insensitive(self):
+        async with self.session_maker() as db:
+            user = await repository_users.create_user(
+                UserModel(username='username', email='email@example.com', password='password'), db)
+            for first_name, last_name, email in (('Anna', 'Smith', 'anna@example.com'),
+                                                 ('Johanna', 'Annandale', 'jo@example.com'),
+                                                 ('Bob', 'Brown', 'bob@example.com')):
+                await repository_contacts.create_contact(user, ContactBase(
+                    first_name=first_name, last_name=last_name, email=email, phone='0957800062',
+                    birthday='1986-03-17'), db)
+            found = await repository_contacts.search_contacts(user, 'ANNA', db, limit=10)
+            self.assertEqual({c.first_name for c in found}, {'Anna', 'Johanna'})
+            self.assertGreaterEqual(found[0].search_rank, found[1].search_rank)
+
+            page = await repository_contacts.search_contacts(user, 'anna', db, limit=1)
+            rest = await repository_contacts.search_contacts(user, 'anna', db, limit=10,
+                                                             after=(page[0].search_rank, page[0].id))
+            self.assertEqual([c.id for c in page + rest], [c.id for c in found])
+
+            self.assertEqual([c.first_name for c in await repository_contacts.search_contacts(user, 'bo', db)],
+                             ['Bob'])
+            self.assertIsNone(await repository_contacts.search_contacts(user, '100%', db))
+
+    async def test_search_pages_are_stable_across_writes(self):
+        async with self.session_maker() as db:
+            user = await repository_users.create_user(
+                UserModel(username='username', email='email@example.com', password='password'), db)
+            other = await repository_users.create_user(
+                UserModel(username='other', email='other@example.com', password='password'), db)
+            for i, first_name in enumerate(('Anna', 'Annabel', 'Joanna', 'Hanna', 'Anna-Maria', 'Marianna')):
+                await repository_contacts.create_contact(user, ContactBase(
+                    first_name=first_name, last_name=f'last{i}', email=f'c{i}@example.com', phone='0957800062',
+                    birthday='1986-03-17'), db)
+            expected = [c.id for c in await repository_contacts.search_contacts(user, 'anna', db)]
+            self.assertEqual(len(expected), 6)
+
+            page = await repository_contacts.search_contacts(user, 'anna', db, limit=2)
+            # Writes of another user change corpus statistics such as bm25 scores, not the order of this user's pages
+            for i in range(20):
+                await repository_contacts.create_contact(other, ContactBase(
+                    first_name='anna anna anna', last_name=f'annan{i}', email=f'anna{i}@example.com',
+                    phone='0957800062', birthday='1986-03-17'), db)
+            rest = await repository_contacts.search_contacts(user, 'anna', db, limit=10,
+                                                             after=(page[-1].search_rank, page[-1].id))
+            self.assertEqual([c.id for c in page + (rest or [])], expected)
+
+    async def test_projected_reads_return_rows(self):
+        async with self.session_maker() as db:
+            user = await repository_users.create_user(
+                UserModel(username='username', email='email@example.com', password='password'), db)
+            for first_name in ('Anna', 'Johanna'):
+                await repository_contacts.create_contact(user, ContactBase(
+                    first_name=first_name, last_name='last_name', email='email@example.com', phone='0957800062',
+                    birthday='1986-03-17'), db)
+            db.expunge_all()
+
+            rows = await repository_contacts.get_contacts(user, db, limit=10, projected=True)
+            self.assertEqual([(row.first_name, row.birthday) for row in rows],
+                             [('Anna', date(1986, 3, 17)), ('Johanna', date(1986, 3, 17))])
+            row = await repository_contacts.get_contact(user, rows[1].id, db, projected=True)
+            self.assertEqual(row.first_name, 'Johanna')
+            found = await repository_contacts.search_contacts(user, 'anna', db, limit=10, projected=True)
+            self.assertEqual(len(db.identity_map), 0)
+            self.assertGreaterEqual(found[0].search_rank, found[1].search_rank)
+            self.assertEqual([row.id for row in found],
+                             [c.id for c in await repository_contacts.search_contacts(user, 'anna', db, limit=10)])
+
+    async def test_bulk_update_and_delete(self):
+        async with self.session_maker() as db:
+            user = await repository_users.create_user(
+                UserModel(username='username', email='email@example.com', password='password'), db)
+            other = await repository_users.create_user(
+                UserModel(username='username', email='other@example.com', password='password'), db)
+            contacts = [await repository_contacts.create_contact(owner, ContactBase(
+                first_name=first_name, last_name='last_name', email='email@example.com', phone='0957800062',
+                birthday='1986-03-17'), db) for owner, first_name in ((user, 'Anna'), (user, 'Bob'), (other, 'Eve'))]
+            anna, bob, eve = (contact.id for contact in contacts)
+
+            updated = await repository_contacts.update_contacts(user, {
+                anna: {'phone': '1111111111'}, bob: {'first_name': 'Robert', 'birthday': date(1990, 12, 31)},
+                eve: {'first_name': 'Mallory'}, 999: {'phone': '2222222222'}}, db)
+            self.assertEqual(updated, [anna, bob])
+            db.expunge_all()
+            rows = {row.id: row for row in await repository_contacts.get_contacts(user, db)}
+            self.assertEqual((rows[anna].first_name, rows[anna].phone), ('Anna', '1111111111'))
+            self.assertEqual((rows[bob].first_name, rows[bob].birthday, rows[bob].birthday_md),
+                             ('Robert', date(1990, 12, 31), 1231))
+            self.assertEqual((await repository_contacts.get_contacts(other, db))[0].first_name, 'Eve')
+
+            with self.assertRaises(IntegrityError):
+                await repository_contacts.update_contacts(user, {bob: {'first_name': 'Anna'}}, db)
+            self.assertEqual((await repository_contacts.get_contact(user, bob, db, projected=True)).first_name,
+                             'Robert')
+
+            self.assertEqual(await repository_contacts.remove_contacts(user, [anna, eve, 999], db), [anna])
+            self.assertEqual([c.id for c in await repository_contacts.get_contacts(user, db)], [bob])
+            self.assertEqual(len(await repository_contacts.get_contacts(other, db)), 1)
+
+            await db.execute(text("CREATE TRIGGER keep_contacts BEFORE DELETE ON contacts "
+                                  "BEGIN SELECT RAISE(ABORT, 'contact is kept'); END"))
+            await db.commit()
+            with self.assertRaises(IntegrityError):
+                await repository_contacts.remove_contacts(user, [bob], db)
+            self.assertFalse(db.in_transaction())
+            self.assertEqual([c.id for c in await repository_contacts.get_contacts(user, db)], [bob])
+
+    async def test_birthdays_window_wraps_year_and_leap_day(self):
+        async with self.session_maker() as db:
+            user = await repository_users.create_user(
+                UserModel(username='username', email='email@example.com', password='password'), db)
+            for first_name, birthday in (('new_year', '1990-01-02'), ('eve', '1985-12-31'), ('leap', '1992-02-29'),
+                                         ('march', '1980-03-01'), ('summer', '1970-07-01')):
+                await repository_contacts.create_contact(user, ContactBase(
+                    first_name=first_name, last_name='last_name', email='email@example.com', phone='0957800062',
+                    birthday=birthday), db)
+
+            with patch('address_book.repository.contacts.date', wraps=date) as mock_date:
+                mock_date.today.return_value = date(2024, 12, 30)
+                found = await repository_contacts.get_birthdays(user, db)
+                self.assertEqual([c.first_name for c in found], ['eve', 'new_year'])
+
+                mock_date.today.return_value = date(2025, 2, 26)
+                found = await repository_contacts.get_birthdays(user, db, days=3)
+                self.assertEqual([c.first_name for c in found], ['leap'])
+
+                mock_date.today.return_value = date(2024, 2, 26)
+                found = await repository_contacts.get_birthdays(user, db, days=3)
+                self.assertEqual([c.first_name for c in found], [])
+
+                found = await repository_contacts.get_birthdays(user, db, days=366)
+                self.assertEqual([c.first_name for c in found], ['leap', 'march', 'summer', 'eve', 'new_year'])
 
 
 if __name__ == '__main__':
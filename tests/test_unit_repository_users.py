@@ -1,10 +1,13 @@
 import unittest
-from unittest.mock import MagicMock, patch
-from sqlalchemy.orm import Session
-from address_book.database.models import Contact, User
+from unittest.mock import MagicMock
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import StaticPool
+from address_book.database.models import Base, Contact, User
 from address_book.schemas import *
 from address_book.repository.users import *
 from datetime import datetime
+from sqlalchemy.exc import IntegrityError
 
 
 class TestRepositoryUsers(unittest.IsolatedAsyncioTestCase):
@@ -27,29 +30,73 @@ class TestRepositoryUsers(unittest.IsolatedAsyncioTestCase):
 
     async def test_create_user(self):
         user_data = UserModel(username='username', email='email@example.com', password='password')
-        avatar_url = 'http://example.com/avatar.jpg'
-        gravatar_mock = MagicMock()
-        gravatar_mock.get_image.return_value = avatar_url
-        with patch('address_book.repository.users.Gravatar', return_value=gravatar_mock):
-            result = await create_user(body=user_data, db=self.session)
-            self.assertIsNotNone(result)
-            self.assertEqual(result.username, user_data.username)
-            self.assertEqual(result.email, user_data.email)
-            self.assertEqual(result.avatar, avatar_url)
+        self.session.execute().scalar_one_or_none.return_value = self.user
+        self.session.execute.reset_mock()
+        result = await create_user(body=user_data, db=self.session)
+        self.assertEqual(result, self.user)
+        params = self.session.execute.call_args.args[0].compile().params
+        self.assertEqual(params['username'], user_data.username)
+        self.assertEqual(params['email'], user_data.email)
+        self.assertNotIn('avatar', params)
+        self.session.execute.assert_called_once()
+
+    async def test_create_user_conflict(self):
+        user_data = UserModel(username='username', email='email@example.com', password='password')
+        self.session.execute.side_effect = IntegrityError('INSERT', {}, Exception('UNIQUE constraint failed'))
+        result = await create_user(body=user_data, db=self.session)
+        self.assertIsNone(result)
+        self.session.rollback.assert_called_once()
+
+    async def test_user_exists(self):
+        self.session.execute().scalar.return_value = True
+        self.assertTrue(await user_exists(email='email@example.com', db=self.session))
+        self.session.execute().scalar.return_value = False
+        self.assertFalse(await user_exists(email='email@example.com', db=self.session))
 
     async def test_update_token(self):
         await update_token(user=self.user, token='new_token', db=self.session)
+        self.assertEqual(self.user.refresh_token, 'new_token')
+        self.session.execute.assert_called_once()
+        self.session.commit.assert_called_once()
 
     async def test_confirm_email(self):
         await confirmed_email(email=self.user.email, db=self.session)
 
     async def test_update_avatar(self):
-        self.session.query().filter().first.return_value = self.user
+        self.session.execute().scalar_one_or_none.return_value = self.user
         updated_user = await update_avatar(email=self.user.email, url=self.user.avatar, db=self.session)
 
         self.assertEqual(updated_user.avatar, self.user.avatar)
         self.session.commit.assert_called_once()
 
 
+class TestRepositoryUsersStatements(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.engine = create_engine("sqlite://", poolclass=StaticPool)
+        Base.metadata.create_all(self.engine)
+        self.statements = []
+        event.listen(self.engine, "before_cursor_execute",
+                     lambda conn, cursor, statement, *args: self.statements.append(statement))
+        self.db = sessionmaker(bind=self.engine, autoflush=False, expire_on_commit=False)()
+        self.addCleanup(self.engine.dispose)
+        self.addCleanup(self.db.close)
+
+    async def count(self, write) -> int:
+        self.statements.clear()
+        result = await write
+        self.assertEqual(len(self.statements), 1, self.statements)
+        return result
+
+    async def test_each_write_is_one_statement(self):
+        user = await self.count(create_user(
+            UserModel(username='username', email='email@example.com', password='password'), self.db))
+        self.assertIsNone(await self.count(create_user(
+            UserModel(username='username', email='email@example.com', password='password'), self.db)))
+        await self.count(update_token(user, 'token', self.db))
+        await self.count(confirmed_email(user.email, self.db))
+        self.assertEqual((await self.count(update_avatar(user.email, 'url', self.db))).avatar, 'url')
+
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
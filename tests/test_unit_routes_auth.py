@@ -1,17 +1,24 @@
+import asyncio
+import tempfile
 import unittest
 from fastapi import BackgroundTasks, Request
 from fastapi.testclient import TestClient
 from fastapi.security import HTTPAuthorizationCredentials
-from unittest.mock import MagicMock
+from unittest.mock import MagicMock, patch
 from datetime import datetime, timedelta
 from address_book.repository import users as repository_users
-from address_book.routes.auth import router, signup, login, updatee_token, confirmedd_email, request_email
+from address_book.routes.auth import (router, signup, login, updatee_token, confirmedd_email, request_email, logout,
+                                      read_sessions, revoke_session, revoke_sessions)
 from address_book.repository.users import *
 from fastapi import HTTPException, status
 from address_book.services.auth import auth_service
+from address_book.services.sessions import refresh_sessions
 from address_book.conf.config import settings
 from jose import jwt
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import Session
+from address_book.database.models import Base, User
 import logging
 logging.basicConfig(level=logging.ERROR)
 
@@ -21,6 +28,12 @@ class TestRoutesAuth(unittest.IsolatedAsyncioTestCase):
     def setUp(self):
         self.client = TestClient(router)
         self.db = MagicMock(spec=Session)
+        # Sessions are kept in memory without redis
+        patcher = patch('address_book.services.sessions.get_redis', return_value=None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(refresh_sessions.local.clear)
+        self.addCleanup(refresh_sessions._local_index.clear)
 
     async def test_signup_success(self):
         body = UserModel(username='testuser', email='test@example.com', password='password')
@@ -30,14 +43,13 @@ class TestRoutesAuth(unittest.IsolatedAsyncioTestCase):
         request = MagicMock(spec=Request)
         request.base_url = 'http://example.com'
 
-        self.db.query().filter().first.return_value = None
-        self.db.commit.return_value = None
-        repository_users.create_user.return_value = new_user_db
+        self.db.execute().scalar.return_value = False
+        self.db.execute().scalar_one_or_none.return_value = new_user_db
         response_data = await signup(body=body, background_tasks=background_tasks, request=request, db=self.db)
 
         self.assertIsNotNone(response_data)
-        self.assertEqual(response_data.username, new_user_db.username)
-        self.assertEqual(response_data.email, new_user_db.email)
+        self.assertEqual(response_data['user']['username'], new_user_db.username)
+        self.assertEqual(response_data['user']['email'], new_user_db.email)
 
     async def test_signup_user_already_exists(self):
         body = UserModel(username='testuser', email='test@example.com', password='password')
@@ -47,16 +59,26 @@ class TestRoutesAuth(unittest.IsolatedAsyncioTestCase):
         request = MagicMock(spec=Request)
         request.base_url = 'http://example.com'
 
-        self.db.query().filter().first.return_value = new_user_db
-        self.db.commit.return_value = None
-        repository_users.create_user.return_value = new_user_db
+        self.db.execute().scalar.return_value = True
 
-        with self.assertRaises(HTTPException) as cm:
-            await signup(body=body, background_tasks=background_tasks, request=request, db=self.db)
+        with patch.object(auth_service, 'get_password_hash_async') as hash_password:
+            with self.assertRaises(HTTPException) as cm:
+                await signup(body=body, background_tasks=background_tasks, request=request, db=self.db)
+        hash_password.assert_not_called()
 
         self.assertEqual(cm.exception.status_code, status.HTTP_409_CONFLICT)
         self.assertEqual(cm.exception.detail, "Account already exists")
 
+    async def test_signup_lost_race(self):
+        body = UserModel(username='testuser', email='test@example.com', password='password')
+        request = MagicMock(spec=Request)
+        self.db.execute().scalar.return_value = False
+        self.db.execute().scalar_one_or_none.return_value = None
+
+        with self.assertRaises(HTTPException) as cm:
+            await signup(body=body, background_tasks=BackgroundTasks(), request=request, db=self.db)
+        self.assertEqual(cm.exception.status_code, status.HTTP_409_CONFLICT)
+
     async def test_login_success(self):
         user = User(id=1, username='testuser', email='test@example.com', password='password', created_at=datetime.now(),
                     avatar=None, refresh_token=None, confirmed=True)
@@ -102,23 +124,88 @@ class TestRoutesAuth(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(context.exception.status_code, status.HTTP_401_UNAUTHORIZED)
         self.assertEqual(context.exception.detail, "Invalid email")
 
-    async def test_refresh_token(self):
+    async def login_tokens(self):
         user = User(id=1, username='testuser', email='test@example.com', password='password', created_at=datetime.now(),
-                    avatar=None, refresh_token='token', confirmed=True)
+                    avatar=None, refresh_token=None, confirmed=True)
+        user.password = auth_service.get_password_hash(user.password)
         self.db.query().filter().first.return_value = user
+        return await login(body=User(username='testuser', password='password'), db=self.db, user_agent='pytest')
 
+    @staticmethod
+    def bearer(token):
+        return HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+
+    async def test_login_opens_session(self):
+        tokens = await self.login_tokens()
+        claims = await auth_service.decode_refresh_claims(tokens['refresh_token'])
+        sessions = await refresh_sessions.list('test@example.com')
+        self.assertEqual([session['sid'] for session in sessions], [claims['sid']])
+        self.assertEqual(sessions[0]['device'], 'pytest')
+        self.db.commit.assert_not_called()
+
+    async def test_refresh_token(self):
+        tokens = await self.login_tokens()
+        self.db.reset_mock()
+        response_data = await updatee_token(credentials=self.bearer(tokens['refresh_token']))
+        self.assertIn("access_token", response_data)
+        self.assertIn("refresh_token", response_data)
+        self.assertEqual(response_data["token_type"], "bearer")
+        self.assertNotEqual(response_data["refresh_token"], tokens['refresh_token'])
+        self.db.execute.assert_not_called()
+        self.db.commit.assert_not_called()
+
+        response_data = await updatee_token(credentials=self.bearer(response_data['refresh_token']))
+        self.assertIn("refresh_token", response_data)
+
+    async def test_refresh_token_reuse(self):
+        tokens = await self.login_tokens()
+        rotated = await updatee_token(credentials=self.bearer(tokens['refresh_token']))
+
+        with self.assertRaises(HTTPException) as context:
+            await updatee_token(credentials=self.bearer(tokens['refresh_token']))
+        self.assertEqual(context.exception.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(context.exception.detail, "Refresh token was already used, the session is revoked")
+
+        with self.assertRaises(HTTPException) as context:
+            await updatee_token(credentials=self.bearer(rotated['refresh_token']))
+        self.assertEqual(context.exception.detail, "Session expired or revoked")
+
+    async def test_refresh_token_without_session(self):
         payload = {
-            'sub': user.email,
+            'sub': 'test@example.com',
             'scope': 'refresh_token',
             'exp': datetime.utcnow() + timedelta(minutes=15),
         }
-
         token = jwt.encode(payload, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
-        user.refresh_token = token
-        response_data = await updatee_token(credentials=HTTPAuthorizationCredentials(scheme="Bearer", credentials=token), db=self.db)
-        self.assertIn("access_token", response_data)
-        self.assertIn("refresh_token", response_data)
-        self.assertEqual(response_data["token_type"], "bearer")
+
+        with self.assertRaises(HTTPException) as context:
+            await updatee_token(credentials=self.bearer(token))
+        self.assertEqual(context.exception.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(context.exception.detail, "Invalid refresh token")
+
+    async def test_logout(self):
+        tokens = await self.login_tokens()
+        await logout(credentials=self.bearer(tokens['refresh_token']))
+
+        with self.assertRaises(HTTPException) as context:
+            await updatee_token(credentials=self.bearer(tokens['refresh_token']))
+        self.assertEqual(context.exception.detail, "Session expired or revoked")
+
+    async def test_revoke_sessions(self):
+        first = await self.login_tokens()
+        second = await self.login_tokens()
+        user = User(id=1, email='test@example.com')
+        sid = (await auth_service.decode_refresh_claims(first['refresh_token']))['sid']
+
+        await revoke_session(sid=sid, current_user=user)
+        with self.assertRaises(HTTPException) as context:
+            await revoke_session(sid=sid, current_user=user)
+        self.assertEqual(context.exception.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(len(await read_sessions(current_user=user)), 1)
+
+        self.assertEqual(await revoke_sessions(current_user=user), {"revoked": 1})
+        with self.assertRaises(HTTPException):
+            await updatee_token(credentials=self.bearer(second['refresh_token']))
 
     async def test_confirm_user_email_success(self):
         user = User(id=1, username='testuser', email='test@example.com', password='password', created_at=datetime.now(),
@@ -193,5 +280,34 @@ class TestRoutesAuth(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(response_data, {"message": "Check your email for confirmation."})
 
 
+class TestConcurrentSignup(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.engine = create_async_engine(f"sqlite+aiosqlite:///{self.tmp.name}/signup.db")
+        async with self.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        self.session_maker = async_sessionmaker(bind=self.engine, autoflush=False, expire_on_commit=False)
+
+    async def asyncTearDown(self):
+        await self.engine.dispose()
+        self.tmp.cleanup()
+
+    async def signup(self):
+        body = UserModel(username='username', email='email@example.com', password='password')
+        async with self.session_maker() as db:
+            return await signup(body=body, background_tasks=BackgroundTasks(), request=MagicMock(), db=db)
+
+    async def test_one_signup_wins(self):
+        # Every request passes the existence pre-check before any of them inserts
+        results = await asyncio.gather(*(self.signup() for _ in range(4)), return_exceptions=True)
+        created = [result for result in results if isinstance(result, dict)]
+        conflicts = [result for result in results if isinstance(result, HTTPException)]
+        self.assertEqual(len(created), 1, results)
+        self.assertEqual([conflict.status_code for conflict in conflicts], [409] * 3)
+        async with self.session_maker() as db:
+            self.assertEqual(len((await db.execute(select(User))).scalars().all()), 1)
+
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -1,11 +1,21 @@
+import json
 import unittest
 from fastapi.testclient import TestClient
-from unittest.mock import MagicMock
+from unittest.mock import AsyncMock, MagicMock, patch
 from address_book.routes.auth import router
-from sqlalchemy.orm import Session
+from sqlalchemy import create_engine, event, select
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import StaticPool
 from address_book.routes.contacts import *
 from datetime import datetime
-from address_book.database.models import Contact
+from address_book.database.models import Base, Contact
+from address_book.repository import users as repository_users
+from address_book.schemas import ContactBase, UserModel
+from address_book.services.pagination import encode_cursor, decode_cursor
+try:
+    from fakeredis import FakeAsyncRedis
+except ImportError:  # pragma: no cover
+    FakeAsyncRedis = None
 import logging
 logging.basicConfig(level=logging.ERROR)
 
@@ -19,24 +29,91 @@ class TestRoutesContacts(unittest.IsolatedAsyncioTestCase):
                     created_at=datetime.now(), avatar=None, refresh_token=None, confirmed=False)
         self.contact = Contact(id=1, first_name='first_name', last_name='last_name', email='email@gamil.com',
                           phone='1111111111', birthday='1986-04-23', user_id=self.user.id)
+        self.contact_json = {'first_name': 'first_name', 'last_name': 'last_name', 'email': 'email@gamil.com',
+                             'phone': '1111111111', 'birthday': '1986-04-23'}
 
     async def test_read_contacts_found(self):
-        self.db.query().filter().all.return_value = self.contact
+        self.db.execute().all.return_value = [self.contact]
         response = await read_contacts(db=self.db, current_user=self.user)
-        self.assertEqual(response, self.contact)
+        self.assertEqual(json.loads(response.body), [self.contact_json])
+        self.assertNotIn('X-Next-Cursor', response.headers)
 
     async def test_read_contacts_not_found(self):
-        self.db.query().filter().all.return_value = None
+        self.db.execute().all.return_value = []
         response = await read_contacts(db=self.db, current_user=self.user)
-        self.assertEqual(response, None)
+        self.assertEqual(json.loads(response.body), [])
+
+    async def test_read_contacts_next_page(self):
+        second = Contact(id=2, first_name='second', last_name='last_name', email='second@gamil.com',
+                         phone='1111111111', birthday='1986-04-23', user_id=self.user.id)
+        self.db.execute().all.return_value = [self.contact, second]
+        response = await read_contacts(limit=1, cursor=encode_cursor(0), db=self.db, current_user=self.user)
+        self.assertEqual(json.loads(response.body), [self.contact_json])
+        self.assertEqual(decode_cursor(response.headers['X-Next-Cursor']), (self.contact.id,))
+
+    async def test_read_contacts_invalid_cursor(self):
+        with self.assertRaises(HTTPException) as context:
+            await read_contacts(cursor='not a cursor', db=self.db, current_user=self.user)
+        self.assertEqual(context.exception.status_code, status.HTTP_400_BAD_REQUEST)
+
+    async def test_read_contacts_etag(self):
+        self.db.execute().all.return_value = [self.contact]
+        with patch('address_book.routes.contacts.contacts_version.get', AsyncMock(return_value='v1')):
+            response = await read_contacts(db=self.db, current_user=self.user)
+            etag = response.headers['ETag']
+            self.db.execute.reset_mock()
+
+            response = await read_contacts(if_none_match=etag, db=self.db, current_user=self.user)
+            self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+            self.assertEqual(response.headers['ETag'], etag)
+            self.db.execute.assert_not_called()
+
+            response = await read_contacts(limit=10, if_none_match=etag, db=self.db, current_user=self.user)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    async def test_read_contact_etag(self):
+        with patch('address_book.routes.contacts.contacts_version.get', AsyncMock(return_value='v1')):
+            self.db.execute().first.return_value = self.contact
+            response = await read_contact(contact_id=self.contact.id, db=self.db, current_user=self.user)
+            etag = response.headers['ETag']
+            result = await read_contact(contact_id=self.contact.id, if_none_match=f'W/{etag}',
+                                        db=self.db, current_user=self.user)
+            self.assertEqual(result.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    async def test_read_contact_wildcard_etag_missing(self):
+        with patch('address_book.routes.contacts.contacts_version.get', AsyncMock(return_value='v1')):
+            self.db.execute().first.return_value = self.contact
+            result = await read_contact(contact_id=self.contact.id, if_none_match='*', db=self.db,
+                                        current_user=self.user)
+            self.assertEqual(result.status_code, status.HTTP_304_NOT_MODIFIED)
+
+            self.db.execute().first.return_value = None
+            with self.assertRaises(HTTPException) as context:
+                await read_contact(contact_id=999, if_none_match='*', db=self.db, current_user=self.user)
+            self.assertEqual(context.exception.status_code, status.HTTP_404_NOT_FOUND)
+
+    @unittest.skipIf(FakeAsyncRedis is None, "fakeredis is not installed")
+    async def test_read_contacts_cached_until_write(self):
+        self.db.execute().all.return_value = [self.contact]
+        self.db.execute.reset_mock()
+        with patch('address_book.services.cache.get_redis', return_value=FakeAsyncRedis(decode_responses=True)):
+            first = await read_contacts(db=self.db, current_user=self.user)
+            second = await read_contacts(db=self.db, current_user=self.user)
+            self.assertEqual(second.body, first.body)
+            self.assertEqual(self.db.execute.call_count, 1)
+
+            await contacts_version.bump(self.user.id)
+            third = await read_contacts(db=self.db, current_user=self.user)
+            self.assertNotEqual(third.headers['ETag'], first.headers['ETag'])
+            self.assertEqual(self.db.execute.call_count, 2)
 
     async def test_read_contact_found(self):
-        self.db.query().filter().first.return_value = self.contact
+        self.db.execute().first.return_value = self.contact
         response = await read_contact(contact_id=self.contact.id, db=self.db, current_user=self.user)
-        self.assertEqual(response, self.contact)
+        self.assertEqual(json.loads(response.body), self.contact_json)
 
     async def test_read_contact_not_found(self):
-        self.db.query().filter().first.return_value = None
+        self.db.execute().first.return_value = None
 
         with self.assertRaises(HTTPException) as context:
             await read_contact(contact_id=self.contact.id, db=self.db, current_user=self.user)
@@ -45,21 +122,21 @@ class TestRoutesContacts(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(context.exception.detail, "Contact not found")
 
     async def test_create_contact(self):
-        self.db.query().filter().all.return_value = self.contact
+        self.db.execute().scalar_one.return_value = self.contact
         result = await create_new(body=self.contact, current_user=self.user, db=self.db)
         self.assertEqual(result.status_code, 201)
 
     async def test_update_contact_found(self):
         contact_new = ContactBase(first_name='first_name', last_name='last_name', email='email@gamil.com',
-                              phone='1111111111', birthday='2222-22-22')
-        self.db.query().filter().first.return_value = self.contact
+                              phone='1111111111', birthday='2222-02-22')
+        self.db.execute().scalar_one_or_none.return_value = self.contact
         response = await update_contact(body=contact_new, contact_id=1, current_user=self.user, db=self.db)
         self.assertIsNotNone(response)
 
     async def test_update_contact_not_found(self):
         contact_new = ContactBase(first_name='first_name', last_name='last_name', email='email@gamil.com',
-                              phone='1111111111', birthday='2222-22-22')
-        self.db.query().filter().first.return_value = None
+                              phone='1111111111', birthday='2222-02-22')
+        self.db.execute().scalar_one_or_none.return_value = None
         with self.assertRaises(HTTPException) as context:
             await update_contact(body=contact_new, contact_id=1, current_user=self.user, db=self.db)
 
@@ -67,25 +144,48 @@ class TestRoutesContacts(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(context.exception.detail, "Contact not found")
 
     async def test_remove_contact_found(self):
-        self.db.query().filter().first.return_value = self.contact
+        self.db.execute().scalar_one_or_none.return_value = self.contact
         response = await remove_contact(contact_id=self.contact.id, db=self.db, current_user=self.user)
         self.assertEqual(response, 'Contact successfully deleted')
 
     async def test_remove_contact_not_found(self):
-        self.db.query().filter().first.return_value = None
+        self.db.execute().scalar_one_or_none.return_value = None
         with self.assertRaises(HTTPException) as context:
             await remove_contact(contact_id=self.contact.id, db=self.db, current_user=self.user)
 
         self.assertEqual(context.exception.status_code, status.HTTP_404_NOT_FOUND)
         self.assertEqual(context.exception.detail, "Contact not found")
 
+    async def test_bulk_update_contacts(self):
+        self.db.execute().scalars().all.return_value = [1]
+        body = ContactsBulkUpdate(contacts={1: {'phone': '2222222222'}, 5: {'first_name': 'name'}})
+        result = await bulk_update_contacts(body=body, db=self.db, current_user=self.user)
+        self.assertEqual(result, BulkResult(affected=[1], not_found=[5]))
+
+    async def test_bulk_update_contacts_conflict(self):
+        self.db.execute.side_effect = IntegrityError('UPDATE', {}, Exception())
+        body = ContactsBulkUpdate(contacts={1: {'first_name': 'name'}})
+        with self.assertRaises(HTTPException) as context:
+            await bulk_update_contacts(body=body, db=self.db, current_user=self.user)
+        self.assertEqual(context.exception.status_code, status.HTTP_409_CONFLICT)
+
+    def test_bulk_update_requires_fields(self):
+        with self.assertRaises(ValueError):
+            ContactsBulkUpdate(contacts={1: {'first_name': None}})
+
+    async def test_bulk_delete_contacts(self):
+        self.db.execute().scalars().all.return_value = [1, 2]
+        result = await bulk_delete_contacts(body=ContactsBulkDelete(ids=[1, 2, 3]), db=self.db,
+                                            current_user=self.user)
+        self.assertEqual(result, BulkResult(affected=[1, 2], not_found=[3]))
+
     async def test_search_contacts_found(self):
-        self.db.query().filter().filter().all.return_value = self.contact
+        self.db.query().filter().filter().order_by().limit().all.return_value = [self.contact]
         response = await search_contacts(query='first_name', db=self.db, current_user=self.user)
-        self.assertIsNotNone(response)
+        self.assertEqual(json.loads(response.body), [self.contact_json])
 
     async def test_search_contacts_not_found(self):
-        self.db.query().filter().filter().all.return_value = None
+        self.db.query().filter().filter().order_by().limit().all.return_value = []
 
         with self.assertRaises(HTTPException) as context:
             await search_contacts(query='test', db=self.db, current_user=self.user)
@@ -94,14 +194,48 @@ class TestRoutesContacts(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(context.exception.detail, "Nothing found")
 
     async def test_search_birthdays_found(self):
-        self.db.query().filter().all.return_value = self.contact
-        response = await search_birthdays(current_user=self.user, db=self.db)
-        self.assertEqual([self.contact], response)
+        self.db.query().filter().filter().order_by().all.return_value = [self.contact]
+        response = await search_birthdays(days=30, current_user=self.user, db=self.db)
+        self.assertEqual(json.loads(response.body), [self.contact_json])
 
     async def test_search_birthdays_not_found(self):
-        self.db.query().filter().all.return_value = None
+        self.db.query().filter().filter().order_by().all.return_value = []
         response = await search_birthdays(current_user=self.user, db=self.db)
-        self.assertIsNone(response)
+        self.assertEqual(json.loads(response.body), [])
+
+
+class TestRoutesContactsStatements(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.engine = create_engine("sqlite://", poolclass=StaticPool)
+        Base.metadata.create_all(self.engine)
+        self.statements = []
+        event.listen(self.engine, "before_cursor_execute",
+                     lambda conn, cursor, statement, *args: self.statements.append(statement))
+        self.db = sessionmaker(bind=self.engine, autoflush=False, expire_on_commit=False)()
+        self.addCleanup(self.engine.dispose)
+        self.addCleanup(self.db.close)
+
+    async def count(self, write) -> int:
+        self.statements.clear()
+        result = await write
+        self.assertEqual(len(self.statements), 1, self.statements)
+        return result
+
+    async def test_each_write_endpoint_is_one_statement(self):
+        user = await repository_users.create_user(
+            UserModel(username='username', email='email@example.com', password='password'), self.db)
+        body = ContactBase(first_name='first_name', last_name='last_name', email='email@example.com',
+                           phone='0957800062', birthday='1986-03-17')
+        response = await self.count(create_new(body=body, db=self.db, current_user=user))
+        self.assertEqual(response.status_code, 201)
+        contact_id = self.db.execute(select(Contact.id)).scalar_one()
+
+        body.phone = '1111111111'
+        contact = await self.count(update_contact(body=body, contact_id=contact_id, db=self.db, current_user=user))
+        self.assertEqual((contact.phone, contact.birthday_md), ('1111111111', 317))
+        await self.count(remove_contact(contact_id=contact_id, db=self.db, current_user=user))
+        self.assertIsNone(self.db.execute(select(Contact.id)).scalar_one_or_none())
 
 
 if __name__ == '__main__':
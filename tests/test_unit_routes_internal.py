@@ -0,0 +1,32 @@
+import unittest
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+from main import app
+import logging
+logging.basicConfig(level=logging.ERROR)
+
+
+class TestInternalKey(unittest.TestCase):
+
+    def setUp(self):
+        self.client = TestClient(app)
+
+    def test_unset_key_disables_internal_routes(self):
+        with patch('address_book.routes.internal.settings.INTERNAL_API_KEY', None):
+            for path in ('/api/internal/cache', '/api/internal/slow_queries', '/metrics'):
+                self.assertEqual(self.client.get(path).status_code, 404, path)
+                self.assertEqual(self.client.get(path, headers={'X-Internal-Key': ''}).status_code, 404, path)
+            self.assertEqual(self.client.delete('/api/internal/slow_queries').status_code, 404)
+
+    def test_key_required(self):
+        with patch('address_book.routes.internal.settings.INTERNAL_API_KEY', 'secret'):
+            self.assertEqual(self.client.get('/api/internal/slow_queries').status_code, 403)
+            self.assertEqual(self.client.get('/metrics', headers={'X-Internal-Key': 'wrong'}).status_code, 403)
+            response = self.client.get('/api/internal/slow_queries', headers={'X-Internal-Key': 'secret'})
+            self.assertEqual(response.status_code, 200)
+            self.assertIn('queries', response.json())
+            self.assertEqual(self.client.get('/metrics', headers={'X-Internal-Key': 'secret'}).status_code, 200)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,9 +1,13 @@
+import os
+import tempfile
 import unittest
 from fastapi.testclient import TestClient
-from unittest.mock import MagicMock
+from unittest.mock import MagicMock, patch
 from address_book.routes.auth import router
 from sqlalchemy.orm import Session
 from address_book.routes.users import *
+from address_book.services.avatars import LocalStorage
+from address_book.services.gravatar import gravatar_url
 from datetime import datetime
 from fastapi import UploadFile
 import logging
@@ -23,15 +27,44 @@ class TestRoutesUsers(unittest.IsolatedAsyncioTestCase):
         response =await read_users_me(current_user=user)
         self.assertEqual(User, type(response))
 
+    def test_default_avatar(self):
+        user = User(id=1, username='testuser', email='test@example.com', password='password',
+                    created_at=datetime.now(), avatar=None, refresh_token=None, confirmed=False)
+        self.assertEqual(UserDb.model_validate(user).avatar, gravatar_url('test@example.com'))
+        self.assertTrue(gravatar_url('test@example.com').startswith('https://www.gravatar.com/avatar/'))
+        user.avatar = '/media/avatars/1.jpg'
+        self.assertEqual(UserDb.model_validate(user).avatar, '/media/avatars/1.jpg')
+
     async def test_update_avatar(self):
         user = User(id=1, username='testuser', email='test@example.com', password='password',
                     created_at=datetime.now(), avatar=None, refresh_token=None, confirmed=False)
-        self.db.query().filter().first.return_value = user
+        self.db.execute.return_value.scalar_one_or_none.return_value = user
 
-        with open('avatar.jpg', "rb") as file:
+        with tempfile.TemporaryDirectory() as root, \
+                patch.object(avatar_pipeline, 'storage', LocalStorage(root, '/media/avatars')), \
+                open(os.path.join(os.path.dirname(__file__), 'avatar.jpg'), "rb") as file:
             upload_file = UploadFile(filename="avatar.jpg", file=file)
             response = await update_avatar_user(file=upload_file, current_user=user, db=self.db)
+            self.assertEqual(len(os.listdir(root)), 1)
         self.assertEqual(User, type(response))
+        url = self.db.execute.call_args.args[0].compile().params['avatar']
+        self.assertTrue(url.startswith('/media/avatars/'))
+
+    async def test_avatars_of_same_username_are_separate(self):
+        users = [User(id=user_id, username='testuser', email=f'test{user_id}@example.com', password='password',
+                      created_at=datetime.now(), avatar=None, refresh_token=None, confirmed=False)
+                 for user_id in (1, 2)]
+        self.db.execute.return_value.scalar_one_or_none.side_effect = users
+        urls = []
+        with tempfile.TemporaryDirectory() as root, \
+                patch.object(avatar_pipeline, 'storage', LocalStorage(root, '/media/avatars')):
+            for user in users:
+                with open(os.path.join(os.path.dirname(__file__), 'avatar.jpg'), "rb") as file:
+                    await update_avatar_user(file=UploadFile(filename="avatar.jpg", file=file), current_user=user,
+                                             db=self.db)
+                urls.append(self.db.execute.call_args.args[0].compile().params['avatar'])
+            self.assertEqual(len(os.listdir(root)), 2)
+        self.assertNotEqual(urls[0].partition('?')[0], urls[1].partition('?')[0])
 
 
 if __name__ == '__main__':
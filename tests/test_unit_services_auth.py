@@ -1,8 +1,10 @@
 import unittest
-from unittest.mock import MagicMock
+from unittest.mock import MagicMock, patch
 from sqlalchemy.orm import Session
 from address_book.database.models import User
 from address_book.services.auth import Auth
+from address_book.services.workers import PoolSaturated
+from address_book.services.jwt_backends import InvalidToken, JoseBackend, get_backend
 from datetime import datetime, timedelta
 from jose import jwt
 from address_book.conf.config import settings
@@ -17,6 +19,8 @@ class TestServicesAuth(unittest.IsolatedAsyncioTestCase):
         self.auth = Auth()
         self.auth.SECRET_KEY = settings.SECRET_KEY
         self.auth.ALGORITHM = settings.ALGORITHM
+        self.auth.user_cache.local.clear()
+        self.auth.token_cache.clear()
 
     async def test_verify_password_correct(self):
         hashed_password = self.auth.pwd_context.hash("password123")
@@ -31,6 +35,17 @@ class TestServicesAuth(unittest.IsolatedAsyncioTestCase):
         hashed_password = self.auth.get_password_hash(password)
         assert Auth().verify_password(password, hashed_password) is True
 
+    async def test_verify_password_async(self):
+        hashed_password = await self.auth.get_password_hash_async("password123")
+        assert await self.auth.verify_password_async("password123", hashed_password) is True
+        assert await self.auth.verify_password_async("wrongpassword", hashed_password) is False
+
+    async def test_password_pool_saturated(self):
+        with patch.object(self.auth.password_pool, 'run', side_effect=PoolSaturated()):
+            with self.assertRaises(HTTPException) as context:
+                await self.auth.get_password_hash_async("password123")
+        assert context.exception.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+
     async def test_create_access_token(self):
         data = {"sub": "user@example.com"}
         expires_delta = 3600
@@ -72,6 +87,20 @@ class TestServicesAuth(unittest.IsolatedAsyncioTestCase):
         result = await self.auth.get_current_user(token=token, db=mock_db)
         assert result == user
 
+    async def test_get_current_user_cached(self):
+        token_data = {"sub": "cached@example.com", "scope": "access_token"}
+        token = jwt.encode(token_data, self.auth.SECRET_KEY, algorithm=self.auth.ALGORITHM)
+
+        mock_db = MagicMock(spec=Session)
+        user = User(id=1, username='testuser', email='cached@example.com', password='password',
+                    created_at=datetime.now(), avatar=None, refresh_token=None, confirmed=False)
+        mock_db.query(User).filter().first.return_value = user
+        await self.auth.get_current_user(token=token, db=mock_db)
+        mock_db.query(User).filter().first.return_value = None
+        result = await self.auth.get_current_user(token=token, db=mock_db)
+        assert result.id == user.id
+        assert result.email == user.email
+
     async def test_get_current_user_invalid_token(self):
         token = "invalid_token"
         mock_db = MagicMock(spec=Session)
@@ -121,5 +150,37 @@ class TestServicesAuth(unittest.IsolatedAsyncioTestCase):
         self.assertNotEqual(payload['sub'], email)
 
 
+    async def test_decode_token_is_memoized_until_exp(self):
+        token = await self.auth.create_access_token({"sub": "email@gmail.com"}, expires_delta=60)
+        hits = self.auth.token_cache.stats()['hits']
+        with patch.object(self.auth, 'jwt_backend', wraps=self.auth.jwt_backend) as backend:
+            self.assertEqual(self.auth.decode_token(token)['sub'], "email@gmail.com")
+            self.auth.decode_token(token)['sub'] = "changed"
+            self.assertEqual(self.auth.decode_token(token)['sub'], "email@gmail.com")
+            self.assertEqual(backend.decode.call_count, 1)
+        self.assertEqual(self.auth.token_cache.stats()['hits'] - hits, 2)
+
+        with patch('address_book.services.cache.time.monotonic', return_value=10 ** 12):
+            self.assertIsNone(self.auth.token_cache.get(token))
+
+    async def test_decode_token_invalid_is_not_cached(self):
+        token = jwt.encode({"sub": "email@gmail.com", "exp": datetime.utcnow() + timedelta(minutes=1)}, 'other key',
+                           algorithm=self.auth.ALGORITHM)
+        for _ in range(2):
+            with self.assertRaises(InvalidToken):
+                self.auth.decode_token(token)
+        self.assertEqual(self.auth.token_cache.stats()['size'], 0)
+
+    async def test_decode_token_without_exp_is_not_cached(self):
+        token = jwt.encode({"sub": "email@gmail.com"}, self.auth.SECRET_KEY, algorithm=self.auth.ALGORITHM)
+        self.assertEqual(self.auth.decode_token(token)['sub'], "email@gmail.com")
+        self.assertIsNone(self.auth.token_cache.get(token))
+
+    def test_get_backend(self):
+        self.assertIsInstance(get_backend('jose'), JoseBackend)
+        with self.assertRaises(ValueError):
+            get_backend('unknown')
+
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
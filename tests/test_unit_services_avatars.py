@@ -0,0 +1,106 @@
+import asyncio
+import io
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import AsyncMock, patch
+from fastapi import HTTPException, status
+from PIL import Image
+from address_book.services.avatars import AvatarPipeline, InvalidImage, LocalStorage, get_storage, process_avatar
+from address_book.services.workers import BoundedExecutor, PoolSaturated
+import logging
+logging.basicConfig(level=logging.ERROR)
+
+
+def make_image(width=800, height=600, fmt='PNG') -> bytes:
+    output = io.BytesIO()
+    Image.new('RGB', (width, height), (200, 30, 30)).save(output, format=fmt)
+    return output.getvalue()
+
+
+class TestProcessAvatar(unittest.TestCase):
+
+    def test_resized_to_square_jpeg(self):
+        for fmt in ('PNG', 'JPEG'):
+            with Image.open(io.BytesIO(process_avatar(make_image(fmt=fmt), size=250))) as image:
+                self.assertEqual(image.format, 'JPEG')
+                self.assertEqual(image.size, (250, 250))
+
+    def test_small_image_is_upscaled(self):
+        with Image.open(io.BytesIO(process_avatar(make_image(40, 80), size=250))) as image:
+            self.assertEqual(image.size, (250, 250))
+
+    def test_not_an_image(self):
+        with self.assertRaises(InvalidImage):
+            process_avatar(b'not an image')
+
+
+class TestLocalStorage(unittest.IsolatedAsyncioTestCase):
+
+    async def test_save(self):
+        with tempfile.TemporaryDirectory() as root:
+            storage = LocalStorage(root, '/media/avatars/')
+            url = await storage.save('../user', b'first')
+            path, _, version = url.partition('?v=')
+            self.assertTrue(path.startswith('/media/avatars/'))
+            files = list(Path(root).iterdir())
+            self.assertEqual([file.name for file in files], [path.rsplit('/', 1)[1]])
+            self.assertEqual(files[0].read_bytes(), b'first')
+
+            second = await storage.save('../user', b'second')
+            self.assertEqual(second.partition('?v=')[0], path)
+            self.assertNotEqual(second.partition('?v=')[2], version)
+            self.assertEqual(files[0].read_bytes(), b'second')
+
+    async def test_concurrent_saves(self):
+        with tempfile.TemporaryDirectory() as root:
+            storage = LocalStorage(root, '/media/avatars/')
+            contents = [bytes([i]) * 100_000 for i in range(8)]
+            await asyncio.gather(*(storage.save('1', data) for data in contents))
+            files = list(Path(root).iterdir())
+            self.assertEqual(len(files), 1)
+            self.assertIn(files[0].read_bytes(), contents)
+
+    def test_get_storage(self):
+        self.assertIsInstance(get_storage('local'), LocalStorage)
+        with self.assertRaises(ValueError):
+            get_storage('ftp')
+
+
+class TestAvatarPipeline(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.storage = AsyncMock()
+        self.storage.save.return_value = 'url'
+        self.pool = BoundedExecutor(workers=1, max_queue=1)
+        self.addCleanup(self.pool.shutdown)
+        self.pipeline = AvatarPipeline(self.storage, self.pool, size=100, max_bytes=1024 * 1024)
+
+    async def test_upload(self):
+        self.assertEqual(await self.pipeline.upload('user', make_image()), 'url')
+        name, data = self.storage.save.call_args.args
+        self.assertEqual(name, 'user')
+        with Image.open(io.BytesIO(data)) as image:
+            self.assertEqual(image.size, (100, 100))
+        self.assertEqual(self.pool.stats()['completed'], 1)
+
+    async def test_too_large(self):
+        with self.assertRaises(HTTPException) as cm:
+            await self.pipeline.upload('user', b'0' * (1024 * 1024 + 1))
+        self.assertEqual(cm.exception.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        self.storage.save.assert_not_called()
+
+    async def test_not_an_image(self):
+        with self.assertRaises(HTTPException) as cm:
+            await self.pipeline.upload('user', b'not an image')
+        self.assertEqual(cm.exception.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+
+    async def test_pool_saturated(self):
+        with patch.object(self.pool, 'run', side_effect=PoolSaturated):
+            with self.assertRaises(HTTPException) as cm:
+                await self.pipeline.upload('user', make_image())
+        self.assertEqual(cm.exception.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+
+
+if __name__ == '__main__':
+    unittest.main()
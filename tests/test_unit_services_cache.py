@@ -0,0 +1,194 @@
+import json
+import unittest
+from unittest.mock import AsyncMock, patch
+from datetime import datetime
+from redis.exceptions import RedisError
+try:
+    from fakeredis import FakeAsyncRedis
+except ImportError:  # pragma: no cover
+    FakeAsyncRedis = None
+from address_book.database.models import User
+import asyncio
+from address_book.services.cache import TTLCache, UserCache, ContactsVersion, ReadThroughCache
+from address_book.services.etag import etag_matches
+import logging
+logging.basicConfig(level=logging.ERROR)
+
+
+class TestTTLCache(unittest.TestCase):
+
+    def test_get_set(self):
+        cache = TTLCache(maxsize=2, ttl=60)
+        cache.set('a', 1)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIsNone(cache.get('b'))
+
+    def test_lru_eviction(self):
+        cache = TTLCache(maxsize=2, ttl=60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(len(cache), 2)
+
+    def test_expired_entry(self):
+        cache = TTLCache(maxsize=2, ttl=60)
+        with patch('address_book.services.cache.time.monotonic', return_value=100):
+            cache.set('a', 1, ttl=5)
+        with patch('address_book.services.cache.time.monotonic', return_value=106):
+            self.assertIsNone(cache.get('a'))
+
+
+class TestUserCache(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.cache = UserCache(maxsize=10, ttl=60)
+        self.user = User(id=1, username='username', email='email@gmail.com', password='password',
+                         created_at=datetime(2024, 4, 7, 12, 0), avatar='str', refresh_token='str', confirmed=True)
+        self.redis = AsyncMock()
+        patcher = patch('address_book.services.cache.get_redis', return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def test_local_hit(self):
+        await self.cache.set(self.user)
+        result = await self.cache.get(self.user.email)
+        self.assertEqual(result.id, self.user.id)
+        self.assertEqual(result.created_at, self.user.created_at)
+        self.assertIsNone(result.password)
+        self.assertIsNone(result.refresh_token)
+        self.assertEqual(self.cache.stats()['local_hits'], 1)
+        self.redis.get.assert_not_called()
+
+    async def test_redis_hit(self):
+        self.redis.get.return_value = json.dumps({'id': 1, 'username': 'username', 'email': 'email@gmail.com',
+                                                  'created_at': None, 'avatar': None, 'confirmed': True})
+        result = await self.cache.get('email@gmail.com')
+        self.assertEqual(result.id, 1)
+        self.assertEqual(self.cache.stats()['redis_hits'], 1)
+        self.assertIsNotNone(self.cache.local.get('email@gmail.com'))
+
+    async def test_miss_and_redis_error(self):
+        self.redis.get.side_effect = RedisError()
+        self.assertIsNone(await self.cache.get('email@gmail.com'))
+        self.assertEqual(self.cache.stats()['misses'], 1)
+
+    async def test_invalidate(self):
+        await self.cache.set(self.user)
+        await self.cache.invalidate(self.user.email)
+        self.redis.get.return_value = None
+        self.assertIsNone(await self.cache.get(self.user.email))
+        self.redis.delete.assert_awaited_once_with('user:email@gmail.com')
+
+
+
+@unittest.skipIf(FakeAsyncRedis is None, "fakeredis is not installed")
+class TestContactsVersion(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.version = ContactsVersion()
+        self.redis = FakeAsyncRedis(decode_responses=True)
+        patcher = patch('address_book.services.cache.get_redis', return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def test_version_is_stable_until_bumped(self):
+        first = await self.version.get(1)
+        self.assertEqual(await self.version.get(1), first)
+        self.assertNotEqual(await self.version.get(2), first)
+        await self.version.bump(1)
+        self.assertNotEqual(await self.version.get(1), first)
+
+    async def test_lost_key_gets_a_new_version(self):
+        first = await self.version.get(1)
+        await self.redis.flushall()
+        self.assertNotEqual(await self.version.get(1), first)
+
+    async def test_without_redis(self):
+        with patch('address_book.services.cache.get_redis', return_value=None):
+            self.assertIsNone(await self.version.get(1))
+            await self.version.bump(1)
+
+
+@unittest.skipIf(FakeAsyncRedis is None, "fakeredis is not installed")
+class TestReadThroughCache(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.cache = ReadThroughCache(ttl=60, lock_ttl=1, poll_interval=0.01, prefix='test:')
+        self.redis = FakeAsyncRedis(decode_responses=True)
+        patcher = patch('address_book.services.cache.get_redis', return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.loads = 0
+
+    async def loader(self):
+        self.loads += 1
+        await asyncio.sleep(0.01)
+        return 'value'
+
+    async def test_miss_then_hit(self):
+        self.assertEqual(await self.cache.get_or_load('key', self.loader), 'value')
+        self.assertEqual(await self.cache.get_or_load('key', self.loader), 'value')
+        self.assertEqual(self.loads, 1)
+        self.assertEqual(await self.redis.ttl('test:key'), 60)
+        stats = self.cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['hit_ratio']), (1, 1, 0.5))
+
+    async def test_concurrent_misses_load_once(self):
+        values = await asyncio.gather(*(self.cache.get_or_load('key', self.loader) for _ in range(10)))
+        self.assertEqual(values, ['value'] * 10)
+        self.assertEqual(self.loads, 1)
+        self.assertEqual(self.cache.stats()['coalesced'], 9)
+
+    async def test_waits_for_lock_of_another_process(self):
+        await self.redis.set('test:key:lock', '1')
+
+        async def other_process():
+            await asyncio.sleep(0.05)
+            await self.redis.set('test:key', 'theirs')
+
+        value, _ = await asyncio.gather(self.cache.get_or_load('key', self.loader), other_process())
+        self.assertEqual(value, 'theirs')
+        self.assertEqual(self.loads, 0)
+        self.assertEqual(self.cache.stats()['lock_waits'], 1)
+
+    async def test_none_is_not_cached(self):
+        async def missing():
+            self.loads += 1
+
+        self.assertIsNone(await self.cache.get_or_load('key', missing))
+        self.assertIsNone(await self.cache.get_or_load('key', missing))
+        self.assertEqual(self.loads, 2)
+
+    async def test_failed_load_is_not_shared(self):
+        async def failing():
+            await asyncio.sleep(0.01)
+            raise RuntimeError()
+
+        first, second = await asyncio.gather(self.cache.get_or_load('key', failing),
+                                             self.cache.get_or_load('key', self.loader), return_exceptions=True)
+        self.assertIsInstance(first, RuntimeError)
+        self.assertEqual(second, 'value')
+
+    async def test_without_redis(self):
+        with patch('address_book.services.cache.get_redis', return_value=None):
+            self.assertEqual(await self.cache.get_or_load('key', self.loader), 'value')
+        self.assertEqual(self.cache.stats()['misses'], 0)
+
+
+class TestEtagMatches(unittest.TestCase):
+
+    def test_matches(self):
+        self.assertTrue(etag_matches('"a"', '"a"'))
+        self.assertTrue(etag_matches('W/"a"', '"a"'))
+        self.assertTrue(etag_matches('"b", "a"', '"a"'))
+        self.assertTrue(etag_matches('*', '"a"'))
+        self.assertFalse(etag_matches('"b"', '"a"'))
+        self.assertFalse(etag_matches(None, '"a"'))
+        self.assertFalse(etag_matches('"a"', None))
+
+
+if __name__ == '__main__':
+    unittest.main()
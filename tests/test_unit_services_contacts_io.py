@@ -0,0 +1,142 @@
+import unittest
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+from address_book.database.models import Base, Contact, User
+from address_book.services.contacts_io import (
+    LineTooLong,
+    iter_lines,
+    iter_csv_records,
+    iter_ndjson_records,
+    validate_contact,
+    import_records,
+    export_csv,
+    export_ndjson
+)
+from address_book.repository.contacts import ROW_ERROR, stream_contacts
+import logging
+logging.basicConfig(level=logging.ERROR)
+
+
+async def chunks(data: bytes, size: int = 7):
+    for i in range(0, len(data), size):
+        yield data[i:i + size]
+
+
+async def collect(iterator):
+    return [item async for item in iterator]
+
+
+class TestContactsIO(unittest.IsolatedAsyncioTestCase):
+
+    async def test_iter_lines_across_chunks(self):
+        lines = await collect(iter_lines(chunks('a,b\nпривіт\nlast'.encode())))
+        self.assertEqual(lines, ['a,b\n', 'привіт\n', 'last'])
+
+    async def test_csv_records(self):
+        data = (b'first_name,last_name,email,phone,birthday\n'
+                b'Anna,"Smith, Jr",anna@example.com,0957800062,1986-03-17\n'
+                b'"Multi\nline",Brown,bob@example.com,0957800062,1986-03-17\n'
+                b'broken,row\n')
+        records = await collect(iter_csv_records(iter_lines(chunks(data))))
+        self.assertEqual(records[0], (2, {'first_name': 'Anna', 'last_name': 'Smith, Jr', 'email': 'anna@example.com',
+                                          'phone': '0957800062', 'birthday': '1986-03-17'}, None))
+        self.assertEqual(records[1][0], 3)
+        self.assertEqual(records[1][1]['first_name'], 'Multi\nline')
+        self.assertEqual(records[2], (5, None, 'Expected 5 columns, got 2'))
+
+    async def test_csv_stray_quote_reports_one_row(self):
+        rows = [f'first{i},last{i},c{i}@example.com,0957800062,1986-03-17\n' for i in range(300)]
+        rows[10] = '"first10,last10,c10@example.com,0957800062,1986-03-17\n'
+        data = ('first_name,last_name,email,phone,birthday\n' + ''.join(rows)).encode()
+        records = await collect(iter_csv_records(iter_lines(chunks(data, size=512)), max_record_lines=20))
+        errors = [(line, error) for line, record, error in records if error is not None]
+        self.assertEqual(errors, [(12, 'Unterminated quoted field')])
+        self.assertEqual([record['first_name'] for _, record, _ in records if record is not None],
+                         [f'first{i}' for i in range(300) if i != 10])
+        self.assertEqual(records[-1][0], 301)
+
+    async def test_csv_stray_quote_at_end_and_long_lines(self):
+        data = (b'first_name,last_name\n'
+                b'Anna,Smith\n'
+                b'' + b'x' * 100 + b'\n'
+                b'"Bob,Brown\n'
+                b'Carl,White\n')
+        records = await collect(iter_csv_records(iter_lines(chunks(data), max_line_length=50)))
+        self.assertEqual(records, [(2, {'first_name': 'Anna', 'last_name': 'Smith'}, None),
+                                   (3, None, 'Line too long'),
+                                   (4, None, 'Unterminated quoted field'),
+                                   (5, {'first_name': 'Carl', 'last_name': 'White'}, None)])
+        lines = await collect(iter_lines(chunks(b'ab\n' + b'x' * 60), max_line_length=50))
+        self.assertEqual(lines, ['ab\n', ''])
+        self.assertIsInstance(lines[1], LineTooLong)
+
+    async def test_ndjson_records(self):
+        data = b'{"first_name": "Anna"}\n\nnot json\n[1]\n'
+        records = await collect(iter_ndjson_records(iter_lines(chunks(data))))
+        self.assertEqual(records[0], (1, {'first_name': 'Anna'}, None))
+        self.assertEqual(records[1][0], 3)
+        self.assertTrue(records[1][2].startswith('Invalid JSON'))
+        self.assertEqual(records[2], (4, None, 'Expected a JSON object'))
+
+    def test_validate_contact(self):
+        body, error = validate_contact({'first_name': 'Anna'})
+        self.assertIsNone(body)
+        self.assertIn('last_name: Field required', error)
+
+
+class TestImportRecords(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        engine = create_engine("sqlite://")
+        Base.metadata.create_all(bind=engine)
+        self.session = sessionmaker(bind=engine, autoflush=False)()
+        self.user = User(id=1, username='username', email='email@example.com', password='password')
+        self.session.add(self.user)
+        self.session.commit()
+
+    def tearDown(self):
+        self.session.close()
+
+    async def test_import_with_duplicates_and_errors(self):
+        data = ''.join(f'{{"first_name": "first{i % 4}", "last_name": "last", "email": "e@example.com", '
+                       f'"phone": "0957800062", "birthday": "1986-03-{i + 10}"}}\n' for i in range(6))
+        data += '{"first_name": "bad"}\n'
+        records = iter_ndjson_records(iter_lines(chunks(data.encode(), size=64)))
+        report = await import_records(self.user, records, self.session, batch_size=3, max_errors=2)
+        self.assertEqual(report.inserted, 4)
+        self.assertEqual(report.failed, 3)
+        self.assertEqual([(e.line, e.error) for e in report.errors],
+                         [(5, 'Contact already exists'), (6, 'Contact already exists')])
+        contact = self.session.query(Contact).filter(Contact.first_name == 'first1').one()
+        self.assertEqual(contact.birthday_md, 311)
+
+    async def test_import_hides_driver_errors(self):
+        self.session.execute(text("CREATE TRIGGER no_mallory BEFORE INSERT ON contacts WHEN new.first_name = 'mallory' "
+                                  "BEGIN SELECT RAISE(ABORT, 'trigger no_mallory on contacts'); END"))
+        self.session.commit()
+        data = ''.join(f'{{"first_name": "{name}", "last_name": "last", "email": "e@example.com", '
+                       f'"phone": "0957800062", "birthday": "1986-03-17"}}\n' for name in ('anna', 'mallory', 'bob'))
+        records = iter_ndjson_records(iter_lines(chunks(data.encode())))
+        with self.assertLogs('address_book.repository.contacts', level='WARNING') as logs:
+            report = await import_records(self.user, records, self.session)
+        self.assertEqual((report.inserted, report.failed), (2, 1))
+        self.assertEqual([(e.line, e.error) for e in report.errors], [(2, ROW_ERROR)])
+        self.assertIn('trigger no_mallory on contacts', logs.output[0])
+
+    async def test_export_round_trip(self):
+        data = ''.join(f'{{"first_name": "first{i}", "last_name": "last, \\"quoted\\"", "email": "e@example.com", '
+                       f'"phone": "0957800062", "birthday": "1986-03-{i + 10}"}}\n' for i in range(5))
+        await import_records(self.user, iter_ndjson_records(iter_lines(chunks(data.encode()))), self.session)
+
+        exported = ''.join(await collect(export_csv(stream_contacts(self.user, self.session, batch_size=2))))
+        self.assertEqual(exported.count('\n'), 6)
+        records = await collect(iter_csv_records(iter_lines(chunks(exported.encode()))))
+        self.assertEqual(records[4][1], {'first_name': 'first4', 'last_name': 'last, "quoted"', 'email': 'e@example.com',
+                                         'phone': '0957800062', 'birthday': '1986-03-14'})
+
+        exported = ''.join(await collect(export_ndjson(stream_contacts(self.user, self.session, batch_size=2))))
+        self.assertEqual(exported, data)
+
+
+if __name__ == '__main__':
+    unittest.main()
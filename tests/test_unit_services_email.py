@@ -1,11 +1,20 @@
+import asyncio
+import socket
 import unittest
-from unittest.mock import MagicMock
+from email.message import EmailMessage
+from unittest.mock import AsyncMock, MagicMock, patch
 from address_book.services.email import send_email
+from address_book.services.mailer import EmailDispatcher
 from address_book.conf.config import settings
 
 from fastapi import BackgroundTasks, Request
 import logging
-logging.basicConfig(level=logging.ERROR)
+logging.basicConfig(level=logging.CRITICAL)
+
+try:
+    from aiosmtpd.controller import Controller
+except ImportError:  # pragma: no cover
+    Controller = None
 
 
 class TestServicesEmail(unittest.IsolatedAsyncioTestCase):
@@ -16,6 +25,136 @@ class TestServicesEmail(unittest.IsolatedAsyncioTestCase):
         self.assertIsNone(background_tasks.add_task(send_email, settings.MAIL_USERNAME, settings.MAIL_USERNAME,
                                                     request.base_url))
 
+    async def test_send_email_queues_rendered_message(self):
+        with patch('address_book.services.email.email_dispatcher.send', new_callable=AsyncMock) as mock_send:
+            await send_email('user@example.com', 'username', 'http://testserver/')
+        message = mock_send.await_args.args[0]
+        self.assertEqual(message['To'], 'user@example.com')
+        self.assertIn('http://testserver/', message.get_content())
+        self.assertEqual(message.get_content_subtype(), 'html')
+
+
+class RecordingHandler:
+
+    def __init__(self, replies=()):
+        self.replies = list(replies)
+        self.messages = []
+        self.sessions = set()
+
+    async def handle_DATA(self, server, session, envelope):
+        self.sessions.add(id(session))
+        if self.replies:
+            return self.replies.pop(0)
+        self.messages.append(envelope)
+        return '250 OK'
+
+
+class TestEmailDispatcherShutdown(unittest.IsolatedAsyncioTestCase):
+
+    def dispatcher(self, **kwargs):
+        dispatcher = EmailDispatcher(hostname='127.0.0.1', port=1, **kwargs)
+        self.addAsyncCleanup(dispatcher.stop, False)
+        return dispatcher
+
+    async def test_worker_survives_unexpected_errors(self):
+        dispatcher = self.dispatcher(connections=1)
+        delivered = []
+
+        async def deliver(client, message):
+            if message['To'] == 'broken@example.com':
+                raise UnicodeEncodeError('ascii', '', 0, 1, 'boom')
+            delivered.append(message['To'])
+
+        with patch.object(dispatcher, '_deliver', side_effect=deliver):
+            for to in ('broken@example.com', 'user@example.com'):
+                message = EmailMessage()
+                message['To'] = to
+                await dispatcher.send(message)
+            await dispatcher.stop()
+
+        self.assertEqual(delivered, ['user@example.com'])
+        self.assertEqual(dispatcher.failed, 1)
+        self.assertFalse(dispatcher.running)
+
+    async def test_stop_gives_up_draining_after_timeout(self):
+        dispatcher = self.dispatcher(connections=1, drain_timeout=0.05)
+
+        async def deliver(client, message):
+            await asyncio.sleep(3600)
+
+        with patch.object(dispatcher, '_deliver', side_effect=deliver):
+            for _ in range(3):
+                await dispatcher.send(EmailMessage())
+            await asyncio.wait_for(dispatcher.stop(), 1)
+        self.assertFalse(dispatcher.running)
+
+
+@unittest.skipIf(Controller is None, "aiosmtpd is not installed")
+class TestEmailDispatcher(unittest.IsolatedAsyncioTestCase):
+
+    def start_server(self, handler):
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            port = sock.getsockname()[1]
+        controller = Controller(handler, hostname='127.0.0.1', port=port)
+        controller.start()
+        self.addCleanup(controller.stop)
+        return controller
+
+    def dispatcher(self, controller, **kwargs):
+        dispatcher = EmailDispatcher(hostname='127.0.0.1', port=controller.port,
+                                     backoff=0.01, **kwargs)
+        self.addAsyncCleanup(dispatcher.stop, False)
+        return dispatcher
+
+    @staticmethod
+    def message(i: int) -> EmailMessage:
+        message = EmailMessage()
+        message['From'] = 'sender@example.com'
+        message['To'] = f'user{i}@example.com'
+        message['Subject'] = 'Confirm your email'
+        message.set_content('body')
+        return message
+
+    async def test_batches_reuse_one_connection(self):
+        handler = RecordingHandler()
+        dispatcher = self.dispatcher(self.start_server(handler), connections=1, batch_size=5)
+        for i in range(12):
+            self.assertTrue(await dispatcher.send(self.message(i)))
+        await dispatcher.stop()
+
+        self.assertEqual(len(handler.messages), 12)
+        self.assertEqual(len(handler.sessions), 1)
+        stats = dispatcher.stats()
+        self.assertEqual((stats['sent'], stats['failed'], stats['connects']), (12, 0, 1))
+        self.assertGreaterEqual(stats['batches'], 3)
+        self.assertEqual(stats['send_time_seconds']['count'], 12)
+
+    async def test_retries_temporary_failures(self):
+        handler = RecordingHandler(replies=['451 Try again later'])
+        dispatcher = self.dispatcher(self.start_server(handler), connections=1)
+        await dispatcher.send(self.message(0))
+        await dispatcher.stop()
+
+        self.assertEqual(len(handler.messages), 1)
+        self.assertEqual((dispatcher.sent, dispatcher.retried, dispatcher.failed), (1, 1, 0))
+
+    async def test_permanent_failure_is_not_retried(self):
+        handler = RecordingHandler(replies=['550 No such user'])
+        dispatcher = self.dispatcher(self.start_server(handler), connections=1)
+        await dispatcher.send(self.message(0))
+        await dispatcher.send(self.message(1))
+        await dispatcher.stop()
+
+        self.assertEqual([envelope.rcpt_tos for envelope in handler.messages], [['user1@example.com']])
+        self.assertEqual((dispatcher.sent, dispatcher.retried, dispatcher.failed), (1, 0, 1))
+
+    async def test_full_queue_drops_messages(self):
+        dispatcher = self.dispatcher(self.start_server(RecordingHandler()), connections=1, max_queue=1)
+        self.assertTrue(await dispatcher.send(self.message(0)))
+        self.assertFalse(await dispatcher.send(self.message(1)))
+        self.assertEqual(dispatcher.dropped, 1)
+
 
 if __name__ == '__main__':
-    unittest.main()
\ No newline at end of file
+    unittest.main()
@@ -0,0 +1,134 @@
+import unittest
+from fastapi import FastAPI
+from fastapi.routing import APIRoute
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+from sqlalchemy.ext.asyncio import create_async_engine
+from address_book.database.db import instrument_engine
+from address_book.routes.metrics import metrics
+from address_book.services.metrics import Gauge, Histogram, MetricFamily, Registry
+from address_book.services.request_metrics import (MetricsMiddleware, QueryStats, current_queries,
+                                                   db_queries_per_request, http_request_duration, route_template)
+import logging
+logging.basicConfig(level=logging.ERROR)
+
+
+class TestMetricFamily(unittest.TestCase):
+
+    def test_render_histogram(self):
+        family = MetricFamily("request_seconds", "Request time.", "histogram", ("route",), buckets=(0.1, 1))
+        family.labels('/a"b').observe(0.05)
+        family.labels('/a"b').observe(2)
+        self.assertEqual(family.render(), [
+            '# HELP request_seconds Request time.',
+            '# TYPE request_seconds histogram',
+            'request_seconds_bucket{route="/a\\"b",le="0.1"} 1',
+            'request_seconds_bucket{route="/a\\"b",le="1"} 1',
+            'request_seconds_bucket{route="/a\\"b",le="+Inf"} 2',
+            'request_seconds_sum{route="/a\\"b"} 2.05',
+            'request_seconds_count{route="/a\\"b"} 2',
+        ])
+
+    def test_render_gauge_and_collector(self):
+        registry = Registry()
+        family = registry.register(MetricFamily("in_flight", "Requests.", "gauge"))
+        registry.add_collector(lambda: family.labels().set(3))
+        self.assertIn('in_flight 3\n', registry.render())
+        self.assertIsInstance(family.labels(), Gauge)
+
+    def test_wrong_labels(self):
+        family = MetricFamily("request_seconds", "Request time.", "histogram", ("route",))
+        self.assertIsInstance(family.labels('/'), Histogram)
+        with self.assertRaises(ValueError):
+            family.labels('/', 'GET')
+
+
+class TestQueryAccounting(unittest.IsolatedAsyncioTestCase):
+
+    def test_sync_engine(self):
+        engine = create_engine("sqlite://")
+        instrument_engine(engine)
+        self.addCleanup(engine.dispose)
+        stats = QueryStats()
+        token = current_queries.set(stats)
+        try:
+            with engine.connect() as conn:
+                conn.execute(text("SELECT 1"))
+                conn.execute(text("SELECT 2"))
+        finally:
+            current_queries.reset(token)
+        self.assertEqual(stats.count, 2)
+        self.assertGreater(stats.seconds, 0)
+
+        # Queries outside of a request are not accounted to anyone
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+        self.assertEqual(stats.count, 2)
+
+    async def test_async_engine(self):
+        engine = create_async_engine("sqlite+aiosqlite://")
+        instrument_engine(engine.sync_engine)
+        stats = QueryStats()
+        token = current_queries.set(stats)
+        try:
+            async with engine.connect() as conn:
+                await conn.execute(text("SELECT 1"))
+        finally:
+            current_queries.reset(token)
+            await engine.dispose()
+        self.assertEqual(stats.count, 1)
+
+
+class TestMetricsMiddleware(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.engine = create_engine("sqlite://")
+        instrument_engine(self.engine)
+        self.addCleanup(self.engine.dispose)
+        app = FastAPI()
+
+        @app.get('/metrics_test/{item_id}')
+        async def item(item_id: int):
+            with self.engine.connect() as conn:
+                for _ in range(3):
+                    conn.execute(text("SELECT 1"))
+            return {"id": item_id}
+
+        app.add_middleware(MetricsMiddleware)
+        self.client = TestClient(app)
+
+    async def test_route_latency_and_queries(self):
+        self.assertEqual(self.client.get('/metrics_test/1').status_code, 200)
+        self.assertEqual(self.client.get('/metrics_test/2').status_code, 200)
+        self.assertEqual(self.client.get('/metrics_test/x').status_code, 422)
+        self.assertEqual(self.client.get('/missing').status_code, 404)
+
+        self.assertEqual(http_request_duration.labels('GET', '/metrics_test/{item_id}', '200').count, 2)
+        self.assertEqual(http_request_duration.labels('GET', '/metrics_test/{item_id}', '422').count, 1)
+        self.assertGreaterEqual(http_request_duration.labels('GET', 'unmatched', '404').count, 1)
+        queries = db_queries_per_request.labels('GET', '/metrics_test/{item_id}')
+        self.assertEqual(queries.sum, 6)
+
+        body = (await metrics()).body.decode()
+        self.assertIn('http_request_duration_seconds_count{method="GET",route="/metrics_test/{item_id}",'
+                      'status="200"} 2', body)
+        self.assertIn('http_requests_in_flight 0', body)
+        self.assertIn('# TYPE http_request_db_queries histogram', body)
+
+    def test_route_template_from_path_format(self):
+        route = APIRoute('/contacts/get/{contact_id}', lambda contact_id: None)
+        self.assertEqual(route_template({'route': route, 'path': '/contacts/get/1'}), '/contacts/get/{contact_id}')
+        self.assertEqual(route_template({'route': route, 'path': '/api/contacts/get/1'}),
+                         '/api/contacts/get/{contact_id}')
+        self.assertEqual(route_template({'path': '/missing'}), 'unmatched')
+
+    async def test_included_router_label_has_full_path(self):
+        from main import app
+        client = TestClient(app)
+        self.assertEqual(client.get('/api/contacts/get/1').status_code, 401)
+        self.assertEqual(http_request_duration.labels('GET', '/api/contacts/get/{contact_id}', '401').count, 1)
+        self.assertEqual(http_request_duration.labels('GET', '/contacts/get/{contact_id}', '401').count, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,239 @@
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from redis.asyncio import Redis
+from redis.asyncio.retry import Retry
+from redis.backoff import NoBackoff
+from redis.exceptions import ConnectionError, ResponseError, TimeoutError
+try:
+    from fakeredis import FakeAsyncRedis
+except ImportError:  # pragma: no cover
+    FakeAsyncRedis = None
+from address_book.conf.config import settings
+from address_book.services.auth import auth_service
+from address_book.services.ratelimit import LocalBuckets, RateLimiter, RateLimitMiddleware, RatePolicy
+import logging
+logging.basicConfig(level=logging.ERROR)
+
+
+def http_scope(path='/api/contacts/', method='GET', headers=(), client=('10.0.0.1', 5000)):
+    return {"type": "http", "path": path, "method": method, "headers": list(headers), "client": client}
+
+
+class TestRatePolicy(unittest.TestCase):
+
+    def test_parse(self):
+        policy = RatePolicy.parse('2/5')
+        self.assertEqual(policy.times, 2)
+        self.assertEqual(policy.seconds, 5)
+        self.assertAlmostEqual(policy.rate, 0.4)
+
+    def test_parse_invalid(self):
+        for value in ('2', 'a/5', '0/5', '2/0'):
+            with self.assertRaises(ValueError):
+                RatePolicy.parse(value)
+
+
+class TestLocalBuckets(unittest.TestCase):
+
+    def test_burst_then_refill(self):
+        buckets = LocalBuckets()
+        keys = [('key', RatePolicy(2, 10))]
+        with patch('address_book.services.ratelimit.time.monotonic', return_value=100):
+            self.assertEqual(buckets.acquire(keys), 0)
+            self.assertEqual(buckets.acquire(keys), 0)
+            self.assertAlmostEqual(buckets.acquire(keys), 5)
+        with patch('address_book.services.ratelimit.time.monotonic', return_value=105):
+            self.assertEqual(buckets.acquire(keys), 0)
+            self.assertGreater(buckets.acquire(keys), 0)
+
+    def test_all_buckets_charged_together(self):
+        buckets = LocalBuckets()
+        client = ('client', RatePolicy(10, 10))
+        route = ('route', RatePolicy(1, 10))
+        with patch('address_book.services.ratelimit.time.monotonic', return_value=100):
+            self.assertEqual(buckets.acquire([client, route]), 0)
+            self.assertGreater(buckets.acquire([client, route]), 0)
+            # The rejected request did not use a token of the client bucket
+            for _ in range(9):
+                self.assertEqual(buckets.acquire([client]), 0)
+            self.assertGreater(buckets.acquire([client]), 0)
+
+    def test_block(self):
+        buckets = LocalBuckets()
+        keys = [('key', RatePolicy(100, 1))]
+        with patch('address_book.services.ratelimit.time.monotonic', return_value=100):
+            buckets.block(keys, 2)
+            self.assertAlmostEqual(buckets.acquire(keys), 2)
+
+
+class TestRateLimiter(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.limiter = RateLimiter(user_policy=RatePolicy(5, 60), ip_policy=RatePolicy(2, 60),
+                                   route_policies={'POST /api/contacts/create': RatePolicy(1, 5)}, exempt=('/docs',))
+        auth_service.token_cache.clear()
+
+    def test_keys_anonymous(self):
+        keys = self.limiter.keys(http_scope())
+        self.assertEqual(keys, [('ratelimit:{ip:10.0.0.1}', self.limiter.ip_policy)])
+
+    async def test_keys_user_and_route(self):
+        token = await auth_service.create_access_token(data={"sub": "user@example.com"})
+        scope = http_scope('/api/contacts/create', 'POST', [(b'authorization', f'Bearer {token}'.encode())])
+        keys = self.limiter.keys(scope)
+        self.assertEqual([key for key, _ in keys],
+                         ['ratelimit:{user:user@example.com}',
+                          'ratelimit:{user:user@example.com}:POST /api/contacts/create'])
+        self.assertIs(keys[0][1], self.limiter.user_policy)
+
+    def test_keys_invalid_token_limits_ip(self):
+        scope = http_scope(headers=[(b'authorization', b'Bearer invalid')])
+        self.assertEqual(self.limiter.keys(scope)[0][0], 'ratelimit:{ip:10.0.0.1}')
+
+    def test_keys_forwarded_for(self):
+        scope = http_scope(headers=[(b'x-forwarded-for', b'203.0.113.7, 10.0.0.2')])
+        self.assertEqual(self.limiter.keys(scope)[0][0], 'ratelimit:{ip:10.0.0.1}')
+        self.limiter.trust_forwarded = True
+        self.assertEqual(self.limiter.keys(scope)[0][0], 'ratelimit:{ip:203.0.113.7}')
+
+    def test_keys_exempt(self):
+        self.assertEqual(self.limiter.keys(http_scope('/docs')), [])
+
+    async def test_without_redis(self):
+        keys = self.limiter.keys(http_scope())
+        with patch('address_book.services.ratelimit.get_redis', return_value=None):
+            self.assertEqual(await self.limiter.acquire(keys), 0)
+            self.assertEqual(await self.limiter.acquire(keys), 0)
+            self.assertGreater(await self.limiter.acquire(keys), 0)
+        self.assertEqual(self.limiter.stats()['allowed'], 2)
+        self.assertEqual(self.limiter.stats()['rejected'], 1)
+
+    async def test_redis_rejection_is_remembered_locally(self):
+        script = AsyncMock(return_value=[0, '3.5'])
+        redis = MagicMock()
+        redis.register_script.return_value = script
+        keys = self.limiter.keys(http_scope())
+        with patch('address_book.services.ratelimit.get_redis', return_value=redis):
+            self.assertAlmostEqual(await self.limiter.acquire(keys), 3.5)
+            self.assertGreater(await self.limiter.acquire(keys), 3)
+        script.assert_awaited_once()
+        self.assertEqual(script.call_args.kwargs['keys'], ['ratelimit:{ip:10.0.0.1}'])
+        self.assertEqual(script.call_args.kwargs['args'], [2 / 60, 2])
+        self.assertEqual(self.limiter.stats()['rejected_locally'], 1)
+
+    async def test_redis_rejection_refunds_local_token(self):
+        script = AsyncMock(side_effect=[[0, '1'], [1, '0'], [1, '0']])
+        redis = MagicMock()
+        redis.register_script.return_value = script
+        keys = self.limiter.keys(http_scope())
+        with patch('address_book.services.ratelimit.get_redis', return_value=redis):
+            with patch('address_book.services.ratelimit.time.monotonic', return_value=100):
+                self.assertAlmostEqual(await self.limiter.acquire(keys), 1)
+            # Redis admits both requests of the policy once the rejection expired, so does the local bucket
+            with patch('address_book.services.ratelimit.time.monotonic', return_value=102):
+                self.assertEqual(await self.limiter.acquire(keys), 0)
+                self.assertEqual(await self.limiter.acquire(keys), 0)
+        self.assertEqual(script.await_count, 3)
+        self.assertEqual(self.limiter.stats()['rejected_locally'], 0)
+
+    async def test_redis_error_uses_local_buckets(self):
+        redis = MagicMock()
+        redis.register_script.return_value = AsyncMock(side_effect=ConnectionError)
+        keys = self.limiter.keys(http_scope())
+        with patch('address_book.services.ratelimit.get_redis', return_value=redis):
+            self.assertEqual(await self.limiter.acquire(keys), 0)
+            self.assertEqual(await self.limiter.acquire(keys), 0)
+            self.assertGreater(await self.limiter.acquire(keys), 0)
+        self.assertEqual(self.limiter.stats()['errors'], 2)
+
+
+class TokenBucketScriptTests:
+    """
+        TOKEN_BUCKET_SCRIPT run by a redis from make_redis(), which skips the tests when it cannot run Lua.
+    """
+
+    async def make_redis(self):
+        raise NotImplementedError
+
+    async def asyncSetUp(self):
+        self.redis = await self.make_redis()
+        self.limiter = RateLimiter(user_policy=RatePolicy(5, 60), ip_policy=RatePolicy(2, 60),
+                                   route_policies={'POST /api/contacts/create': RatePolicy(1, 5)},
+                                   local_precheck=False)
+        patcher = patch('address_book.services.ratelimit.get_redis', return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def test_bucket(self):
+        keys = self.limiter.keys(http_scope())
+        self.assertEqual(await self.limiter.acquire(keys), 0)
+        self.assertEqual(await self.limiter.acquire(keys), 0)
+        self.assertGreater(await self.limiter.acquire(keys), 0)
+        self.assertGreater(await self.redis.pttl('ratelimit:{ip:10.0.0.1}'), 0)
+
+    async def test_route_bucket(self):
+        keys = self.limiter.keys(http_scope('/api/contacts/create', 'POST'))
+        self.assertEqual(await self.limiter.acquire(keys), 0)
+        self.assertGreater(await self.limiter.acquire(keys), 0)
+        # The rejected request was not charged to the client bucket
+        self.assertEqual(await self.limiter.acquire(self.limiter.keys(http_scope())), 0)
+
+
+@unittest.skipIf(FakeAsyncRedis is None, "fakeredis is not installed")
+class TestTokenBucketScriptFakeRedis(TokenBucketScriptTests, unittest.IsolatedAsyncioTestCase):
+
+    async def make_redis(self):
+        redis = FakeAsyncRedis(decode_responses=True)
+        try:
+            await redis.eval('return 1', 0)
+        except ResponseError:
+            self.skipTest("fakeredis is installed without Lua support (lupa)")
+        return redis
+
+
+class TestTokenBucketScriptRedis(TokenBucketScriptTests, unittest.IsolatedAsyncioTestCase):
+
+    async def make_redis(self):
+        # The redis of docker-compose.yml, a database of its own keeps the test keys apart
+        redis = Redis(host=settings.REDIS_HOST, port=settings.REDIS_PORT, db=15, decode_responses=True,
+                      socket_connect_timeout=0.5, retry=Retry(NoBackoff(), 0))
+        self.addAsyncCleanup(redis.aclose)
+        try:
+            await redis.ping()
+        except (ConnectionError, TimeoutError, OSError):
+            self.skipTest(f"no redis server at {settings.REDIS_HOST}:{settings.REDIS_PORT}")
+        await redis.flushdb()
+        self.addAsyncCleanup(redis.flushdb)
+        return redis
+
+
+class TestRateLimitMiddleware(unittest.TestCase):
+
+    def setUp(self):
+        app = FastAPI()
+
+        @app.get('/items')
+        async def items():
+            return {"ok": True}
+
+        limiter = RateLimiter(user_policy=RatePolicy(5, 60), ip_policy=RatePolicy(1, 60))
+        app.add_middleware(RateLimitMiddleware, limiter=limiter)
+        self.client = TestClient(app)
+        patcher = patch('address_book.services.ratelimit.get_redis', return_value=None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_too_many_requests(self):
+        self.assertEqual(self.client.get('/items').status_code, 200)
+        response = self.client.get('/items')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.json(), {"detail": "Too Many Requests"})
+        self.assertEqual(response.headers['Retry-After'], '60')
+        # CORS preflight requests are never limited
+        self.assertNotEqual(self.client.options('/items').status_code, 429)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+import asyncio
+import unittest
+from unittest.mock import patch
+from redis.exceptions import ConnectionError
+try:
+    from fakeredis import FakeAsyncRedis
+except ImportError:  # pragma: no cover
+    FakeAsyncRedis = None
+from address_book.services.sessions import RefreshSessionStore, Rotation
+import logging
+logging.basicConfig(level=logging.ERROR)
+
+
+class SessionStoreTests:
+    redis = None
+
+    def setUp(self):
+        self.store = RefreshSessionStore(ttl=60, prefix='test_session:')
+        patcher = patch('address_book.services.sessions.get_redis', return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def test_rotate(self):
+        sid = await self.store.create('user@example.com', 'jti1', 'firefox')
+        self.assertEqual(await self.store.rotate('user@example.com', sid, 'jti1', 'jti2'), Rotation.ROTATED)
+        self.assertEqual(await self.store.rotate('user@example.com', sid, 'jti2', 'jti3'), Rotation.ROTATED)
+
+    async def test_reuse_revokes_session(self):
+        sid = await self.store.create('user@example.com', 'jti1')
+        await self.store.rotate('user@example.com', sid, 'jti1', 'jti2')
+        self.assertEqual(await self.store.rotate('user@example.com', sid, 'jti1', 'jti3'), Rotation.REUSED)
+        # The legitimate holder of jti2 is logged out as well
+        self.assertEqual(await self.store.rotate('user@example.com', sid, 'jti2', 'jti4'), Rotation.MISSING)
+        self.assertEqual(self.store.stats()['reused'], 1)
+
+    async def test_session_of_another_user(self):
+        sid = await self.store.create('user@example.com', 'jti1')
+        self.assertEqual(await self.store.rotate('other@example.com', sid, 'jti1', 'jti2'), Rotation.MISSING)
+        self.assertFalse(await self.store.revoke('other@example.com', sid))
+        self.assertEqual(await self.store.rotate('user@example.com', sid, 'jti1', 'jti2'), Rotation.ROTATED)
+
+    async def test_sessions_per_device(self):
+        phone = await self.store.create('user@example.com', 'jti1', 'phone')
+        laptop = await self.store.create('user@example.com', 'jti2', 'laptop')
+        await self.store.create('other@example.com', 'jti3', 'tablet')
+        sessions = await self.store.list('user@example.com')
+        self.assertEqual({session['sid'] for session in sessions}, {phone, laptop})
+        self.assertEqual({session['device'] for session in sessions}, {'phone', 'laptop'})
+
+        self.assertTrue(await self.store.revoke('user@example.com', phone))
+        self.assertEqual(await self.store.rotate('user@example.com', phone, 'jti1', 'jti4'), Rotation.MISSING)
+        self.assertEqual(await self.store.rotate('user@example.com', laptop, 'jti2', 'jti5'), Rotation.ROTATED)
+
+    async def test_revoke_all(self):
+        sids = [await self.store.create('user@example.com', f'jti{i}') for i in range(3)]
+        other = await self.store.create('other@example.com', 'jti')
+        self.assertEqual(await self.store.revoke_all('user@example.com'), 3)
+        self.assertEqual(await self.store.list('user@example.com'), [])
+        for i, sid in enumerate(sids):
+            self.assertEqual(await self.store.rotate('user@example.com', sid, f'jti{i}', 'new'), Rotation.MISSING)
+        self.assertEqual(len(await self.store.list('other@example.com')), 1)
+        self.assertEqual(await self.store.rotate('other@example.com', other, 'jti', 'new'), Rotation.ROTATED)
+
+
+class TestMemorySessionStore(SessionStoreTests, unittest.IsolatedAsyncioTestCase):
+
+    async def test_expired_session(self):
+        store = RefreshSessionStore(ttl=0.01)
+        with patch('address_book.services.sessions.get_redis', return_value=None):
+            sid = await store.create('user@example.com', 'jti1')
+            await asyncio.sleep(0.02)
+            self.assertEqual(await store.rotate('user@example.com', sid, 'jti1', 'jti2'), Rotation.MISSING)
+            self.assertEqual(await store.list('user@example.com'), [])
+
+
+@unittest.skipIf(FakeAsyncRedis is None, "fakeredis is not installed")
+class TestRedisSessionStore(SessionStoreTests, unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.redis = FakeAsyncRedis(decode_responses=True)
+        super().setUp()
+
+    async def test_session_expires_with_token(self):
+        sid = await self.store.create('user@example.com', 'jti1')
+        self.assertLessEqual(await self.redis.ttl('test_session:' + sid), 60)
+        self.assertGreater(await self.redis.ttl('test_session:' + sid), 0)
+        self.assertEqual(len(self.store.local), 0)
+
+    async def test_concurrent_refresh_with_one_token(self):
+        sid = await self.store.create('user@example.com', 'jti1')
+        results = await asyncio.gather(*(self.store.rotate('user@example.com', sid, 'jti1', f'new{i}')
+                                         for i in range(5)))
+        self.assertEqual(results.count(Rotation.ROTATED), 1)
+        self.assertEqual(results.count(Rotation.REUSED) + results.count(Rotation.MISSING), 4)
+
+    async def test_falls_back_to_memory_on_redis_error(self):
+        with patch.object(self.redis, 'pipeline', side_effect=ConnectionError):
+            sid = await self.store.create('user@example.com', 'jti1')
+            self.assertEqual(len(self.store.local), 1)
+            self.assertEqual(await self.store.rotate('user@example.com', sid, 'jti1', 'jti2'), Rotation.ROTATED)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,40 @@
+import asyncio
+import threading
+import unittest
+from address_book.services.workers import BoundedExecutor, PoolSaturated
+import logging
+logging.basicConfig(level=logging.ERROR)
+
+
+class TestBoundedExecutor(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.pool = BoundedExecutor(workers=1, max_queue=1)
+        self.addCleanup(self.pool.shutdown)
+
+    async def test_run(self):
+        result = await self.pool.run(pow, 2, 10)
+        self.assertEqual(result, 1024)
+        stats = self.pool.stats()
+        self.assertEqual(stats['completed'], 1)
+        self.assertEqual(stats['in_flight'], 0)
+        self.assertEqual(stats['wait_time_seconds']['count'], 1)
+
+    async def test_saturated(self):
+        release = threading.Event()
+        running = [asyncio.ensure_future(self.pool.run(release.wait)) for _ in range(2)]
+        await asyncio.sleep(0)
+        self.assertEqual(self.pool.queue_depth, 1)
+        with self.assertRaises(PoolSaturated):
+            await self.pool.run(pow, 2, 10)
+        release.set()
+        await asyncio.gather(*running)
+        self.assertEqual(self.pool.stats()['rejected'], 1)
+
+    def test_unknown_kind(self):
+        with self.assertRaises(ValueError):
+            BoundedExecutor(kind='fiber')
+
+
+if __name__ == '__main__':
+    unittest.main()